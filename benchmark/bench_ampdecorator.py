@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# bench_ampdecorator.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Measure the throughput of the AmpDecorator.
+
+The :class:`libmushu.driver.benchamp.BenchAmp` produces blocks without
+pacing, so the measured rate is the maximal rate at which the decorator
+can process the data, with and without writing to disk and merging
+markers.
+
+"""
+
+
+from __future__ import division, print_function
+
+import os
+import shutil
+import tempfile
+import time
+
+from libmushu.ampdecorator import AmpDecorator
+from libmushu.driver.benchamp import BenchAmp
+
+
+def run(fs, channels, blocksize, marker_rate=0, write=False, duration=2):
+    amp = AmpDecorator(BenchAmp)
+    amp.configure(fs=fs, channels=channels, blocksize=blocksize,
+                  marker_rate=marker_rate, realtime=False)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        amp.start(os.path.join(tmpdir, 'bench') if write else None)
+        samples = 0
+        t_start = time.time()
+        while time.time() - t_start < duration:
+            samples += len(amp.get_data()[0])
+        elapsed = time.time() - t_start
+        amp.stop()
+    finally:
+        shutil.rmtree(tmpdir)
+    return samples / elapsed
+
+
+def main(fs=20000, channels=512, blocksize=200):
+    print('%d Hz, %d channels, blocks of %d samples' % (fs, channels, blocksize))
+    print('                        samples/s   times real time')
+    for name, kwargs in [('get_data', {}),
+                         ('get_data, 1000 markers/s', {'marker_rate': 1000}),
+                         ('write to disk', {'write': True}),
+                         ('write to disk, markers', {'write': True, 'marker_rate': 1000})]:
+        rate = run(fs, channels, blocksize, **kwargs)
+        print('%-24s %9.0f   %8.1f' % (name, rate, rate / fs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# bench_emotiv.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Compare the throughput of the Emotiv packet decoding.
+
+The vectorized decoding of batches of packets is compared with the
+former per packet decoding via Python integers.
+
+"""
+
+
+from __future__ import division, print_function
+
+import time
+
+import numpy as np
+
+from libmushu.driver.emotiv import parse_packets
+
+
+def parse_packet_bigint(packet, battery, quality):
+    """The former per packet decoding."""
+    raw = 0
+    for byte in packet:
+        raw = (raw << 8) + int(byte)
+    data = []
+    shift = 248
+    tmp = (raw >> shift) & 0b11111111
+    if tmp & 0b10000000:
+        counter = 128
+        battery = tmp & 0b01111111
+    else:
+        counter = tmp & 0b01111111
+    data.append(counter)
+    data.append(battery)
+    for i in range(7):
+        shift -= 14
+        data.append((raw >> shift) & 0b11111111111111)
+    shift -= 14
+    tmp = (raw >> shift) & 0b11111111111111
+    if counter < 128 and counter % 64 < 14:
+        quality[counter % 64] = tmp
+    shift -= 14
+    for i in range(7):
+        shift -= 14
+        data.append((raw >> shift) & 0b11111111111111)
+    for i in range(2):
+        shift -= 8
+        tmp = ((raw >> shift) & 0b01111111) - 100
+        if (raw >> shift) & 0b10000000:
+            tmp *= -1
+        data.append(tmp)
+    data.extend(quality)
+    return data, battery
+
+
+def main(n_packets=128 * 60, batch=128):
+    rng = np.random.RandomState(0)
+    packets = rng.randint(0, 256, (n_packets, 32)).astype(np.uint8)
+
+    t = time.time()
+    battery, quality = 0, [0] * 14
+    expected = []
+    for packet in packets:
+        data, battery = parse_packet_bigint(packet, battery, quality)
+        expected.append(data)
+    t_bigint = time.time() - t
+
+    t = time.time()
+    battery, quality = 0, [0] * 14
+    result = []
+    for i in range(0, n_packets, batch):
+        data, battery, quality = parse_packets(packets[i:i+batch], battery, quality)
+        result.append(data)
+    t_vectorized = time.time() - t
+
+    assert (np.concatenate(result) == np.array(expected)).all()
+    print('%d packets (%.0f s of data at 128 Hz)' % (n_packets, n_packets / 128))
+    print('per packet, Python ints:  %8.0f packets/s' % (n_packets / t_bigint))
+    print('batches of %3d, numpy:    %8.0f packets/s' % (batch, n_packets / t_vectorized))
+
+
+if __name__ == '__main__':
+    main()
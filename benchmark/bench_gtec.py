@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# bench_gtec.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Compare synchronous bulk reads with the reader thread of the g.USBamp.
+
+A simulated device produces frames at the sampling frequency into a
+small hardware FIFO, frames are lost when the FIFO is full. Every bulk
+read has a fixed overhead and the consumer spends a fixed time
+processing each block returned by ``get_data``. With synchronous reads
+no transfer is pending while the consumer is busy, so the FIFO overflows
+at high sampling frequencies. The reader thread keeps a read pending
+all the time.
+
+"""
+
+
+from __future__ import division, print_function
+
+import threading
+import time
+
+import mock
+import numpy as np
+
+from libmushu.driver import gtec
+
+
+class SimulatedHandle(object):
+    """A g.USBamp producing frames at a fixed rate."""
+
+    def __init__(self, fs, fifo_frames=64, overhead=.002):
+        self.fs = fs
+        self.fifo_frames = fifo_frames
+        self.overhead = overhead
+        self.lock = threading.Lock()
+        self.t_start = None
+
+    def setConfiguration(self, config):
+        pass
+
+    def claimInterface(self, interface):
+        pass
+
+    def setAltInterface(self, interface):
+        pass
+
+    def controlMsg(self, requestType, request, buffer, value=0, index=0, timeout=100):
+        if request == 0xb5:
+            self.t_start = time.time()
+            self.produced = 0
+            self.delivered = 0
+            self.lost = 0
+
+    def _produce(self):
+        """Move the frames produced until now into the FIFO."""
+        produced = int((time.time() - self.t_start) * self.fs)
+        new = produced - self.produced
+        self.produced = produced
+        fifo = self.produced - self.delivered - self.lost - new
+        overflow = max(0, fifo + new - self.fifo_frames)
+        self.lost += overflow
+
+    def bulkRead(self, endpoint, size, timeout=100):
+        time.sleep(self.overhead)
+        with self.lock:
+            self._produce()
+            available = self.produced - self.delivered - self.lost
+            n = min(available, size // gtec.FRAME_SIZE)
+            self.delivered += n
+        if n == 0:
+            raise gtec.usb.USBError('timeout')
+        return np.zeros(n * 17, dtype='<f4').view(np.uint8)
+
+
+def fake_busses(handle):
+    interface = mock.Mock(alternateSetting=0)
+    config = mock.Mock(interfaces=[[interface]])
+    device = mock.Mock(idVendor=gtec.ID_VENDOR_GTEC,
+                       idProduct=gtec.ID_PRODUCT_GUSB_AMP,
+                       configurations=[config])
+    device.open.return_value = handle
+    return [mock.Mock(devices=[device])]
+
+
+def run(fs, reader, duration=2, processing=.01):
+    handle = SimulatedHandle(fs)
+    with mock.patch('usb.busses', return_value=fake_busses(handle)):
+        amp = gtec.GUSBamp()
+    amp.configure(reader=reader)
+    amp.start()
+    t_end = time.time() + duration
+    while time.time() < t_end:
+        amp.get_data()
+        time.sleep(processing)
+    amp.stop()
+    return handle.lost / max(handle.produced, 1)
+
+
+def main():
+    print('lost frames with 10 ms processing per block, 64 frame FIFO')
+    print('    fs   synchronous   reader thread')
+    for fs in 1200, 2400, 4800, 9600, 19200, 38400:
+        print('%6d   %10.1f%%   %12.1f%%' % (fs, 100 * run(fs, False), 100 * run(fs, True)))
+
+
+if __name__ == '__main__':
+    main()
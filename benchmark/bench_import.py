@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+# bench_import.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+
+"""Measure the time it takes to import libmushu and its drivers.
+
+Every import is timed in a fresh interpreter, the best of several runs
+is reported. Importing libmushu itself must not import any driver or
+the marker server, those are loaded when an amplifier is requested or
+started.
+
+"""
+
+
+from __future__ import division, print_function
+
+import subprocess
+import sys
+
+
+MODULES = ['libmushu',
+           'libmushu.ampdecorator',
+           'libmushu.driver.randomamp',
+           'libmushu.driver.gtec',
+           'libmushu.driver.emotiv',
+           'libmushu.driver.labstreaminglayer']
+
+CODE = """
+import time
+t = time.time()
+import %s
+print(time.time() - t)
+"""
+
+
+def import_time(module, runs=5):
+    """Get the best import time of ``module`` in seconds, or None."""
+    times = []
+    for i in range(runs):
+        try:
+            out = subprocess.check_output([sys.executable, '-c', CODE % module],
+                                          stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError:
+            return None
+        times.append(float(out.splitlines()[-1]))
+    return min(times)
+
+
+def main():
+    for module in MODULES:
+        t = import_time(module)
+        if t is None:
+            print('%-36s  not importable' % module)
+        else:
+            print('%-36s %7.1f ms' % (module, 1000 * t))
+
+
+if __name__ == '__main__':
+    main()
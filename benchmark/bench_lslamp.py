@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# bench_lslamp.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+
+"""Measure the cost of LSLAmp.get_data with a local lsl outlet.
+
+A data and a marker outlet are opened on this machine and a backlog of
+samples is pushed at once, so the pulls never wait for data and the
+time spent draining the backlog is the cost of ``get_data`` itself. The
+former implementation, which queried the time correction of both inlets
+for every block and converted the list of lists returned by
+``pull_chunk``, is compared with pulling into a preallocated buffer and
+a cached time correction.
+
+"""
+
+
+from __future__ import division, print_function
+
+import time
+
+import numpy as np
+import pylsl
+
+from libmushu.driver.labstreaminglayer import LSLAmp
+
+
+class FormerLSLAmp(LSLAmp):
+    """LSLAmp with the former get_data."""
+
+    def get_data(self):
+        tc_m = self.lsl_marker_inlet.time_correction()
+        tc_s = self.lsl_inlet.time_correction()
+        markers, m_timestamps = self.lsl_marker_inlet.pull_chunk(timeout=0.0, max_samples=self.max_samples)
+        markers = [str(i) for sublist in markers for i in sublist]
+        samples, timestamps = self.lsl_inlet.pull_chunk(timeout=pylsl.FOREVER, max_samples=self.max_samples)
+        samples = np.array(samples).reshape(-1, self.n_channels)
+        t0 = timestamps[0] + tc_s
+        m_timestamps = [(i + tc_m - t0) * 1000 for i in m_timestamps]
+        return samples, list(zip(m_timestamps, markers))
+
+
+def run(cls, outlet, marker_outlet, chunk, seconds, fs, max_samples):
+    amp = cls()
+    amp.configure(max_samples=max_samples)
+    amp.start()
+    # give the inlets time to connect
+    time.sleep(.5)
+    n = int(seconds * fs)
+    for i in range(0, n, len(chunk)):
+        outlet.push_chunk(chunk)
+    for i in range(int(seconds * 10)):
+        marker_outlet.push_sample(['S%d' % (i % 10)])
+    received = 0
+    t = time.time()
+    while received < n:
+        received += len(amp.get_data()[0])
+    elapsed = time.time() - t
+    amp.stop()
+    return elapsed
+
+
+def main(fs=5000, channels=64, seconds=20, max_samples=50):
+    info = pylsl.StreamInfo('bench', 'EEG', channels, fs, 'float32', 'bench_lslamp')
+    outlet = pylsl.StreamOutlet(info, max_buffered=2 * seconds)
+    marker_info = pylsl.StreamInfo('bench_markers', 'Markers', 1, 0, 'string', 'bench_lslamp_markers')
+    marker_outlet = pylsl.StreamOutlet(marker_info)
+    chunk = np.random.randn(fs // 10, channels).astype(np.float32).tolist()
+    print('%d s at %d Hz, %d channels, blocks of %d samples' % (seconds, fs, channels, max_samples))
+    for name, cls in ('former', FormerLSLAmp), ('current', LSLAmp):
+        elapsed = run(cls, outlet, marker_outlet, chunk, seconds, fs, max_samples)
+        print('%-8s %8.3f s, %6.1fx real time' % (name, elapsed, seconds / elapsed))
+
+
+if __name__ == '__main__':
+    main()
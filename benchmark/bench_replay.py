@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# bench_replay.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Measure the throughput of the g.USBamp driver on a replayed capture.
+
+The captured transfers are replayed in a loop as fast as the driver
+reads them, so the result is the maximal rate at which the driver can
+decode frames, independently of the hardware.
+
+Usage: bench_replay.py [capture.mon]
+
+"""
+
+
+from __future__ import division, print_function
+
+import os
+import sys
+import time
+
+from libmushu.driver import gtec
+from libmushu.usbreplay import ReplayHandle, read_dump, replay
+
+
+DUMPS = os.path.join(os.path.dirname(__file__), os.pardir, 'usb-dumps')
+
+
+def main(path=None, duration=2):
+    if path is None:
+        path = os.path.join(DUMPS, 'from-calibration-to-normal-start-stop-clean.mon')
+    urbs = read_dump(os.path.join(DUMPS, 'open-app-connect-disconnect-clean.mon')) + read_dump(path)
+    handle = ReplayHandle(urbs, loop=True,
+                          id_vendor=gtec.ID_VENDOR_GTEC,
+                          id_product=gtec.ID_PRODUCT_GUSB_AMP)
+    with replay(handle):
+        amp = gtec.GUSBamp()
+    amp.start()
+    frames, reads = 0, 0
+    t_start = time.time()
+    while time.time() - t_start < duration:
+        data, marker = amp.get_data()
+        frames += len(data)
+        reads += 1
+    elapsed = time.time() - t_start
+    amp.stop()
+    print('%s' % os.path.basename(path))
+    print('%8.0f transfers/s' % (reads / elapsed))
+    print('%8.0f frames/s (%.0f times 38.4 kHz)' % (frames / elapsed, frames / elapsed / 38400))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
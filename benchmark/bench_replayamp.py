@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+# bench_replayamp.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Compare the marker lookup of the ReplayAmp on a long recording.
+
+The binary search over the sorted markers is compared with the former
+masking of all remaining markers for every block.
+
+"""
+
+
+from __future__ import division, print_function
+
+import time
+
+import numpy as np
+
+from libmushu.driver.replayamp import ReplayAmp
+
+
+def replay_masking(marker, fs, samples, n_blocks):
+    """The former marker lookup."""
+    marker_ts = np.array([ts for ts, s in marker])
+    marker_s = np.array([s for ts, s in marker])
+    result = []
+    elapsed = samples / fs
+    for i in range(n_blocks):
+        mask = marker_ts < (elapsed * 1000)
+        result.append(list(zip(marker_ts[mask], marker_s[mask])))
+        marker_ts = marker_ts[~mask]
+        marker_s = marker_s[~mask]
+        marker_ts -= elapsed * 1000
+    return result
+
+
+def main(fs=1000, hours=1, n_markers=100000, samples=10):
+    n_samples = int(fs * 3600 * hours)
+    n_blocks = n_samples // samples
+    data = np.zeros((n_samples, 1), dtype=np.float32)
+    rng = np.random.RandomState(0)
+    ts = np.sort(rng.uniform(0, n_samples * 1000 / fs, n_markers))
+    marker = [[t, 'S%d' % (i % 10)] for i, t in enumerate(ts)]
+    print('%d h at %d Hz, %d markers, blocks of %d samples' % (hours, fs, n_markers, samples))
+
+    amp = ReplayAmp()
+    amp.configure(data, marker, ['ch'], fs, realtime=False, blocksize_samples=samples)
+    amp.start()
+    t = time.time()
+    found = sum(len(amp.get_data()[1]) for i in range(n_blocks))
+    t_search = time.time() - t
+    assert found == n_markers
+
+    # the masking is quadratic, extrapolate from a part of the blocks
+    part = min(n_blocks, 20000)
+    t = time.time()
+    replay_masking(marker, fs, samples, part)
+    t_masking = (time.time() - t) * n_blocks / part
+
+    print('masking:      %8.2f s (extrapolated)' % t_masking)
+    print('searchsorted: %8.2f s' % t_search)
+
+
+if __name__ == '__main__':
+    main()
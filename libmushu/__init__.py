@@ -45,6 +45,19 @@ with the low level drivers if you're a developer or find that the
 :class:`libmushu.ampdecorator.AmpDecorator` does not provide the
 features you need.
 
+Drivers of other packages are registered via the ``libmushu.drivers``
+entry point group and can be used like the drivers of libmushu::
+
+    # setup.py of the other package
+    setup(
+        ...
+        entry_points={'libmushu.drivers': ['myamp = mypackage.myamp:MyAmp']},
+    )
+
+The driver modules are only imported when an amplifier is requested or
+tested for availability, so their dependencies do not slow down ``import
+libmushu``.
+
 """
 
 
@@ -52,12 +65,14 @@ from __future__ import division
 
 from importlib import import_module
 import logging
+import threading
+import time
 
 from libmushu.ampdecorator import AmpDecorator
 
 __version__ = '0.2'
 
-__all__ = ['supported_amps', 'get_available_amps', 'get_amp']
+__all__ = ['supported_amps', 'get_available_amps', 'get_amp', 'get_driver', 'AmpDecorator']
 
 
 # TODO: low level driver must have a real name?
@@ -67,21 +82,120 @@ supported_amps = {
     'randomamp': ['randomamp', 'RandomAmp'],
     'sinusamp' : ['sinusamp', 'SinusAmp'],
     'replayamp' : ['replayamp', 'ReplayAmp'],
-    'lslamp' : ['labstreaminglayer', 'LSLAmp']
+    'lslamp' : ['labstreaminglayer', 'LSLAmp'],
+    'sharedmemoryamp' : ['sharedmemoryamp', 'SharedMemoryAmp'],
+    'netamp' : ['netamp', 'NetAmp'],
+    'aggregateamp' : ['aggregateamp', 'AggregateAmp'],
+    'benchamp' : ['benchamp', 'BenchAmp']
 }
 
 
+# the entry point group of the drivers of other packages
+ENTRY_POINT_GROUP = 'libmushu.drivers'
+
+
 logger = logging.getLogger(__name__)
 logger.info('Logger started')
 
 
-def get_available_amps():
+_entry_points = None
+
+
+def _get_entry_points():
+    """Get the drivers registered by other packages.
+
+    The entry points are collected on the first call, as importing
+    ``pkg_resources`` and scanning the installed packages is slow.
+
+    Returns
+    -------
+    entry_points : dict
+        name -> entry point
+
+    """
+    global _entry_points
+    if _entry_points is None:
+        _entry_points = {}
+        try:
+            import pkg_resources
+        except ImportError:
+            return _entry_points
+        for entry_point in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP):
+            if entry_point.name in supported_amps or entry_point.name in _entry_points:
+                logger.warning('Ignoring duplicate driver %s from %s.' % (entry_point.name, entry_point.dist))
+                continue
+            _entry_points[entry_point.name] = entry_point
+    return _entry_points
+
+
+def _get_amp_names():
+    """Get the names of the drivers of libmushu and of other packages."""
+    return list(supported_amps) + sorted(_get_entry_points())
+
+
+def get_driver(ampname):
+    """Get the low level driver class of an amplifier.
+
+    The module of the driver is imported on the first call.
+
+    Parameters
+    ----------
+    ampname : str
+        the name of the amplifier, a key in the :data:`supported_amps`
+        dictionary or the name of a driver registered in the
+        ``libmushu.drivers`` entry point group
+
+    Returns
+    -------
+    cls : class
+        the low level driver class
+
+    Raises
+    ------
+    ValueError : if there is no driver with this name
+
+    """
+    if ampname in supported_amps:
+        mod, cls = supported_amps[ampname]
+        return getattr(import_module('libmushu.driver.' + mod), cls)
+    entry_point = _get_entry_points().get(ampname)
+    if entry_point is None:
+        raise ValueError('Unknown amplifier: %s' % ampname)
+    return entry_point.load()
+
+
+# the results of the availability checks: name -> (time, available),
+# and the names of the drivers currently being checked
+_availability = {}
+_probing = set()
+_availability_cond = threading.Condition()
+
+
+def get_available_amps(timeout=5, callback=None, max_age=10):
     """Retrieves all available (e.g. connected) amplifiers.
 
     This method tests all supported amplifiers if they are connected to
     the system. More precisely: if the amplifiers `is_available` method
     returns True.
 
+    The amplifiers are tested concurrently, each in its own thread, and
+    the results are cached for ``max_age`` seconds. An amplifier which
+    does not report within ``timeout`` seconds is treated as not
+    available, its test keeps running in the background and its result
+    is cached when it arrives.
+
+    Parameters
+    ----------
+    timeout : float, optional
+        the time in seconds each amplifier has to report
+    callback : callable, optional
+        called as ``callback(name, available)`` in the calling thread
+        as soon as an amplifier reported, e.g. to populate a list of
+        amplifiers progressively
+    max_age : float, optional
+        the maximum age of cached results in seconds, 0 tests all
+        amplifiers again
+
     Returns
     -------
     available_amps : list of strings
@@ -95,23 +209,68 @@ def get_available_amps():
     ['gusbamp', 'randomamp']
 
     """
+    t_start = time.time()
+    deadline = t_start + timeout
+    oldest = t_start - max_age
     available_amps = []
-    for name, (mod, cls) in supported_amps.items():
-        try:
-            m = import_module('libmushu.driver.' + mod)
-        except ImportError:
-            logger.warning('Unable to import %s' % mod, exc_info=True)
-            continue
-        try:
-            c = getattr(m, cls)
-            if c.is_available():
+    names = _get_amp_names()
+    pending = set(names)
+    with _availability_cond:
+        for name in names:
+            if name in _probing or _availability.get(name, (-1, ))[0] >= oldest:
+                continue
+            _probing.add(name)
+            thread = threading.Thread(target=_probe, args=(name, ),
+                                      name='Probe-%s' % name)
+            thread.daemon = True
+            thread.start()
+    while pending:
+        with _availability_cond:
+            reported = [name for name in pending
+                        if _availability.get(name, (-1, ))[0] >= oldest]
+            if not reported:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                _availability_cond.wait(remaining)
+                continue
+            results = [(name, _availability[name][1]) for name in reported]
+        # the callback is called without holding the lock
+        for name, available in results:
+            pending.discard(name)
+            if available:
                 available_amps.append(name)
+            if callback is not None:
+                callback(name, available)
+    for name in pending:
+        logger.warning('Testing if %s is available timed out.' % name)
+    # keep the order of the drivers
+    return [name for name in names if name in available_amps]
+
+
+def _probe(name):
+    """Test if an amplifier is available and cache the result.
+
+    This function runs in a separate thread for every amplifier.
+
+    """
+    available = False
+    try:
+        c = get_driver(name)
+    except ImportError:
+        logger.warning('Unable to import the driver of %s' % name, exc_info=True)
+    else:
+        try:
+            available = bool(c.is_available())
         except:
-            logger.warning('Unable to test if %s is available' % cls, exc_info=True)
-    return available_amps
+            logger.warning('Unable to test if %s is available' % name, exc_info=True)
+    with _availability_cond:
+        _availability[name] = time.time(), available
+        _probing.discard(name)
+        _availability_cond.notify_all()
 
 
-def get_amp(ampname):
+def get_amp(ampname, **kwargs):
     """Get an amplifier instance.
 
 
@@ -122,7 +281,12 @@ def get_amp(ampname):
     ----------
     ampname : str
         the desired amplifier. The string must be a key in the
-        :data:`supported_amps` dictionary.
+        :data:`supported_amps` dictionary or the name of a driver
+        registered in the ``libmushu.drivers`` entry point group.
+    kwargs :
+        additional keyword arguments are passed to
+        :class:`libmushu.ampdecorator.AmpDecorator`, e.g.
+        ``threaded=True``
 
     Returns
     -------
@@ -137,8 +301,5 @@ def get_amp(ampname):
     >>> amp = lm.get_amp(amps[0])
 
     """
-    mod, cls = supported_amps.get(ampname)
-    m = import_module('libmushu.driver.' + mod)
-    c = getattr(m, cls)
-    return AmpDecorator(c)
+    return AmpDecorator(get_driver(ampname), **kwargs)
 
@@ -32,27 +32,25 @@ automatically receive decorated amplifiers.
 
 from __future__ import division
 
-import select
-import socket
-import time
-from multiprocessing import Process, Queue, Event
+import threading
+from collections import deque
 import os
-import struct
 import json
 import logging
-import asyncore
-import asynchat
+
+import numpy as np
 
 from libmushu.amplifier import Amplifier
+from libmushu.clock import SystemClock, system_clock
+from libmushu.clocksync import ClockRegression
 
 
 logger = logging.getLogger(__name__)
 logger.info('Logger started')
 
 
-END_MARKER = '\n'
-BUFSIZE = 2**16
-PORT = 12344
+# the time in seconds the marker server may take to start
+MARKER_SERVER_TIMEOUT = 10
 
 
 class AmpDecorator(Amplifier):
@@ -68,6 +66,34 @@ class AmpDecorator(Amplifier):
 
         amp = Ampdecorator(RandomAmp)
 
+    By default, the low level amplifier is read synchronously in
+    :meth:`get_data`. If the consumer of the data is slow (e.g. a GUI or
+    a classifier) the buffers of the amplifier may overflow. In this
+    case you can enable the threaded acquisition mode::
+
+        amp = AmpDecorator(RandomAmp, threaded=True)
+
+    In threaded mode, a dedicated thread reads the low level amplifier
+    as fast as possible and puts the received blocks into a bounded
+    queue. :meth:`get_data` returns everything that was received since
+    the last call as a single block. If the queue is full, the oldest
+    block is dropped, see :meth:`get_stats`.
+
+    The decorator detects samples that got lost between the amplifier
+    and the host. If the low level amplifier provides a sample counter
+    channel (see :meth:`libmushu.amplifier.Amplifier.get_counter`) gaps
+    in the counter are detected. Detected gaps are logged, saved in the
+    meta data and counted in :meth:`get_stats`. Optionally, the gaps can
+    be filled with NaNs to get a stream with a constant sampling rate::
+
+        amp = AmpDecorator(RandomAmp, fill_gaps=True)
+
+    Without a sample counter, the number of received samples is compared
+    to the number of samples expected from the clock regression. As many
+    amplifiers buffer their samples and return a backlog in blocks of
+    limited size, lagging behind the clock is no proof of lost samples,
+    so the lag is only logged and reported in :meth:`get_stats`.
+
     Waring: The network marker timings on Windows have a resolution of
     10ms-15ms. On Linux the resolution is 1us. This is due to
     limitations of Python's time.time method, or rather a Windows
@@ -117,9 +143,59 @@ class AmpDecorator(Amplifier):
 
     """
 
-    def __init__(self, ampcls):
+    def __init__(self, ampcls, threaded=False, queue_size=1024,
+                 fill_gaps=False, gap_tolerance=0.1, clock=None):
+        """Initialize the decorator.
+
+        Parameters
+        ----------
+        ampcls : Amplifier class
+            the low level amplifier class to decorate
+        threaded : bool, optional
+            if True, read the low level amplifier in a separate thread
+        queue_size : int, optional
+            the maximum number of blocks the acquisition thread buffers
+            before it starts dropping the oldest ones. Only used in
+            threaded mode.
+        fill_gaps : bool, optional
+            if True, lost samples are replaced by NaNs and all blocks
+            are returned as float64
+        gap_tolerance : float, optional
+            the time in seconds the received samples may lag behind
+            the clock regression before the lag is logged. Only used if
+            the amplifier does not provide a sample counter.
+        clock : libmushu.clock.Clock, optional
+            the clock used to timestamp the received blocks, defaults
+            to the system clock. The clock is also injected into the
+            low level amplifier, so a
+            :class:`libmushu.clock.VirtualClock` makes the simulated
+            amplifiers run without sleeping. The network markers are
+            timestamped with the system clock in the process of the
+            marker server, so the marker server is only started with a
+            :class:`libmushu.clock.SystemClock`. With other clocks,
+            markers can still be put into :attr:`marker_queue` with a
+            timestamp of the given clock.
+
+        """
         self.amp = ampcls()
+        # the clock of the host, the regression which maps the samples
+        # of the amplifier to it is self.sample_clock
+        self.host_clock = system_clock
+        if clock is not None:
+            self.host_clock = clock
+            self.amp.clock = clock
         self.write_to_file = False
+        self.threaded = threaded
+        self.queue_size = queue_size
+        self.fill_gaps = fill_gaps
+        self.gap_tolerance = gap_tolerance
+        self.received_samples = 0
+        self.amp_samples = 0
+        self.gaps = []
+        self.sample_clock = ClockRegression(1)
+        self.block_onset = None
+        self.sinks = []
+        self._reset_stats()
 
     @property
     def presets(self):
@@ -136,47 +212,105 @@ class AmpDecorator(Amplifier):
             for filename in filename_marker, filename_eeg, filename_meta:
                 if os.path.exists(filename):
                     logger.error('A file "%s" already exists, aborting.' % filename)
-                    raise Exception
+                    raise IOError('A file "%s" already exists.' % filename)
             self.fh_eeg = open(filename_eeg, 'wb')
             self.fh_marker = open(filename_marker, 'w')
             self.fh_meta = open(filename_meta, 'w')
             # write meta data
-            meta = {'Channels': self.amp.get_channels(),
-                    'Sampling Frequency': self.amp.get_sampling_frequency(),
-                    'Amp': str(self.amp)
-                    }
-            json.dump(meta, self.fh_meta, indent=4)
-
-        # start the marker server
+            self.meta = {'Channels': self.amp.get_channels(),
+                         'Sampling Frequency': self.amp.get_sampling_frequency(),
+                         'Amp': str(self.amp)
+                         }
+            json.dump(self.meta, self.fh_meta, indent=4)
+
+        # start the marker server, it is imported here as it pulls in
+        # multiprocessing and asyncore
+        from multiprocessing import Process, Queue, Event
         self.marker_queue = Queue()
-        self.tcp_reader_running = Event()
-        self.tcp_reader_running.set()
-        tcp_reader_ready = Event()
-        self.tcp_reader = Process(target=marker_reader,
-                                  args=(self.marker_queue,
-                                        self.tcp_reader_running,
-                                        tcp_reader_ready
-                                        )
-                                  )
-        self.tcp_reader.start()
-        logger.debug('Waiting for marker server to become ready...')
-        tcp_reader_ready.wait()
-        logger.debug('Marker server is ready.')
-        # zero the sample counter
+        self.tcp_reader = None
+        if isinstance(self.host_clock, SystemClock):
+            from libmushu.markerserver import marker_reader
+            self.tcp_reader_running = Event()
+            self.tcp_reader_running.set()
+            tcp_reader_ready = Event()
+            self.tcp_reader = Process(target=marker_reader,
+                                      args=(self.marker_queue,
+                                            self.tcp_reader_running,
+                                            tcp_reader_ready
+                                            )
+                                      )
+            self.tcp_reader.start()
+            logger.debug('Waiting for marker server to become ready...')
+            if not tcp_reader_ready.wait(MARKER_SERVER_TIMEOUT):
+                self.tcp_reader.terminate()
+                self.tcp_reader.join()
+                self.tcp_reader = None
+                if self.write_to_file:
+                    for fh in self.fh_eeg, self.fh_marker, self.fh_meta:
+                        fh.close()
+                raise RuntimeError('The marker server did not start.')
+            logger.debug('Marker server is ready.')
+        else:
+            # the marker server stamps the markers with the system time
+            logger.warning('Not starting the marker server, the network markers '
+                           'cannot be timestamped with a %s.' % type(self.host_clock).__name__)
+        # zero the sample counters
         self.received_samples = 0
+        self.amp_samples = 0
+        self.gaps = []
+        self._last_counter = None
+        self.sample_clock = ClockRegression(self.amp.get_sampling_frequency())
+        self._reset_stats()
+        # open the sinks
+        for sink in self.sinks:
+            sink.open(self)
         # start the amp
         self.amp.start()
+        # start the acquisition thread
+        if self.threaded:
+            self._blocks = deque()
+            self._blocks_cond = threading.Condition()
+            self._acquisition_error = None
+            self._acquisition_running = threading.Event()
+            self._acquisition_running.set()
+            self._acquisition_thread = threading.Thread(target=self._acquisition_loop,
+                                                        name='AcquisitionThread')
+            self._acquisition_thread.daemon = True
+            self._acquisition_thread.start()
 
     def stop(self):
+        # stop the acquisition thread
+        if self.threaded:
+            self._acquisition_running.clear()
+            logger.debug('Waiting for acquisition thread to stop...')
+            # the thread may be blocked in get_data of the amplifier,
+            # don't wait for it forever. it stops at its next block, or
+            # with an error once the amplifier is stopped
+            self._acquisition_thread.join(1)
+            if self._acquisition_thread.is_alive():
+                logger.warning('Acquisition thread did not stop in time.')
+            else:
+                logger.debug('Acquisition thread stopped.')
         # stop the amp
         self.amp.stop()
+        # close the sinks
+        for sink in self.sinks:
+            sink.close()
         # stop the marker server
-        self.tcp_reader_running.clear()
-        logger.debug('Waiting for marker server process to stop...')
-        self.tcp_reader.join()
-        logger.debug('Marker server process stopped.')
+        if self.tcp_reader is not None:
+            self.tcp_reader_running.clear()
+            logger.debug('Waiting for marker server process to stop...')
+            self.tcp_reader.join()
+            logger.debug('Marker server process stopped.')
         # close the files
         if self.write_to_file:
+            # update the meta data with the fitted sample clock
+            self.meta['Clock'] = self.sample_clock.to_dict()
+            self.meta['Effective Sampling Frequency'] = self.sample_clock.effective_fs
+            self.meta['Gaps'] = self.gaps
+            self.fh_meta.seek(0)
+            self.fh_meta.truncate()
+            json.dump(self.meta, self.fh_meta, indent=4)
             logger.debug('Closing files.')
             for fh in self.fh_eeg, self.fh_marker, self.fh_meta:
                 fh.close()
@@ -204,214 +338,516 @@ class AmpDecorator(Amplifier):
             marker from the last block and a marker for a future block
             respectively.
 
+        The arrival times of the blocks are fed into a
+        :class:`libmushu.clocksync.ClockRegression`, which is used to
+        estimate the onset of the returned block in host time. The
+        estimate is available as :attr:`block_onset` after the call.
+        Network markers are converted from host time into sample time
+        using the same regression, so the drift between the clocks of
+        the amplifier and the host does not shift them relative to the
+        data.
+
         """
         # get data and marker from underlying amp
-        data, marker = self.amp.get_data()
-
-        t = time.time()
-        # length in sec of the new block according to #samples and fs
-        block_duration = len(data) / self.amp.get_sampling_frequency()
+        if self.threaded:
+            blocks = self._get_queued_blocks()
+        else:
+            data, marker = self.amp.get_data()
+            blocks = [(self.host_clock.time(), data, marker, 0)]
+        # detect lost samples and feed the arrival times of the blocks
+        # into the clock regression
+        amp_samples = self.amp_samples
+        offset = self.received_samples
+        for i, (t, data, marker, dropped) in enumerate(blocks):
+            # samples dropped by the acquisition thread are handled
+            # like a gap before the next block with data
+            self._dropped_pending += dropped
+            if len(data) == 0:
+                continue
+            data, marker = self._handle_gaps(t, data, marker, offset, self._dropped_pending)
+            self._dropped_pending = 0
+            blocks[i] = t, data, marker, 0
+            offset += len(data)
+            self.sample_clock.update(self.amp_samples, t)
+        data, marker = self._merge_blocks(blocks)
+        if self.fill_gaps:
+            # NaNs need floats, all blocks get the same dtype whether
+            # they contain gaps or not
+            data = data.astype(np.float64, copy=False)
         # abs time of start of the block
-        t0 = t - block_duration
+        if self.sample_clock.updates > 0:
+            t0 = self.sample_clock.time_of(amp_samples)
+        else:
+            t0 = blocks[-1][0]
+        self.block_onset = t0
+        fs = self.amp.get_sampling_frequency()
         # duration of all blocks in ms except the current one
-        duration = 1000 * self.received_samples / self.amp.get_sampling_frequency()
+        duration = 1000 * self.received_samples / fs
 
-        # merge markers
+        # merge markers, the network markers are timestamped with the
+        # host clock and converted into sample time to compensate the
+        # drift between the amplifier's and the host's clock
         tcp_marker = []
         while not self.marker_queue.empty():
             m = self.marker_queue.get()
-            m[0] = (m[0] - t0) * 1000
+            if self.sample_clock.updates > 0:
+                m[0] = (self.sample_clock.sample_of(m[0]) - amp_samples) * 1000 / fs
+            else:
+                m[0] = (m[0] - t0) * 1000
             tcp_marker.append(m)
         marker = sorted(marker + tcp_marker)
         # save data to files
         if self.write_to_file:
             for m in marker:
                 self.fh_marker.write("%f %s\n" % (duration + m[0], m[1]))
-            self.fh_eeg.write(struct.pack("f"*data.size, *data.flatten()))
+            self.fh_eeg.write(np.ascontiguousarray(data, dtype=np.float32).tobytes())
+        for sink in self.sinks:
+            sink.write(data, marker, t0)
         self.received_samples += len(data)
         if len(data) == 0 and len(marker) > 0:
             logger.error('Received marker but no data. This is an error, the amp should block on get_data until data is available. Marker timestamps will be unreliable.')
         return data, marker
 
-    def get_channels(self):
-        return self.amp.get_channels()
-
-    def get_sampling_frequency(self):
-        return self.amp.get_sampling_frequency()
+    def add_sink(self, sink):
+        """Add a sink that receives every block of data.
 
+        Sinks are used to pass the data on to other consumers, like
+        other processes or computers. A sink must provide the following
+        methods:
 
-def marker_reader(queue, running, ready):
-    """Start the TCP and UDP MarkerServers and start the receiving loop.
+        ``open(amp)``
+            called on :meth:`start`, with this decorator as argument
+        ``write(data, marker, t0)``
+            called on every :meth:`get_data` with the returned data and
+            markers and the host time of the onset of the block
+        ``close()``
+            called on :meth:`stop`
 
-    This method runs in a separate process and receives UDP and TCP
-    markers. Whenever a marker is received, it is put together with a
-    timestamp into a queue.
+        Parameters
+        ----------
+        sink : object
+            the sink, e.g. a
+            :class:`libmushu.sharedmemory.SharedMemoryPublisher`
 
-    After the TCP and UDP servers are set up the ``ready`` event is set
-    and the method enters the loop that runs forever until the
-    ``running`` Event is cleared. Received markers are put in the
-    ``queue``.
+        """
+        self.sinks.append(sink)
 
-    Parameters
-    ----------
-    queue : Queue
-        this queue is used to send markers to a different process
-    running : Event
-        this event is used to signal this process to terminate its main
-        loop
-    ready : Event
-        this signal is used to signal the "parent"-process that this
-        process is ready to receive marker
+    def iter_blocks(self, block_samples, hop=None):
+        """Iterate over fixed-size blocks of data.
 
-    """
-    MarkerServer(queue, 'udp')
-    MarkerServer(queue, 'tcp')
-    ready.set()
-    while running.is_set():
-        asyncore.loop(timeout=5, count=1)
+        The low level amplifiers return blocks of varying length. This
+        generator calls :meth:`get_data` and re-buffers the data into
+        blocks of exactly ``block_samples`` samples. Consecutive blocks
+        start ``hop`` samples apart, i.e. they overlap if ``hop`` is
+        smaller than ``block_samples``.
 
+        Parameters
+        ----------
+        block_samples : int
+            the length of the blocks in samples
+        hop : int, optional
+            the distance between the onsets of two consecutive blocks in
+            samples. Defaults to ``block_samples``.
 
-class MarkerServer(asyncore.dispatcher):
-    """The marker server.
+        Yields
+        ------
+        data : 2darray
+            a numpy array (block_samples, channels)
+        markers : list of (float, str)
+            the markers within the block, the timestamps are in ms
+            relative to the onset of the block. Markers that arrive too
+            late for the block they belong to are returned with the
+            next block and a negative timestamp. Markers between two
+            blocks, if ``hop`` is larger than ``block_samples``, are
+            dropped.
 
-    It opens a TCP or UDP socket and assigns a :class:`MarkerHandler` to
-    the opened socket.
+        Examples
+        --------
 
-    """
+        >>> amp.start()
+        >>> for data, marker in amp.iter_blocks(100, hop=50):
+        ...     features = do_something(data)
 
-    def __init__(self, queue, proto):
-        """Initialize the Server.
+        """
+        if hop is None:
+            hop = block_samples
+        if block_samples < 1 or hop < 1:
+            raise ValueError('block_samples and hop must be positive.')
+        fs = self.amp.get_sampling_frequency()
+        buf = None
+        # markers as [position in samples relative to the start of the
+        # buffer, marker, already returned?]
+        buf_marker = []
+        # samples to drop from incoming data if hop > block_samples
+        skip = 0
+        # the position of the start of the buffer in the stream, the
+        # blocks start at multiples of hop
+        base = 0
+
+        def between_blocks(pos):
+            pos += base
+            return pos >= 0 and pos % hop >= block_samples
+
+        while True:
+            data, marker = self.get_data()
+            offset = 0 if buf is None else len(buf)
+            for ts, m in marker:
+                buf_marker.append([offset + ts * fs / 1000, m, False])
+            if skip > 0:
+                n = min(skip, len(data))
+                data = data[n:]
+                skip -= n
+                base += n
+                for m in buf_marker:
+                    m[0] -= n
+            if buf is None:
+                buf = data
+            elif len(data) > 0:
+                buf = np.concatenate([buf, data])
+            start = 0
+            while start + block_samples <= len(buf):
+                end = start + block_samples
+                block_marker = []
+                for m in buf_marker:
+                    if m[0] < end and (m[0] >= start or not (m[2] or between_blocks(m[0]))):
+                        block_marker.append([1000 * (m[0] - start) / fs, m[1]])
+                        m[2] = True
+                yield buf[start:end], block_marker
+                start += hop
+            if start > 0:
+                consumed = min(start, len(buf))
+                skip = start - consumed
+                buf = buf[consumed:]
+                buf_marker = [[pos - consumed, m, returned]
+                              for pos, m, returned in buf_marker
+                              if pos >= start or not (returned or between_blocks(pos))]
+                base += consumed
+
+    def stream(self, block_samples, hop=None):
+        """Asynchronously iterate over fixed-size blocks of data.
+
+        This is the asynchronous version of :meth:`iter_blocks`, the
+        blocking calls to the amplifier are executed in the default
+        executor of the event loop. It requires Python 3.5 or later::
+
+            async for data, marker in amp.stream(100, hop=50):
+                features = do_something(data)
 
         Parameters
         ----------
-        queue : multiprocessing.Queue instance
-        proto : string
-            The protocol to use. Can be either 'tcp' or 'udp'.
+        block_samples : int
+            the length of the blocks in samples
+        hop : int, optional
+            the distance between the onsets of two consecutive blocks in
+            samples. Defaults to ``block_samples``.
 
-        Raises
-        ------
-        ValueError : if the protocol is unsupported
+        Returns
+        -------
+        stream : asynchronous iterator
+            yields the same ``(data, markers)`` tuples as
+            :meth:`iter_blocks`
 
         """
-        asyncore.dispatcher.__init__(self)
-        self.queue = queue
-        if proto.lower() == 'tcp':
-            logger.debug('Opening TCP socket.')
-            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-            self.setblocking(0)
-            self.bind(('', PORT))
-            self.listen(5)
-        elif proto.lower() == 'udp':
-            logger.debug('Opening UDP socket.')
-            self.create_socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.setblocking(0)
-            self.bind(('', PORT))
-            # in contrast to a TCP socket, an UDP socket has no
-            # connection, so the socket is immediately ready to receive
-            # data
-            handler = MarkerHandler(self, self.queue)
-        else:
-            raise ValueError('Unsupported protocol: {proto}'.format(proto=proto))
-
-    def handle_accept(self):
-        """Accept an incomming TCP connection.
+        return BlockStream(self.iter_blocks(block_samples, hop))
 
-        """
-        pair = self.accept()
-        if pair is not None:
-            sock, addr = pair
-            logger.debug('Incoming connection from {addr}'.format(addr=addr))
-            handler = MarkerHandler(sock, self.queue)
+    def get_channels(self):
+        return self.amp.get_channels()
 
+    def get_sampling_frequency(self):
+        return self.amp.get_sampling_frequency()
 
-class MarkerHandler(asynchat.async_chat):
-    """Handler for incoming data streams.
+    def get_counter(self):
+        return self.amp.get_counter()
 
-    This handler processes incoming data from a TCP or UDP sockets. Each
-    packet ends with a terminator character sequence. The handler takes
-    care of incomplete packets and puts complete packets in the queue.
+    def get_stats(self):
+        """Get acquisition statistics.
 
-    """
+        Returns
+        -------
+        stats : dict
+            ``received_samples`` is the number of samples returned by
+            :meth:`get_data` since the last :meth:`start`. In threaded
+            mode, ``queued_blocks`` is the number of blocks currently
+            waiting in the queue, ``overflows`` the number of blocks
+            that were dropped because the queue was full and
+            ``dropped_samples`` the number of samples in those blocks,
+            which are also recorded as gaps.
+            ``gaps`` is the number of detected gaps and
+            ``lost_samples`` the total number of samples lost in them.
+            If the amplifier provides no sample counter, ``lag`` is the
+            number of samples the last block lagged behind the clock
+            regression, these samples may be lost or still buffered by
+            the amplifier.
+            ``drift`` is the relative deviation of the amplifier's
+            sampling frequency from its nominal value,
+            ``effective_fs`` the sampling frequency measured with the
+            host's clock and ``jitter`` the standard deviation of the
+            arrival times of the blocks in seconds, see
+            :class:`libmushu.clocksync.ClockRegression`.
 
-    def __init__(self, socket, queue):
-        """Initialize the Handler.
+        """
+        stats = {'received_samples': self.received_samples,
+                 'overflows': self._overflows,
+                 'dropped_samples': self._dropped_samples,
+                 'queued_blocks': 0,
+                 'gaps': len(self.gaps),
+                 'lost_samples': sum(count for _, count in self.gaps),
+                 'lag': self._lag,
+                 'drift': self.sample_clock.drift,
+                 'effective_fs': self.sample_clock.effective_fs,
+                 'jitter': self.sample_clock.jitter}
+        if self.threaded and hasattr(self, '_blocks'):
+            with self._blocks_cond:
+                stats['queued_blocks'] = len(self._blocks)
+        return stats
+
+    def _find_gaps(self, t, data):
+        """Find lost samples in a block of data.
 
         Parameters
         ----------
-        socket : socket.socket
-            the socket can be TCP or UDP. In case of UDP the socket must
-            be binded already, the TCP socket must be an opened
-            connection (i.e. after accept)
-        queue : multiprocessing.Queue instance
-            The queue to send the received markers to.
+        t : float
+            the arrival time of the block
+        data : 2darray
+            the block of data
 
-        """
-        asynchat.async_chat.__init__(self, socket)
-        self.set_terminator(END_MARKER)
-        self.data = ''
-        self.timestamp = None
-        self.queue = queue
+        Returns
+        -------
+        gaps : list of (int, int)
+            the gaps as (position in ``data``, number of lost samples)
 
-    def handle_close(self):
-        logger.debug('Connection closed by peer, closing connection.')
-        self.close()
+        """
+        counter = self.amp.get_counter()
+        if counter is not None:
+            channel, modulo = counter
+            c = data[:, channel].astype(np.int64)
+            if self._last_counter is None:
+                diff = np.diff(c)
+                first = 1
+            else:
+                diff = np.diff(np.concatenate([[self._last_counter], c]))
+                first = 0
+            self._last_counter = c[-1]
+            lost = (diff - 1) % modulo
+            idx = np.flatnonzero(lost)
+            return [(int(i) + first, int(lost[i])) for i in idx]
+        # without a counter we compare the number of samples with the
+        # number of samples the clock regression expects. the samples
+        # may just be buffered by the amplifier and returned later in
+        # blocks of limited size, so the lag is only reported
+        if self.sample_clock.updates < 2:
+            return []
+        lag = self.sample_clock.sample_of(t) - self.amp_samples - len(data)
+        self._lag = max(0, int(round(lag)))
+        lagging = lag * self.sample_clock.slope > max(self.gap_tolerance, 5 * self.sample_clock.jitter)
+        if lagging and not self._lagging:
+            logger.warning('The received samples lag %d samples behind the clock.' % lag)
+        self._lagging = lagging
+        return []
+
+    def _handle_gaps(self, t, data, marker, offset, dropped=0):
+        """Detect, record and optionally fill gaps in a block.
 
-    def writable(self):
-        """Signal weather the socket is ready to send data.
+        Parameters
+        ----------
+        t : float
+            the arrival time of the block
+        data : 2darray
+            the block of data
+        marker : list of (float, str)
+            the markers of the block
+        offset : int
+            the position of the block in the returned stream
+        dropped : int, optional
+            the number of samples the acquisition thread dropped right
+            before this block, they are recorded as a gap. The markers
+            of the dropped blocks have negative timestamps.
 
         Returns
         -------
-        writable : bool
-            ready to send or not
+        data : 2darray
+            the data, with the gaps filled if ``fill_gaps`` is True
+        marker : list of (float, str)
+            the markers, shifted accordingly
+
+        """
+        if dropped:
+            # the counter cannot be compared across the dropped blocks,
+            # and the clock regression must expect the dropped samples
+            self._last_counter = None
+            self.amp_samples += dropped
+        gaps = self._find_gaps(t, data)
+        lost = sum(count for _, count in gaps)
+        self.amp_samples += len(data) + lost
+        if dropped:
+            gaps.insert(0, (0, dropped))
+        if not gaps:
+            return data, marker
+        fs = self.amp.get_sampling_frequency()
+        inserted = 0
+        for pos, count in gaps:
+            logger.warning('Lost %d samples at sample %d.' % (count, offset + pos + inserted))
+            self.gaps.append([offset + pos + inserted, count])
+            if self.fill_gaps:
+                inserted += count
+        if self.fill_gaps:
+            positions = np.repeat([pos for pos, _ in gaps], [count for _, count in gaps])
+            data = np.insert(data.astype(np.float64), positions, np.nan, axis=0)
+            shifted = []
+            for ts, m in marker:
+                ts_shifted = ts
+                for pos, count in gaps:
+                    # the markers of dropped blocks lie within the gap
+                    start = -1000 * dropped / fs if pos == 0 else 1000 * pos / fs
+                    if ts >= start:
+                        ts_shifted += 1000 * count / fs
+                shifted.append([ts_shifted, m])
+            marker = shifted
+        return data, marker
+
+    def _reset_stats(self):
+        self._overflows = 0
+        self._dropped_samples = 0
+        self._dropped_pending = 0
+        self._lag = 0
+        self._lagging = False
+
+    def _acquisition_loop(self):
+        """Read the low level amplifier until stopped.
+
+        This method runs in the acquisition thread. Each block is put
+        together with the time it was received into the queue. If the
+        queue is full, the oldest block is dropped, its samples are
+        counted in the next block in the queue and its markers are
+        moved there.
 
         """
-        # if we don't set the writable flag to false, the UDP socket
-        # will signal that it is ready to send data on every iteration
-        # of the asycore loop, which will cause massive CPU strain. this
-        # is not the case for TCP sockets, but doesn't hurt either.
-        return False
+        fs = self.amp.get_sampling_frequency()
+        while self._acquisition_running.is_set():
+            try:
+                data, marker = self.amp.get_data()
+            except Exception as e:
+                if self._acquisition_running.is_set():
+                    logger.error('Error while reading from the amplifier, stopping acquisition thread.', exc_info=True)
+                with self._blocks_cond:
+                    self._acquisition_error = e
+                    self._blocks_cond.notify()
+                return
+            t = self.host_clock.time()
+            if len(data) == 0 and not marker:
+                # nothing to queue, don't spin on an amplifier that
+                # returns immediately
+                self.host_clock.sleep(0.001)
+                continue
+            # [arrival time, data, markers, samples dropped before]
+            block = [t, data, list(marker), 0]
+            with self._blocks_cond:
+                if len(self._blocks) >= self.queue_size:
+                    _, old_data, old_marker, old_dropped = self._blocks.popleft()
+                    self._overflows += 1
+                    self._dropped_samples += len(old_data)
+                    head = self._blocks[0] if self._blocks else block
+                    duration = 1000 * len(old_data) / fs
+                    head[2][:0] = [[ts - duration, m] for ts, m in old_marker]
+                    head[3] += old_dropped + len(old_data)
+                self._blocks.append(block)
+                self._blocks_cond.notify()
+
+    def _get_queued_blocks(self):
+        """Get all blocks received by the acquisition thread.
+
+        Blocks until at least one block is available.
 
-    def collect_incoming_data(self, data):
-        """Got potentially partial data packet.
+        Returns
+        -------
+        blocks : list of (float, 2darray, list, int)
+            the blocks as (arrival time, data, markers, samples dropped
+            before the block)
 
-        This method collects potentially incomplete data packets and
-        records the timestamp when the first part of the incomplete data
-        packet arrived.
+        """
+        with self._blocks_cond:
+            while not self._blocks and self._acquisition_error is None:
+                # waiting with a timeout keeps the thread interruptible
+                self._blocks_cond.wait(0.1)
+            if self._acquisition_error is not None and not self._blocks:
+                raise self._acquisition_error
+            blocks = list(self._blocks)
+            self._blocks.clear()
+        return blocks
+
+    def _merge_blocks(self, blocks):
+        """Merge blocks into a single block.
 
         Parameters
         ----------
-        data : str
-            the data packet
+        blocks : list of (float, 2darray, list, int)
+            the blocks as (arrival time, data, markers, samples dropped
+            before the block)
+
+        Returns
+        -------
+        data : 2darray
+            the concatenated data of all blocks
+        markers : list of (float, str)
+            the markers of all blocks, the timestamps are relative to
+            the onset of ``data``
 
         """
-        if self.timestamp is None:
-            self.timestamp = time.time()
-        #logger.debug('Received maybe incomlete data: {data}'.format(data=data))
-        self.data = self.data + data
+        if len(blocks) == 1:
+            _, data, marker, _ = blocks[0]
+            return data, list(marker)
+        fs = self.amp.get_sampling_frequency()
+        markers = []
+        offset = 0
+        for _, data, marker, _ in blocks:
+            markers.extend([[ts + 1000 * offset / fs, m] for ts, m in marker])
+            offset += len(data)
+        data = np.concatenate([data for _, data, _, _ in blocks])
+        return data, markers
 
-    def found_terminator(self):
-        """Found a complete packet.
 
-        A complete data packet has arrived. Put the data packet with its
-        timestamp in the queue. And reset the timestamp.
+class BlockStream(object):
+    """Asynchronous iterator wrapping a blocking block iterator.
 
-        """
-        # to something with data
-        #logger.debug('Received {data}'.format(data=self.data))
-        self.queue.put([self.timestamp, self.data])
-        self.data = ''
-        self.timestamp = None
+    See :meth:`AmpDecorator.stream`.
 
-    def handle_error(self):
-        """An error occurred.
+    """
 
-        """
-        logger.error('An error occurred.')
-        self.close()
-        # the default implementation prints a condensed tracebackk which
-        # is not useful at all, so we re-raise the exception
-        raise
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.executor = None
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        from concurrent.futures import ThreadPoolExecutor
+        # the blocks are read by a single thread, so overlapping awaits
+        # are served one after the other and in order, instead of
+        # driving the generator concurrently
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        return _Awaitable(self.executor.submit(self._next_block))
+
+    def _next_block(self):
+        try:
+            return next(self.blocks)
+        except StopIteration:
+            self.executor.shutdown(wait=False)
+            raise StopAsyncIteration
+
+
+class _Awaitable(object):
+    """Awaitable of a :class:`concurrent.futures.Future`.
+
+    The future is wrapped when it is awaited, so it belongs to the
+    event loop awaiting it.
+
+    """
+
+    def __init__(self, future):
+        self.future = future
 
+    def __await__(self):
+        import asyncio
+        return asyncio.wrap_future(self.future).__await__()
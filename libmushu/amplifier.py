@@ -160,6 +160,22 @@ class Amplifier(object):
         """
         raise NotImplementedError
 
+    def get_counter(self):
+        """Return the sample counter channel, if the amplifier has one.
+
+        Some amplifiers send a counter with every sample, which allows
+        for detecting lost samples. The counter is increased by one for
+        every sample and wraps around to zero at ``modulo``.
+
+        Returns
+        -------
+        counter : (int, int) or None
+            the index of the counter channel and the modulo of the
+            counter, or None if the amplifier has no sample counter
+
+        """
+        return None
+
     def get_sampling_frequency(self):
         """Return the sampling frequency.
 
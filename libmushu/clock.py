@@ -0,0 +1,123 @@
+# clock.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""
+This module provides the clocks used by the simulated amplifiers and
+the :class:`libmushu.ampdecorator.AmpDecorator`.
+
+By default the system clock is used. For tests and reproducible
+benchmarks a :class:`VirtualClock` can be injected, whose ``sleep``
+returns immediately and advances the time instead::
+
+    clock = VirtualClock()
+    amp = AmpDecorator(SinusAmp, clock=clock)
+    amp.start()
+    # a thousand simulated seconds, in milliseconds
+    while clock.time() < 1000:
+        data, marker = amp.get_data()
+
+The simulated amplifiers have a class attribute ``clock`` which can also
+be replaced per instance.
+
+"""
+
+
+from __future__ import division
+
+import threading
+import time
+
+
+class Clock(object):
+    """The interface of a clock."""
+
+    def time(self):
+        """Get the current time in seconds since the epoch."""
+        raise NotImplementedError
+
+    def monotonic(self):
+        """Get the time in seconds of a clock that never goes back.
+
+        Use this clock for measuring intervals and pacing, it is not
+        affected by changes of the system time.
+
+        """
+        raise NotImplementedError
+
+    def sleep(self, seconds):
+        """Wait for the given number of seconds."""
+        raise NotImplementedError
+
+
+class SystemClock(Clock):
+    """The clock of the operating system."""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        # Python 2 has no monotonic clock
+        return getattr(time, 'monotonic', time.time)()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """A deterministic clock for tests and benchmarks.
+
+    The time only advances by :meth:`sleep` and :meth:`advance`, both
+    return immediately. The clock can be shared between threads.
+
+    """
+
+    def __init__(self, start=0):
+        """Initialize the clock.
+
+        Parameters
+        ----------
+        start : float, optional
+            the initial time in seconds
+
+        """
+        self.now = start
+        self.lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.advance(max(0, seconds))
+
+    def advance(self, seconds):
+        """Advance the time.
+
+        Parameters
+        ----------
+        seconds : float
+
+        """
+        with self.lock:
+            self.now += seconds
+
+
+system_clock = SystemClock()
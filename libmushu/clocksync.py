@@ -0,0 +1,219 @@
+# clocksync.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""
+This module provides the :class:`ClockRegression` class, which maps the
+sample counter of an amplifier to the clock of the host.
+
+Amplifiers have their own sample clock which drifts relative to the
+clock of the host, over a long recording by hundreds of milliseconds.
+
+The time at which a block of data arrives at the host is subject to
+jitter from the USB bus and the scheduling of the operating system.
+Instead of using the arrival time of each block directly, the
+:class:`ClockRegression` fits a line through all pairs of (number of
+received samples, arrival time) and uses the fitted line to timestamp
+the samples.
+
+"""
+
+
+from __future__ import division
+
+import math
+
+
+class ClockRegression(object):
+    """Online linear regression of host time over sample count.
+
+    The regression uses exponentially weighted statistics, so old
+    observations are slowly forgotten and the fit follows changes of
+    the amplifier's clock.
+
+    Examples
+    --------
+
+    >>> clock = ClockRegression(fs=100)
+    >>> clock.update(10, 1000.1)
+    >>> clock.update(20, 1000.2)
+    >>> round(clock.time_of(15), 6)
+    1000.15
+
+    """
+
+    def __init__(self, fs, forgetting=0.9999):
+        """Initialize the regression.
+
+        Parameters
+        ----------
+        fs : float
+            the nominal sampling frequency, used as long as there are
+            not enough observations for a fit
+        forgetting : float, optional
+            the weight of the previous observations is multiplied with
+            this factor for every new observation. A value of 1 never
+            forgets, smaller values track changes faster but give
+            noisier estimates.
+
+        """
+        self.fs = fs
+        self.forgetting = forgetting
+        self.reset()
+
+    def reset(self):
+        """Forget all observations."""
+        self.updates = 0
+        # all times are relative to the first observation to keep
+        # the numbers small
+        self.t_ref = None
+        self._weight = 0.
+        self._mean_n = 0.
+        self._mean_t = 0.
+        self._var_n = 0.
+        self._cov_nt = 0.
+        self._var_residual = 0.
+
+    def update(self, n, t):
+        """Add an observation.
+
+        Parameters
+        ----------
+        n : int
+            the number of samples received so far
+        t : float
+            the time at which the ``n``-th sample was received
+
+        """
+        if self.t_ref is None:
+            self.t_ref = t
+        t = t - self.t_ref
+        self._weight = self.forgetting * self._weight + 1
+        alpha = 1 / self._weight
+        if self.updates > 0:
+            residual = t - self._time_of(n)
+            self._var_residual = ((1 - alpha) * self._var_residual +
+                                  alpha * residual ** 2)
+        dn = n - self._mean_n
+        dt = t - self._mean_t
+        self._mean_n += alpha * dn
+        self._mean_t += alpha * dt
+        self._var_n = (1 - alpha) * (self._var_n + alpha * dn * dn)
+        self._cov_nt = (1 - alpha) * (self._cov_nt + alpha * dn * dt)
+        self.updates += 1
+
+    @property
+    def slope(self):
+        """The estimated duration of one sample in seconds."""
+        if self.updates < 2 or self._var_n <= 0:
+            return 1 / self.fs
+        return self._cov_nt / self._var_n
+
+    @property
+    def drift(self):
+        """The relative deviation of the sample duration from nominal.
+
+        Positive values mean the amplifier is slower than its nominal
+        sampling frequency.
+
+        """
+        return self.slope * self.fs - 1
+
+    @property
+    def effective_fs(self):
+        """The estimated effective sampling frequency in Hz.
+
+        This is the sampling frequency of the amplifier measured with
+        the clock of the host.
+
+        """
+        return 1 / self.slope
+
+    @property
+    def jitter(self):
+        """The standard deviation of the arrival times in seconds."""
+        return math.sqrt(self._var_residual)
+
+    def _time_of(self, n):
+        return self._mean_t + self.slope * (n - self._mean_n)
+
+    def time_of(self, n):
+        """Get the host time of a sample.
+
+        Parameters
+        ----------
+        n : float
+            the sample counter
+
+        Returns
+        -------
+        t : float
+            the estimated host time at which the sample counter was
+            ``n``
+
+        Raises
+        ------
+        ValueError : if there were no observations yet
+
+        """
+        if self.t_ref is None:
+            raise ValueError('No observations yet.')
+        return self.t_ref + self._time_of(n)
+
+    def sample_of(self, t):
+        """Get the sample counter at a given host time.
+
+        This is the inverse of :meth:`time_of` and can be used to
+        convert times measured with the clock of the host, like the
+        arrival times of network markers, into sample time.
+
+        Parameters
+        ----------
+        t : float
+            the host time
+
+        Returns
+        -------
+        n : float
+            the estimated (fractional) sample counter at time ``t``
+
+        Raises
+        ------
+        ValueError : if there were no observations yet
+
+        """
+        if self.t_ref is None:
+            raise ValueError('No observations yet.')
+        return self._mean_n + (t - self.t_ref - self._mean_t) / self.slope
+
+    def to_dict(self):
+        """Get the fitted mapping.
+
+        The host time of a sample ``n`` can be calculated from the
+        returned values as ``Offset + n * Slope``.
+
+        Returns
+        -------
+        mapping : dict
+
+        """
+        return {'Offset': self.time_of(0) if self.t_ref is not None else None,
+                'Slope': self.slope,
+                'Drift': self.drift,
+                'Effective Sampling Frequency': self.effective_fs,
+                'Jitter': self.jitter,
+                'Updates': self.updates}
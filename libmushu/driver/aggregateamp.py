@@ -0,0 +1,307 @@
+# aggregateamp.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+from __future__ import division
+
+from collections import deque
+import logging
+import threading
+
+import numpy as np
+
+from libmushu.amplifier import Amplifier
+from libmushu.clock import system_clock
+from libmushu.clocksync import ClockRegression
+
+
+logger = logging.getLogger(__name__)
+logger.info('Logger started.')
+
+
+class AggregateAmp(Amplifier):
+    """Pseudo Amplifier combining several amplifiers into one.
+
+    This amplifier reads several low level amplifiers concurrently, each
+    one in its own thread, and combines their data into a single stream.
+    The fastest amplifier is the master, its samples define the time
+    line of the combined stream. The samples of the other amplifiers are
+    mapped onto this time line via a
+    :class:`libmushu.clocksync.ClockRegression` per amplifier and
+    linearly interpolated. The markers of all amplifiers are merged.
+
+    Examples
+    --------
+
+    >>> amp = libmushu.get_amp('aggregateamp')
+    >>> amp.configure(amps=[('gusbamp', {}),
+    ...                     ('randomamp', {'fs': 50, 'channels': 2})])
+    >>> amp.start()
+    >>> while True:
+    ...     data, marker = amp.get_data()
+    ...     # do something with data and/or break the loop
+    >>> amp.stop()
+
+    """
+
+    def __init__(self):
+        self.amps = []
+
+    def configure(self, amps, master=None):
+        """Configure the amplifiers to combine.
+
+        Parameters
+        ----------
+        amps : list
+            the amplifiers. Each element is either a configured low
+            level amplifier instance or a tuple of the name of an
+            amplifier (see :data:`libmushu.supported_amps`) and the
+            keyword arguments for its ``configure`` method.
+        master : int, optional
+            the index of the master amplifier, defaults to the one with
+            the highest sampling frequency
+
+        """
+        # avoid a circular import
+        import libmushu
+        self.amps = []
+        for amp in amps:
+            if not isinstance(amp, Amplifier):
+                name, config = amp
+                amp = libmushu.get_driver(name)()
+                amp.configure(**config)
+            self.amps.append(amp)
+        if master is None:
+            fs = [amp.get_sampling_frequency() for amp in self.amps]
+            master = fs.index(max(fs))
+        self.master = master
+        self.channels = []
+        for i, amp in enumerate(self.amps):
+            for name in amp.get_channels():
+                if name in self.channels:
+                    name = '%s (amp %d)' % (name, i)
+                self.channels.append(name)
+
+    def start(self):
+        self.cond = threading.Condition()
+        self.streams = [Stream(amp, self.cond) for amp in self.amps]
+        # the number of master samples already returned
+        self.pos = 0
+        # markers as (host time, marker)
+        self.markers = []
+        self.running = threading.Event()
+        self.running.set()
+        for stream in self.streams:
+            stream.amp.start()
+        self.threads = []
+        for stream in self.streams:
+            thread = threading.Thread(target=stream.read, args=(self.running,),
+                                      name='AggregateAmp-%s' % stream.amp.__class__.__name__)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.running.clear()
+        # a reader may be blocked in get_data of its amplifier, don't
+        # wait for it forever. it stops at its next block, or with an
+        # error once its amplifier is stopped
+        for thread in self.threads:
+            thread.join(1)
+            if thread.is_alive():
+                logger.warning('%s did not stop in time.' % thread.name)
+        for stream in self.streams:
+            stream.amp.stop()
+
+    def get_data(self):
+        """Get the combined data of all amplifiers.
+
+        Blocks until new data for all amplifiers is available.
+
+        Raises
+        ------
+        Exception : the exception raised by the ``get_data`` of one of
+            the amplifiers
+
+        Returns
+        -------
+        chunk, markers: Markers is time in ms since relative to the
+        first sample of that block.
+
+        """
+        master = self.streams[self.master]
+        slaves = [s for i, s in enumerate(self.streams) if i != self.master]
+        while True:
+            with self.cond:
+                while not any(s.blocks or s.error for s in self.streams):
+                    self.cond.wait(0.1)
+                for stream in self.streams:
+                    if stream.error is not None:
+                        raise stream.error
+                for stream in self.streams:
+                    stream.collect(self.markers)
+            n = len(master.data)
+            if n == 0:
+                continue
+            # host times of the pending master samples
+            times = master.sample_clock.time_of(np.arange(self.pos, self.pos + n))
+            # only return samples all slaves already have data for
+            positions = []
+            for slave in slaves:
+                if slave.sample_clock.updates == 0:
+                    n = 0
+                    break
+                p = slave.sample_clock.sample_of(times)
+                n = min(n, np.searchsorted(p, slave.received - 1, side='right'))
+                positions.append(p)
+            if n > 0:
+                break
+        data = [master.data[:n]]
+        for slave, p in zip(slaves, positions):
+            data.append(slave.interpolate(p[:n]))
+        # restore the order of the amplifiers
+        data.insert(self.master, data.pop(0))
+        data = np.hstack(data)
+        master.data = master.data[n:]
+        # merge the markers of all amplifiers
+        fs = master.amp.get_sampling_frequency()
+        t_end = master.sample_clock.time_of(self.pos + n)
+        markers = []
+        pending = []
+        for t, m in self.markers:
+            if t < t_end:
+                markers.append([(master.sample_clock.sample_of(t) - self.pos) * 1000 / fs, m])
+            else:
+                pending.append((t, m))
+        self.markers = pending
+        self.pos += n
+        return data, sorted(markers)
+
+    def get_channels(self):
+        return self.channels
+
+    def get_sampling_frequency(self):
+        return self.amps[self.master].get_sampling_frequency()
+
+    @staticmethod
+    def is_available():
+        """The AggregateAmp is never listed as available.
+
+        It has to be configured with the amplifiers to combine, see
+        :meth:`configure`.
+
+        """
+        return False
+
+
+class Stream(object):
+    """The data of one amplifier of the :class:`AggregateAmp`."""
+
+    def __init__(self, amp, cond):
+        self.amp = amp
+        self.cond = cond
+        self.fs = amp.get_sampling_frequency()
+        # the clock of the arrival times, the regression maps the index
+        # of a sample to the time it arrived
+        self.clock = getattr(amp, 'clock', system_clock)
+        self.sample_clock = ClockRegression(self.fs)
+        # blocks received by the reader thread
+        self.blocks = deque()
+        # samples not yet returned and the number of samples received
+        self.data = np.empty((0, len(amp.get_channels())))
+        self.received = 0
+        # the exception that stopped the reader thread
+        self.error = None
+
+    def read(self, running):
+        """Read the amplifier until ``running`` is cleared.
+
+        This method runs in a separate thread. If the amplifier raises
+        an exception, it is stored in :attr:`error` and the thread
+        stops.
+
+        """
+        while running.is_set():
+            try:
+                data, marker = self.amp.get_data()
+            except Exception as e:
+                if running.is_set():
+                    logger.error('Error while reading from %s, stopping its reader thread.' % self.amp,
+                                 exc_info=True)
+                with self.cond:
+                    self.error = e
+                    self.cond.notify()
+                return
+            t = self.clock.time()
+            with self.cond:
+                self.blocks.append((t, data, marker))
+                self.cond.notify()
+
+    def collect(self, markers):
+        """Move the received blocks into the buffer.
+
+        Must be called with the lock held.
+
+        Parameters
+        ----------
+        markers : list
+            the markers of the blocks are appended to this list as
+            (host time, marker)
+
+        """
+        blocks = list(self.blocks)
+        self.blocks.clear()
+        new_data = [self.data]
+        for t, data, marker in blocks:
+            if len(data) == 0:
+                continue
+            start = self.received
+            self.received += len(data)
+            # the block arrived with its last sample
+            self.sample_clock.update(self.received - 1, t)
+            new_data.append(data)
+            for ts, m in marker:
+                markers.append((self.sample_clock.time_of(start + ts * self.fs / 1000), m))
+        if len(new_data) > 1:
+            self.data = np.concatenate(new_data)
+
+    def interpolate(self, positions):
+        """Interpolate the buffered data at the given positions.
+
+        The samples before the last position are removed from the
+        buffer afterwards.
+
+        Parameters
+        ----------
+        positions : 1darray
+            the (fractional) sample positions, counted from the first
+            sample ever received
+
+        Returns
+        -------
+        data : 2darray
+
+        """
+        base = self.received - len(self.data)
+        p = np.clip(positions - base, 0, len(self.data) - 1)
+        i = np.minimum(np.floor(p).astype(int), max(len(self.data) - 2, 0))
+        f = (p - i)[:, np.newaxis]
+        j = np.minimum(i + 1, len(self.data) - 1)
+        data = self.data[i] * (1 - f) + self.data[j] * f
+        if len(positions):
+            self.data = self.data[i[-1]:]
+        return data
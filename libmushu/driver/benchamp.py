@@ -0,0 +1,147 @@
+# benchamp.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from __future__ import division
+
+import numpy as np
+
+from libmushu.amplifier import Amplifier
+from libmushu.clock import system_clock
+
+
+PRESETS = [['20kHz, 512 Channels, no sleep',
+            {'fs': 20000, 'channels': 512, 'realtime': False}],
+           ['20kHz, 512 Channels, 100 markers/s',
+            {'fs': 20000, 'channels': 512, 'marker_rate': 100}]
+           ]
+
+
+class BenchAmp(Amplifier):
+    """An amplifier that produces synthetic data at high rates.
+
+    The data is not generated per block but sliced from a buffer which
+    is computed once in :meth:`configure`. Every channel is a sine wave
+    with a whole number of periods in the buffer, so the data is phase
+    continuous when the buffer wraps around. The blocks are read-only
+    views on the buffer, producing a block costs almost nothing, which
+    makes this amplifier suitable for load testing everything behind
+    it.
+
+    """
+
+    # the clock used for pacing, see libmushu.clock
+    clock = system_clock
+
+    presets = PRESETS
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self, fs=1000, channels=16, dtype=np.float32, blocksize=None,
+                  marker_rate=0, realtime=True, buffer_seconds=1):
+        """Configure the amplifier.
+
+        Parameters
+        ----------
+        fs : int, optional
+            the sampling frequency
+        channels : int, optional
+            the number of channels
+        dtype : numpy dtype, optional
+            the data type of the samples, integer types get an
+            amplitude of 1000
+        blocksize : int, optional
+            the number of samples per block, defaults to 1/100 s
+        marker_rate : float, optional
+            the number of markers per second
+        realtime : bool, optional
+            if True, :meth:`get_data` blocks until the next block is due
+            and returns all blocks that are due, like a real amplifier.
+            If False, every call returns the next block immediately.
+        buffer_seconds : int, optional
+            the length of the precomputed buffer in seconds
+
+        """
+        self.fs = fs
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.blocksize = blocksize if blocksize else max(1, fs // 100)
+        self.marker_rate = marker_rate
+        self.realtime = realtime
+        n = max(int(fs * buffer_seconds), self.blocksize)
+        # whole periods per buffer: 1 to 40 Hz
+        periods = buffer_seconds * (np.arange(channels) % 40 + 1)
+        phase = 2 * np.pi * np.arange(n)[:, np.newaxis] / n
+        data = np.sin(phase * periods)
+        if self.dtype.kind in 'iu':
+            data *= 1000
+            if self.dtype.kind == 'u':
+                data += 1000
+        # the buffer is extended by its beginning, so every block of up
+        # to max_samples is a contiguous slice
+        self.max_samples = min(n, 10 * self.blocksize)
+        data = data.astype(self.dtype)
+        self.buffer = np.concatenate([data, data[:self.max_samples]])
+        self.buffer.flags.writeable = False
+        self.buffer_len = n
+
+    def start(self):
+        self.t_start = self.clock.monotonic()
+        self.pos = 0
+        self.markers = 0
+
+    def get_data(self):
+        if self.realtime:
+            # absolute deadlines, so errors of the sleep do not
+            # accumulate
+            now = self.clock.monotonic()
+            due = int((now - self.t_start) * self.fs) // self.blocksize * self.blocksize
+            if due <= self.pos:
+                due = self.pos + self.blocksize
+                self.clock.sleep(max(0, self.t_start + due / self.fs - now))
+            samples = due - self.pos
+        else:
+            samples = self.blocksize
+        # if we are late, at most ten blocks are returned per call, the
+        # rest is returned by the next calls
+        samples = min(samples, self.max_samples)
+        start = self.pos % self.buffer_len
+        data = self.buffer[start:start+samples]
+        markers = self._get_markers(samples)
+        self.pos += samples
+        return data, markers
+
+    def _get_markers(self, samples):
+        """Get the markers of the next ``samples`` samples."""
+        if not self.marker_rate:
+            return []
+        # the n-th marker is at sample n * fs / marker_rate
+        end = int(np.ceil((self.pos + samples) * self.marker_rate / self.fs))
+        n = np.arange(self.markers, end)
+        ts = (n * self.fs / self.marker_rate - self.pos) * 1000 / self.fs
+        self.markers = end
+        return [[t, str(i % 256)] for t, i in zip(ts.tolist(), n.tolist())]
+
+    def get_channels(self):
+        return ['Ch_%d' % i for i in range(self.channels)]
+
+    def get_sampling_frequency(self):
+        return self.fs
+
+    @staticmethod
+    def is_available():
+        return True
@@ -18,7 +18,9 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 
-from Crypto.Cipher import AES
+import errno
+import logging
+
 import numpy as np
 
 import usb.core
@@ -32,6 +34,23 @@ PRODUCT_ID = 0xed02
 
 ENDPOINT_IN = usb.util.ENDPOINT_IN | 2  # second endpoint
 
+LIBUSB_ERROR_TIMEOUT = -7
+
+
+logger = logging.getLogger(__name__)
+logger.info('Logger started')
+
+
+def is_timeout(error):
+    """Tell whether a :class:`usb.core.USBError` is a read timeout.
+
+    Depending on the backend and the version of pyusb, the timeout is
+    reported via the libusb error code or via ``errno``.
+
+    """
+    return (getattr(error, 'backend_error_code', None) == LIBUSB_ERROR_TIMEOUT or
+            error.errno == errno.ETIMEDOUT)
+
 
 class Epoc(Amplifier):
 
@@ -52,8 +71,11 @@ class Epoc(Amplifier):
         if self.dev.is_kernel_driver_active(1):
             self.dev.detach_kernel_driver(1)
         usb.util.claim_interface(self.dev, 1)
-        # prepare AES
-        self.cipher = AES.new(self.generate_key(serial, True))
+        # prepare AES, pycrypto is only imported when an Epoc is
+        # opened
+        from Crypto.Cipher import AES
+        self.cipher = AES.new(self.generate_key(serial, True), AES.MODE_ECB)
+        self.max_packets = 128
         # internal states for battery and impedance we have to store since it
         # is not sent with every frame.
         self._battery = 0
@@ -69,16 +91,52 @@ class Epoc(Amplifier):
                         'Quality T8', 'Quality F8', 'Quality AF4',
                         'Quality FC6', 'Quality F4']
 
+    def configure(self, max_packets=128):
+        """Configure the amplifier.
+
+        Parameters
+        ----------
+        max_packets : int, optional
+            the maximum number of packets returned by one call of
+            :meth:`get_data`
+
+        """
+        self.max_packets = max_packets
+
     def get_data(self):
+        """Get all available packets.
+
+        Blocks until the first packet arrives and reads all packets
+        that are already available afterwards, up to
+        :attr:`max_packets`. All packets are decrypted and decoded at
+        once.
+
+        """
+        raw = bytearray()
         try:
-            raw = self.dev.read(ENDPOINT_IN, 32, 1, timeout=1000)
-            raw = self.decrypt(raw)
-            data = self.parse_raw(raw)
-            data = np.array(data)
-        except Exception as e:
-            print e
-            data = np.array()
-        return data.reshape(1, -1), []
+            raw.extend(self.dev.read(ENDPOINT_IN, 32, timeout=1000))
+            while len(raw) < 32 * self.max_packets:
+                raw.extend(self.dev.read(ENDPOINT_IN, 32, timeout=1))
+        except usb.core.USBError as e:
+            # a timeout just means there are no more packets available,
+            # anything else is a real error
+            if not is_timeout(e):
+                raise
+            if not raw:
+                logger.error('Unable to read from the device: %s' % e)
+        packets = self.decrypt(raw)
+        return self.parse_raw(packets), []
+
+    def get_channels(self):
+        return self.channel
+
+    def get_sampling_frequency(self):
+        return 128
+
+    def get_counter(self):
+        # the counter runs from 0 to 127, every 129th packet is a
+        # battery packet which we report as counter 128
+        return 0, 129
 
     @staticmethod
     def is_available():
@@ -107,64 +165,141 @@ class Epoc(Amplifier):
         return key
 
     def decrypt(self, raw):
-        """Decrypt a raw package."""
-        data = self.cipher.decrypt(raw[:16]) + self.cipher.decrypt(raw[16:])
-        tmp = 0
-        for i in range(32):
-            tmp = tmp << 8
-            tmp += ord(data[i])
-        return tmp
-
-    def parse_raw(self, raw):
-        """Parse raw data."""
-        data = []
-        shift = 256
-        # 1x counter / battery (8 bit)
-        # if the first bit is not set, the remaining 7 bits are the counter
-        # otherwise the remaining bits are the battery
-        shift -= 8
-        tmp = (raw >> shift) & 0b11111111
-        if tmp & 0b10000000:
-            # battery
-            counter = 128
-            self._battery = tmp & 0b01111111
-        else:
-            # counter
-            counter = tmp & 0b01111111
-        data.append(counter)
-        data.append(self._battery)
-        # 7x data (14 bit)
-        for i in range(7):
-            shift -= 14
-            data.append((raw >> shift) & 0b11111111111111)
-        # 1x quality (14 bit)
-        # we assume it is the contact quality for an electrode, the counter
-        # gives the number of the electrode. since we only have 14 electrodes
-        # we only take the values from counters 0..13 and 64..77
-        shift -= 14
-        tmp = (raw >> shift) & 0b11111111111111
-        if counter < 128:
-            if counter % 64 < 14:
-                self._quality[counter % 64] = tmp
-        # 1x ??? (14 bit)
-        shift -= 14
-        # 7x data (14 bit)
-        for i in range(7):
-            shift -= 14
-            data.append((raw >> shift) & 0b11111111111111)
-        # 2x gyroscope (8 bit)
-        # the first bit denotes the sign the remaining 7 bits the number
-        for i in range(2):
-            shift -= 8
-            tmp = (raw >> shift) & 0b01111111
-            tmp -= 100
-            if (raw >> shift) & 0b10000000:
-                tmp *= -1
-            data.append(tmp)
-        # 1x ??? (8 bit)
-        shift -= 8
-        data.extend(self._quality)
-        return [int(i) for i in data]
+        """Decrypt raw packets.
+
+        The packets are encrypted with AES in ECB mode, i.e. each 16
+        byte block is encrypted independently, so any number of packets
+        can be decrypted with a single call.
+
+        Parameters
+        ----------
+        raw : bytes
+            one or more encrypted 32 byte packets
+
+        Returns
+        -------
+        packets : ndarray
+            the decrypted packets as (n_packets, 32) uint8 array
+
+        """
+        data = self.cipher.decrypt(bytes(bytearray(raw)))
+        return np.frombuffer(data, dtype=np.uint8).reshape(-1, 32)
+
+    def parse_raw(self, packets):
+        """Parse decrypted packets.
+
+        Parameters
+        ----------
+        packets : ndarray
+            the decrypted packets as (n_packets, 32) uint8 array
+
+        Returns
+        -------
+        data : ndarray
+            (n_packets, 32) array, one row per packet with the columns
+            as in :attr:`channel`
+
+        """
+        data, self._battery, self._quality = parse_packets(packets, self._battery, self._quality)
+        return data
+
+
+# bit offsets of the 14 bit fields in a packet
+DATA_OFFSETS = [8 + 14 * i for i in range(7)] + [134 + 14 * i for i in range(7)]
+QUALITY_OFFSET = 106
+# the weights of the bits of a 14 bit field, most significant first
+BIT_WEIGHTS = 2 ** np.arange(13, -1, -1)
+
+
+def parse_packets(packets, battery, quality):
+    """Parse decrypted packets.
+
+    A packet has 256 bits, the most significant bit first:
+
+    * 8 bit counter or battery: if the first bit is not set the
+      remaining 7 bits are the counter, otherwise the battery level
+    * 7x 14 bit data
+    * 14 bit contact quality, for the electrode given by the counter.
+      Since we only have 14 electrodes, we only take the values from
+      counters 0..13 and 64..77
+    * 14 bit unknown
+    * 7x 14 bit data
+    * 2x 8 bit gyroscope, the first bit is the sign
+    * 8 bit unknown
+
+    Battery level and contact quality are not sent with every packet,
+    the last received values are kept in a state that is passed from
+    one call to the next.
+
+    Parameters
+    ----------
+    packets : ndarray
+        the decrypted packets as (n_packets, 32) uint8 array
+    battery : int
+        the last known battery level
+    quality : list of ints
+        the last known contact quality of the 14 electrodes
+
+    Returns
+    -------
+    data : ndarray
+        (n_packets, 32) int array with counter, battery, 14 channels,
+        2 gyroscope values and 14 contact qualities per packet
+    battery : int
+        the updated battery level
+    quality : list of ints
+        the updated contact qualities
+
+    """
+    n = len(packets)
+    bits = np.unpackbits(packets, axis=1)
+    data = np.empty((n, 32), dtype=np.int64)
+    # counter and battery
+    first = packets[:, 0].astype(np.int64)
+    is_battery = first & 0b10000000 != 0
+    counter = np.where(is_battery, 128, first & 0b01111111)
+    data[:, 0] = counter
+    data[:, 1] = _forward_fill(np.where(is_battery, first & 0b01111111, 0),
+                               is_battery[:, np.newaxis], [battery])[:, 0]
+    # 14 channels
+    idx = np.add.outer(DATA_OFFSETS, np.arange(14))
+    data[:, 2:16] = bits[:, idx].dot(BIT_WEIGHTS)
+    # gyroscope
+    gyro = packets[:, 29:31].astype(np.int64)
+    data[:, 16:18] = np.where(gyro & 0b10000000, -1, 1) * ((gyro & 0b01111111) - 100)
+    # contact quality
+    value = bits[:, QUALITY_OFFSET:QUALITY_OFFSET+14].dot(BIT_WEIGHTS)
+    updated = (counter[:, np.newaxis] % 64 == np.arange(14)) & (counter < 128)[:, np.newaxis]
+    data[:, 18:32] = _forward_fill(value, updated, quality)
+    if n > 0:
+        battery = int(data[-1, 1])
+        quality = [int(i) for i in data[-1, 18:32]]
+    return data, battery, quality
+
+
+def _forward_fill(values, mask, initial):
+    """Carry values forward to the following rows.
+
+    Parameters
+    ----------
+    values : 1darray
+        a value per row
+    mask : 2darray of bool
+        (rows, columns) array, True where a column takes the value of
+        the row
+    initial : list
+        the value of each column before the first row
+
+    Returns
+    -------
+    filled : 2darray
+        (rows, columns) array, for every column the value of the last
+        row where the mask was True, or its initial value
+
+    """
+    rows = np.arange(len(values))[:, np.newaxis]
+    last = np.maximum.accumulate(np.where(mask, rows, -1), axis=0)
+    return np.where(last >= 0, np.asarray(values)[np.maximum(last, 0)], initial)
 
 
 if __name__ == '__main__':
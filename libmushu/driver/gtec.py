@@ -20,13 +20,15 @@
 
 # TODO: update to new version of pyusb
 
+import re
 import struct
 import time
 from exceptions import Exception
 import logging
+import threading
+from collections import deque
 
 import usb
-from scipy.signal import iirfilter
 import numpy as np
 
 from libmushu.amplifier import Amplifier
@@ -41,9 +43,25 @@ ID_VENDOR_GTEC2 = 0x15c3
 ID_PRODUCT_GUSB_AMP = 0x0001
 
 CX_OUT = usb.TYPE_VENDOR | usb.ENDPOINT_OUT
+CX_IN = usb.TYPE_VENDOR | usb.ENDPOINT_IN
+
+# a frame consists of one little endian float32 per channel
+FRAME_DTYPE = np.dtype('<f4')
+FRAME_SIZE = 17 * FRAME_DTYPE.itemsize
+
+ENDPOINT_IN = 0x86
 
 
 class GUSBamp(Amplifier):
+    """The g.USBamp amplifier.
+
+    Several g.USBamps can be daisy-chained via their sync cables to
+    record more than 16 channels, see :meth:`configure`. One of them is
+    the master which provides the sampling clock for the slaves, the
+    frames of all devices are merged into one block with 17 channels
+    per device.
+
+    """
 
     def __init__(self):
         logger.info('Initializing GUSBamp instance')
@@ -54,72 +72,189 @@ class GUSBamp(Amplifier):
                 if (device.idVendor in [ID_VENDOR_GTEC, ID_VENDOR_GTEC2] and
                     device.idProduct == ID_PRODUCT_GUSB_AMP):
                     self.amps.append(device)
-        self.devh = None
         self.mode = None
+        self.fs = None
+        # bulk transfer settings
+        self.transfer_size = 2028
+        self.transfer_timeout = 100
+        self.reader = False
+        self.queue_size = 256
+        # the channel of the sample counter, if enabled
+        self.counter = None
+        self.misaligned = 0
         # Initialize the amplifier and make it ready.
-        device = self.amps[0]
-        self.devh = device.open()
-        # detach kernel driver if nessecairy
-        config = device.configurations[0]
-        self.devh.setConfiguration(config)
-        assert(len(config.interfaces) > 0)
-        # sometimes it is the other one
-        first_interface = config.interfaces[0][0]
-        if first_interface is None:
-            first_interface = config.interfaces[0][1]
-        first_setting = first_interface.alternateSetting
-        self.devh.claimInterface(first_interface)
-        self.devh.setAltInterface(first_interface)
+        self.devices = [Device(self.amps[0])]
+        self.devh = self.devices[0].devh
+        # the opened devices by their index in self.amps
+        self._opened = {0: self.devices[0]}
+        self.initialize()
+
+    def initialize(self):
+        """Initialize all devices, the first one as master."""
         # initialization straight from the usb-dump
         self.set_mode('data')
-        self.devh.controlMsg(CX_OUT, 0xb6, value=0x80, buffer=0)
-        self.devh.controlMsg(CX_OUT, 0xb5, value=0x80, buffer=0)
-        self.devh.controlMsg(CX_OUT, 0xb9, value=0x00, buffer="\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0a\x0b\x0c\x0d\x0e\x0f\x10")
-        self.set_slave_mode(False)
-        self.devh.controlMsg(CX_OUT, 0xd3, value=0x01, buffer=0)
-        self.devh.controlMsg(CX_OUT, 0xca, value=0x01, buffer=0)
-        self.devh.controlMsg(CX_OUT, 0xc8, value=0x01, buffer="\x00"*16)
+        self._control(0xb6, value=0x80, buffer=0)
+        self._control(0xb5, value=0x80, buffer=0)
+        self._control(0xb9, value=0x00, buffer="\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0a\x0b\x0c\x0d\x0e\x0f\x10")
+        for i, device in enumerate(self.devices):
+            self.set_slave_mode(i > 0, device)
+        self._control(0xd3, value=0x01, buffer=0)
+        self._control(0xca, value=0x01, buffer=0)
+        self._control(0xc8, value=0x01, buffer="\x00"*16)
         self.set_common_reference()
         self.set_common_ground()
         self.set_calibration_mode('sine')
         self.set_sampling_ferquency(128, [False for i in range(16)], None, None)
 
+    def configure(self, transfer_size=2028, transfer_timeout=100, reader=False, queue_size=256,
+                  devices=None, counter=None):
+        """Configure the bulk transfers and the daisy-chained devices.
+
+        Parameters
+        ----------
+        transfer_size : int, optional
+            the number of bytes requested per bulk read
+        transfer_timeout : int, optional
+            the timeout of a bulk read in ms
+        reader : bool, optional
+            if True, a dedicated reader thread issues the bulk reads
+            back to back and buffers the results, so there is always a
+            read pending on the bus, independently of how often
+            :meth:`get_data` is called. With several devices, every
+            device always has its own reader thread.
+        queue_size : int, optional
+            the maximum number of bulk reads the reader thread buffers,
+            if the buffer is full the oldest reads are dropped
+        devices : list of str, optional
+            the serial numbers of the daisy-chained devices to use, the
+            first one is the master, the others are slaves. The devices
+            are initialized again, the other devices are released. If
+            None, the current devices are kept.
+        counter : int, optional
+            the channel (0-16) which carries the sample counter of each
+            device, if the counter is enabled. The counters of all
+            devices are compared for every merged frame and mismatches
+            are counted in :attr:`misaligned`.
+
+        Raises
+        ------
+        AmpError : if a device with one of the serial numbers is not
+            connected
+
+        """
+        self.transfer_size = transfer_size
+        self.transfer_timeout = transfer_timeout
+        self.reader = reader
+        self.queue_size = queue_size
+        self.counter = counter
+        if devices is None:
+            return
+        for i, amp in enumerate(self.amps):
+            if i not in self._opened:
+                self._opened[i] = Device(amp)
+        try:
+            available = dict((device.get_serial(), device) for device in self._opened.values())
+            missing = [serial for serial in devices if serial not in available]
+            if missing:
+                raise AmpError('Devices not connected: %s' % ', '.join(missing))
+            self.devices = [available[serial] for serial in devices]
+        finally:
+            # release the devices which are not used
+            for i, device in list(self._opened.items()):
+                if device not in self.devices:
+                    device.close()
+                    del self._opened[i]
+        self.devh = self.devices[0].devh
+        self.initialize()
+
     def start(self):
-        self.devh.controlMsg(CX_OUT, 0xb5, value=0x08, buffer=0)
-        self.devh.controlMsg(CX_OUT, 0xf7, value=0x00, buffer=0)
+        self.misaligned = 0
+        for device in self.devices:
+            device.reset()
+            if self.reader or len(self.devices) > 1:
+                device.start_reader(self.transfer_size, self.transfer_timeout, self.queue_size)
+        # the slaves have to be started before the master, otherwise
+        # they miss the first clock pulses
+        for device in reversed(self.devices):
+            device.control(0xb5, value=0x08, buffer=0)
+            device.control(0xf7, value=0x00, buffer=0)
 
     def stop(self):
-        self.devh.controlMsg(CX_OUT, 0xb8, [])
+        for device in self.devices:
+            device.control(0xb8, [])
+        for device in self.devices:
+            device.stop_reader()
 
     def get_data(self):
-        """Get data."""
-        # TODO: should we use numpy arrays right here?
-        # TODO: what is the in-endpoint
-        # 0x2 or 0x86
-        endpoint = 0x86
-        # TODO what is the optimal number here
-        size = 2028 #512
-        try:
-            # TODO what is the optimal timeout here?
-            data = self.devh.bulkRead(endpoint, size, 100)
-        except usb.USBError:
-            data = []
-        data = ''.join(map(chr, data))
-        data = np.fromstring(data, np.float32, len(data)/4)
-        try:
-            data = data.reshape(-1, 17)
-        except:
-            logger.error("Got incomplete packet from the amp, discarding it!")
-            data = np.array([]).reshape(-1, 17)
+        """Get data.
+
+        With several devices, only the frames which were received from
+        all devices are returned, the others are kept for the next
+        call.
+
+        """
+        if len(self.devices) == 1:
+            device = self.devices[0]
+            if self.reader:
+                data, _ = device.get_queued_frames(self.transfer_timeout)
+            else:
+                data = device.decode(device.bulk_read(self.transfer_size, self.transfer_timeout))
+        else:
+            for device in self.devices:
+                device.buffer(*device.get_queued_frames(self.transfer_timeout))
+            data = self._merge()
         if self.mode == 'impedance':
             data = self.calculate_impedance(data)
         elif self.mode == 'data':
             # get data in mV
-            data /= 8.15
+            data = data / 8.15
         return data, []
 
+    def _merge(self):
+        """Merge the frames all devices have received.
+
+        The frames are aligned by their position since the start, a
+        frame which was dropped on one device is dropped on all
+        devices.
+
+        Returns
+        -------
+        data : 2darray
+            (frames, 17 * devices) array
+
+        """
+        # discard the frames which were already discarded on another
+        # device
+        start = max(device.position for device in self.devices)
+        for device in self.devices:
+            device.discard(min(start - device.position, len(device.pending)))
+        n = min(len(device.pending) for device in self.devices)
+        data = np.hstack([device.pending[:n] for device in self.devices])
+        valid = np.all([device.valid[:n] for device in self.devices], axis=0)
+        for device in self.devices:
+            device.discard(n)
+        if not valid.all():
+            logger.error('Dropping %d frames which were lost on another device.' %
+                         np.count_nonzero(~valid))
+            data = data[valid]
+        if self.counter is not None and n > 0:
+            counters = data[:, self.counter::17]
+            misaligned = np.count_nonzero((counters != counters[:, :1]).any(axis=1))
+            if misaligned:
+                self.misaligned += misaligned
+                logger.error('The sample counters of %d frames do not match.' % misaligned)
+        return data
+
+    @property
+    def overflows(self):
+        """The number of bulk reads dropped by the reader threads."""
+        return sum(device.overflows for device in self.devices)
+
     def get_channels(self):
-        return [str(i) for i in range(17)]
+        return [str(i) for i in range(17 * len(self.devices))]
+
+    def get_sampling_frequency(self):
+        return self.fs
 
     @staticmethod
     def is_available():
@@ -130,6 +265,11 @@ class GUSBamp(Amplifier):
                     return True
         return False
 
+    def _control(self, request, buffer, value=0):
+        """Send a vendor request to all devices."""
+        for device in self.devices:
+            device.control(request, buffer, value=value)
+
     ###########################################################################
     # Low level amplifier methods
     ###########################################################################
@@ -137,16 +277,16 @@ class GUSBamp(Amplifier):
     def set_mode(self, mode):
         """Set mode, 'impedance', 'data'."""
         if mode == 'impedance':
-            self.devh.controlMsg(CX_OUT, 0xc9, value=0x00, buffer=0)
-            self.devh.controlMsg(CX_OUT, 0xc2, value=0x03, buffer=0)
+            self._control(0xc9, value=0x00, buffer=0)
+            self._control(0xc2, value=0x03, buffer=0)
             self.mode = 'impedance'
         elif mode == 'calibrate':
-            self.devh.controlMsg(CX_OUT, 0xc1, value=0x00, buffer=0)
-            self.devh.controlMsg(CX_OUT, 0xc2, value=0x02, buffer=0)
+            self._control(0xc1, value=0x00, buffer=0)
+            self._control(0xc2, value=0x02, buffer=0)
             self.mode = 'calibration'
         elif mode == 'data':
-            self.devh.controlMsg(CX_OUT, 0xc0, value=0x00, buffer=0)
-            self.devh.controlMsg(CX_OUT, 0xc2, value=0x01, buffer=0)
+            self._control(0xc0, value=0x00, buffer=0)
+            self._control(0xc2, value=0x01, buffer=0)
             self.mode = 'data'
         else:
             raise AmpError('Unknown mode: %s' % mode)
@@ -167,6 +307,9 @@ class GUSBamp(Amplifier):
         # we get 18 coeffs and put them in as '<d' in the buffer
         # struct.pack('<'+'d'*18, *coeffs)
 
+        # scipy is slow to import and only needed here
+        from scipy.signal import iirfilter
+
         # special filter: means no filter
         null_filter = "\x00\x00\x00\x00\x00\x00\xf0\x3f"+"\x00\x00\x00\x00\x00\x00\x00\x00"*17
 
@@ -198,18 +341,19 @@ class GUSBamp(Amplifier):
 
         # set the filters for all channels
         if bpfilter == notchfilter == None:
-            self.devh.controlMsg(CX_OUT, 0xc6, value=0x01, buffer=bp_filter)
-            self.devh.controlMsg(CX_OUT, 0xc7, value=0x01, buffer=bs_filter)
+            self._control(0xc6, value=0x01, buffer=bp_filter)
+            self._control(0xc7, value=0x01, buffer=bs_filter)
         else:
             idx = 1
             for i in channels:
                 if i:
-                    self.devh.controlMsg(CX_OUT, 0xc6, value=idx, buffer=bp_filter)
-                    self.devh.controlMsg(CX_OUT, 0xc7, value=idx, buffer=bs_filter)
+                    self._control(0xc6, value=idx, buffer=bp_filter)
+                    self._control(0xc7, value=idx, buffer=bs_filter)
                 idx += 1
 
         # set the sampling frequency
-        self.devh.controlMsg(CX_OUT, 0xb6, value=fs, buffer=0)
+        self._control(0xb6, value=fs, buffer=0)
+        self.fs = fs
 
 
     def set_calibration_mode(self, mode):
@@ -218,13 +362,13 @@ class GUSBamp(Amplifier):
         # (1) mode:
         # (2) amplitude: little endian (0x07d0 = 2000)
         if mode == 'sine':
-            self.devh.controlMsg(CX_OUT, 0xcb, value=0x00, buffer="\x03\xd0\x07\x02\x00\xff\x07")
+            self._control(0xcb, value=0x00, buffer="\x03\xd0\x07\x02\x00\xff\x07")
         elif mode == 'sawtooth':
-            self.devh.controlMsg(CX_OUT, 0xcb, value=0x00, buffer="\x02\xd0\x07\x02\x00\xff\x07")
+            self._control(0xcb, value=0x00, buffer="\x02\xd0\x07\x02\x00\xff\x07")
         elif mode == 'whitenoise':
-            self.devh.controlMsg(CX_OUT, 0xcb, value=0x00, buffer="\x05\xd0\x07\x02\x00\xff\x07")
+            self._control(0xcb, value=0x00, buffer="\x05\xd0\x07\x02\x00\xff\x07")
         elif mode == 'square':
-            self.devh.controlMsg(CX_OUT, 0xcb, value=0x00, buffer="\x01\xd0\x07\x02\x00\xff\x07")
+            self._control(0xcb, value=0x00, buffer="\x01\xd0\x07\x02\x00\xff\x07")
         else:
             raise AmpError('Unknown mode: %s' % mode)
 
@@ -241,7 +385,7 @@ class GUSBamp(Amplifier):
 
         """
         v = (d << 3) + (c << 2) + (b << 1) + a
-        self.devh.controlMsg(CX_OUT, 0xbe, value=v, buffer=0)
+        self._control(0xbe, value=v, buffer=0)
 
 
     def set_common_reference(self, a=False, b=False, c=False, d=False):
@@ -253,24 +397,239 @@ class GUSBamp(Amplifier):
 
         """
         v = (d << 3) + (c << 2) + (b << 1) + a
-        self.devh.controlMsg(CX_OUT, 0xbf, value=v, buffer=0)
+        self._control(0xbf, value=v, buffer=0)
 
 
-    def set_slave_mode(self, slave):
+    def set_slave_mode(self, slave, device=None):
         """Set amp into slave or master mode.
 
         Parameters:
             slave -- if true, set into slave mode, set to master otherwise
+            device -- the :class:`Device` to set, defaults to all devices
 
         """
         v = 1 if slave else 0
-        self.devh.controlMsg(CX_OUT, 0xcd, value=v, buffer=0)
+        if device is None:
+            self._control(0xcd, value=v, buffer=0)
+        else:
+            device.control(0xcd, value=v, buffer=0)
 
 
 class AmpError(Exception):
     pass
 
 
+class Device(object):
+    """One g.USBamp of a :class:`GUSBamp`.
+
+    Keeps the state of the bulk reads of the device: the optional
+    reader thread, the bytes of an incomplete frame and, with several
+    devices, the frames not merged yet.
+
+    """
+
+    def __init__(self, usb_device):
+        self.devh = usb_device.open()
+        # detach kernel driver if nessecairy
+        config = usb_device.configurations[0]
+        self.devh.setConfiguration(config)
+        assert(len(config.interfaces) > 0)
+        # sometimes it is the other one
+        first_interface = config.interfaces[0][0]
+        if first_interface is None:
+            first_interface = config.interfaces[0][1]
+        self.devh.claimInterface(first_interface)
+        self.devh.setAltInterface(first_interface)
+        self.overflows = 0
+        # the maximum number of frames not merged yet, set by the
+        # reader thread
+        self.max_pending = None
+        self._reader_thread = None
+        self.reset()
+
+    def reset(self):
+        # bytes of an incomplete frame from the last bulk read
+        self.carry = np.empty(0, dtype=np.uint8)
+        # frames not merged with the other devices yet, frames lost
+        # before they were merged are kept as invalid frames
+        self.pending = np.empty((0, 17), dtype=FRAME_DTYPE)
+        self.valid = np.empty(0, dtype=bool)
+        # the number of frames since the start before the pending ones
+        self.position = 0
+
+    def close(self):
+        """Release the device."""
+        self.devh.releaseInterface()
+
+    def control(self, request, buffer, value=0):
+        """Send a vendor request."""
+        self.devh.controlMsg(CX_OUT, request, value=value, buffer=buffer)
+
+    def get_serial(self):
+        """Read the serial number of the device.
+
+        Returns
+        -------
+        serial : str or None
+
+        """
+        info = self.devh.controlMsg(CX_IN, 0xd2, buffer=256)
+        match = re.search(r'SN:\s*(\S+)', bytearray(info).decode('latin-1'))
+        return match.group(1) if match else None
+
+    def bulk_read(self, size, timeout):
+        """Read from the data endpoint.
+
+        Returns
+        -------
+        raw : buffer or sequence of ints
+            the received bytes, empty on timeout
+
+        """
+        try:
+            return self.devh.bulkRead(ENDPOINT_IN, size, timeout)
+        except usb.USBError:
+            return []
+
+    def start_reader(self, size, timeout, queue_size):
+        """Start the reader thread."""
+        self._reads = deque()
+        self._reads_cond = threading.Condition()
+        self.overflows = 0
+        self.max_pending = queue_size * max(size // FRAME_SIZE, 1)
+        self._reader_running = threading.Event()
+        self._reader_running.set()
+        self._reader_thread = threading.Thread(target=self._read_loop,
+                                               args=(size, timeout, queue_size),
+                                               name='GUSBampReader')
+        self._reader_thread.daemon = True
+        self._reader_thread.start()
+
+    def stop_reader(self):
+        if self._reader_thread is None:
+            return
+        self._reader_running.clear()
+        self._reader_thread.join()
+        self._reader_thread = None
+
+    def _read_loop(self, size, timeout, queue_size):
+        """Issue bulk reads until stopped.
+
+        This method runs in the reader thread. The reads are decoded
+        right away, so if the queue is full only complete frames are
+        dropped and the incomplete frame carried over to the next read
+        stays aligned. The number of dropped frames is added to the
+        oldest queued read.
+
+        """
+        while self._reader_running.is_set():
+            frames = self.decode(self.bulk_read(size, timeout))
+            if len(frames) == 0:
+                continue
+            with self._reads_cond:
+                dropped = 0
+                if len(self._reads) >= queue_size:
+                    old_frames, old_dropped = self._reads.popleft()
+                    self.overflows += 1
+                    logger.error('Reader queue is full, dropping the oldest read.')
+                    dropped = old_dropped + len(old_frames)
+                    if self._reads:
+                        self._reads[0][1] += dropped
+                        dropped = 0
+                self._reads.append([frames, dropped])
+                self._reads_cond.notify()
+
+    def get_queued_frames(self, timeout):
+        """Get the frames of all buffered bulk reads.
+
+        Waits up to ``timeout`` ms for the first read.
+
+        Returns
+        -------
+        frames : 2darray
+            (frames, 17) array
+        dropped : int
+            the number of frames dropped before ``frames`` since the
+            last call
+
+        """
+        with self._reads_cond:
+            if not self._reads:
+                self._reads_cond.wait(timeout / 1000)
+            reads = list(self._reads)
+            self._reads.clear()
+        if not reads:
+            return np.empty((0, 17), dtype=FRAME_DTYPE), 0
+        # drops are always added to the oldest read
+        dropped = reads[0][1]
+        if len(reads) == 1:
+            return reads[0][0], dropped
+        return np.concatenate([frames for frames, _ in reads]), dropped
+
+    def decode(self, raw):
+        """Decode the raw bytes of a bulk read into frames.
+
+        A frame consists of 17 little endian float32 values, one per
+        channel. A bulk read does not necessarily end at a frame
+        boundary, the bytes of an incomplete frame at the end are kept
+        and prepended to the next read.
+
+        Parameters
+        ----------
+        raw : buffer or sequence of ints
+            the bytes of the bulk read
+
+        Returns
+        -------
+        data : 2darray
+            (frames, 17) array with the complete frames
+
+        """
+        raw = _to_uint8(raw)
+        if len(self.carry) > 0:
+            raw = np.concatenate([self.carry, raw])
+        n = len(raw) - len(raw) % FRAME_SIZE
+        self.carry = raw[n:].copy()
+        return raw[:n].view(FRAME_DTYPE).reshape(-1, 17)
+
+    def buffer(self, frames, dropped=0):
+        """Append decoded frames to the frames not merged yet.
+
+        The ``dropped`` frames lost before ``frames`` are appended as
+        invalid frames, so the pending frames stay aligned with the
+        ones of the other devices. If there are more than
+        :attr:`max_pending` frames, the oldest ones are discarded.
+
+        """
+        if len(frames) == 0 and dropped == 0:
+            return
+        self.pending = np.concatenate([self.pending,
+                                       np.zeros((dropped, 17), dtype=FRAME_DTYPE),
+                                       frames])
+        self.valid = np.concatenate([self.valid,
+                                     np.zeros(dropped, dtype=bool),
+                                     np.ones(len(frames), dtype=bool)])
+        if self.max_pending is not None and len(self.pending) > self.max_pending:
+            excess = len(self.pending) - self.max_pending
+            logger.error('Too many frames not merged, discarding %d frames.' % excess)
+            self.discard(excess)
+
+    def discard(self, n):
+        """Remove the first ``n`` pending frames."""
+        self.pending = self.pending[n:]
+        self.valid = self.valid[n:]
+        self.position += n
+
+
+def _to_uint8(raw):
+    """View the bytes of a bulk read as uint8 array without copying."""
+    try:
+        return np.frombuffer(raw, dtype=np.uint8)
+    except (TypeError, AttributeError, ValueError):
+        # older pyusb versions return a tuple of ints
+        return np.array(raw, dtype=np.uint8)
+
+
 
 
 def main():
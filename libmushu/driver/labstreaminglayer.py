@@ -1,5 +1,6 @@
 from __future__ import division
 
+import threading
 import time
 import logging
 
@@ -13,6 +14,18 @@ logger = logging.getLogger(__name__)
 logger.info('Logger started.')
 
 
+# numpy types of the lsl channel formats which can be pulled directly
+# into numpy arrays
+DTYPES = {
+    pylsl.cf_float32: np.float32,
+    pylsl.cf_double64: np.float64,
+    pylsl.cf_int8: np.int8,
+    pylsl.cf_int16: np.int16,
+    pylsl.cf_int32: np.int32,
+    pylsl.cf_int64: np.int64,
+}
+
+
 class LSLAmp(Amplifier):
     """Pseudo Amplifier for lab streaming layer (lsl).
 
@@ -35,7 +48,7 @@ class LSLAmp(Amplifier):
 
     """
 
-    def configure(self, **kwargs):
+    def configure(self, max_samples=1024, time_correction_interval=5, **kwargs):
         """Configure the lsl device.
 
         This method looks for open lsl streams and picks the first `EEG`
@@ -46,9 +59,20 @@ class LSLAmp(Amplifier):
         subscribe) to devices that connected (publishing) via the lsl
         protocol.
 
+        Parameters
+        ----------
+        max_samples : int, optional
+            the maximum number of samples returned per call of
+            :meth:`get_data`
+        time_correction_interval : float, optional
+            the time correction of the streams can involve a round trip
+            over the network, so it is not queried for every block but
+            refreshed every ``time_correction_interval`` seconds by a
+            background thread while the amplifier is running
+
         """
-        # lsl defined
-        self.max_samples = 1024
+        self.max_samples = max_samples
+        self.time_correction_interval = time_correction_interval
         # open EEG stream
         logger.debug('Opening EEG stream...')
         streams = pylsl.resolve_stream('type', 'EEG')
@@ -67,9 +91,17 @@ class LSLAmp(Amplifier):
         self.n_channels = info.channel_count()
         self.channels = ['Ch %i' % i for i in range(self.n_channels)]
         self.fs = info.nominal_srate()
+        # the samples are pulled directly into this buffer, if the
+        # channel format has a numpy equivalent
+        dtype = DTYPES.get(info.channel_format())
+        if dtype is None:
+            self.buffer = None
+        else:
+            self.buffer = np.empty((self.max_samples, self.n_channels), dtype=dtype)
         logger.debug('Initializing time correction...')
-        self.lsl_marker_inlet.time_correction()
-        self.lsl_inlet.time_correction()
+        self.tc_m = self.lsl_marker_inlet.time_correction()
+        self.tc_s = self.lsl_inlet.time_correction()
+        self._tc_thread = None
         logger.debug('Configuration done.')
 
     def start(self):
@@ -79,15 +111,39 @@ class LSLAmp(Amplifier):
         logger.debug('Opening lsl streams.')
         self.lsl_inlet.open_stream()
         self.lsl_marker_inlet.open_stream()
+        self._tc_stopped = threading.Event()
+        self._tc_thread = threading.Thread(target=self._time_correction_loop,
+                                           name='LSLAmpTimeCorrection')
+        self._tc_thread.daemon = True
+        self._tc_thread.start()
 
     def stop(self):
         """Close the lsl inlets.
 
         """
         logger.debug('Closing lsl streams.')
+        if self._tc_thread is not None:
+            self._tc_stopped.set()
+            self._tc_thread.join()
+            self._tc_thread = None
         self.lsl_inlet.close_stream()
         self.lsl_marker_inlet.close_stream()
 
+    def _time_correction_loop(self):
+        """Refresh the time correction of the inlets until stopped.
+
+        This method runs in the time correction thread. The values are
+        replaced atomically, :meth:`get_data` always reads a complete
+        value.
+
+        """
+        while not self._tc_stopped.wait(self.time_correction_interval):
+            try:
+                self.tc_m = self.lsl_marker_inlet.time_correction(timeout=self.time_correction_interval)
+                self.tc_s = self.lsl_inlet.time_correction(timeout=self.time_correction_interval)
+            except pylsl.TimeoutError:
+                logger.warning('Time correction timed out, keeping the old values.')
+
     def get_data(self):
         """Receive a chunk of data an markers.
 
@@ -97,8 +153,8 @@ class LSLAmp(Amplifier):
         first sample of that block.
 
         """
-        tc_m = self.lsl_marker_inlet.time_correction()
-        tc_s = self.lsl_inlet.time_correction()
+        tc_m = self.tc_m
+        tc_s = self.tc_s
 
         markers, m_timestamps = self.lsl_marker_inlet.pull_chunk(timeout=0.0, max_samples=self.max_samples)
         # flatten the output of the lsl markers, which has the form
@@ -106,13 +162,19 @@ class LSLAmp(Amplifier):
         markers = [str(i) for sublist in markers for i in sublist]
 
         # block until we actually have data
-        samples, timestamps = self.lsl_inlet.pull_chunk(timeout=pylsl.FOREVER, max_samples=self.max_samples)
-        samples = np.array(samples).reshape(-1, self.n_channels)
+        if self.buffer is None:
+            samples, timestamps = self.lsl_inlet.pull_chunk(timeout=pylsl.FOREVER, max_samples=self.max_samples)
+            samples = np.array(samples).reshape(-1, self.n_channels)
+        else:
+            _, timestamps = self.lsl_inlet.pull_chunk(timeout=pylsl.FOREVER, max_samples=self.max_samples,
+                                                      dest_obj=self.buffer)
+            # the buffer is overwritten by the next pull
+            samples = self.buffer[:len(timestamps)].copy()
 
         t0 = timestamps[0] + tc_s
-        m_timestamps = [(i + tc_m - t0) * 1000 for i in m_timestamps]
+        m_timestamps = (np.asarray(m_timestamps) + (tc_m - t0)) * 1000
 
-        return samples, zip(m_timestamps, markers)
+        return samples, list(zip(m_timestamps.tolist(), markers))
 
     def get_channels(self):
         """Get channel names.
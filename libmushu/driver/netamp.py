@@ -0,0 +1,199 @@
+# netamp.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+from __future__ import division
+
+import json
+import logging
+import socket
+
+import numpy as np
+
+from libmushu.amplifier import Amplifier
+from libmushu.streamserver import PORT, MESSAGE_HEADER, DATA_HEADER, HEAD, DATA
+
+
+logger = logging.getLogger(__name__)
+logger.info('Logger started.')
+
+
+# the modulo of the appended counter channel, all its values are exactly
+# representable as float32
+COUNTER_MODULO = 2**24
+
+
+class NetAmp(Amplifier):
+    """Pseudo Amplifier receiving data from a mushu stream server.
+
+    This amplifier connects to a :class:`libmushu.streamserver.StreamServer`
+    running on another computer or in another process and receives the
+    data of the amplifier the server is attached to.
+
+    Examples
+    --------
+
+    >>> amp = libmushu.get_amp('netamp')
+    >>> amp.configure(host='eeg-server', port=12345)
+    >>> amp.start()
+    >>> while True:
+    ...     data, marker = amp.get_data()
+    ...     # do something with data and/or break the loop
+    >>> amp.stop()
+
+    """
+
+    def __init__(self):
+        self.sock = None
+        self.lost_samples = 0
+
+    def configure(self, host='localhost', port=PORT, path=None, counter=False):
+        """Connect to the stream server.
+
+        Parameters
+        ----------
+        host : str, optional
+            the host of the TCP server
+        port : int, optional
+            the port of the TCP server
+        path : str, optional
+            if given, connect to the Unix domain socket with this path
+            instead of TCP
+        counter : bool, optional
+            if True, a ``Counter`` channel with the number of samples
+            the server sent before each sample is appended, see
+            :meth:`get_counter`. Blocks the server dropped because this
+            client was too slow are then detected as gaps by the
+            :class:`libmushu.ampdecorator.AmpDecorator`. Dropped blocks
+            are always logged and counted in :attr:`lost_samples`.
+
+        """
+        self.address = host, port, path
+        self.counter = counter
+        self._connect()
+
+    def _connect(self):
+        if self.sock is not None:
+            self.sock.close()
+        host, port, path = self.address
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        typ, payload = self._read_message()
+        if typ != HEAD:
+            raise RuntimeError('Unexpected message from stream server: %r' % typ)
+        meta = json.loads(payload.decode('utf-8'))
+        self.channels = meta['channels']
+        self.fs = meta['fs']
+        self.dtype = np.dtype(meta['dtype'])
+        self.source_counter = meta['counter']
+        if self.counter:
+            self.channels = self.channels + ['Counter']
+        # the number of samples the server sent before the next block
+        self.expected = None
+
+    def start(self):
+        # reconnect after stop
+        if self.sock is None:
+            self._connect()
+
+    def stop(self):
+        self.sock.close()
+        self.sock = None
+
+    def get_data(self):
+        """Receive a block of data and markers.
+
+        Blocks until the next block arrives.
+
+        Returns
+        -------
+        chunk, markers: Markers is time in ms since relative to the
+        first sample of that block.
+
+        """
+        typ, payload = self._read_message()
+        if typ != DATA:
+            raise RuntimeError('Unexpected message from stream server: %r' % typ)
+        t0, first, samples, marker_len = DATA_HEADER.unpack_from(payload)
+        if self.expected is not None and first != self.expected:
+            lost = first - self.expected
+            logger.warning('The stream server dropped %d samples.' % lost)
+            self.lost_samples += lost
+        self.expected = first + samples
+        offset = DATA_HEADER.size
+        markers = json.loads(bytes(payload[offset:offset+marker_len]).decode('utf-8'))
+        offset += marker_len
+        data = np.frombuffer(payload, dtype=self.dtype, offset=offset)
+        if not self.counter:
+            return data.reshape(samples, len(self.channels)), markers
+        data = data.reshape(samples, len(self.channels) - 1)
+        counter = np.arange(first, first + samples) % COUNTER_MODULO
+        counter = counter[:, np.newaxis].astype(np.result_type(self.dtype, np.float32))
+        return np.hstack([data, counter]), markers
+
+    def get_counter(self):
+        """Get the sample counter channel.
+
+        Returns
+        -------
+        counter : (int, int) or None
+            the appended ``Counter`` channel, if enabled in
+            :meth:`configure`, otherwise the counter channel of the
+            amplifier the server is attached to, if it has one
+
+        """
+        if self.counter:
+            return len(self.channels) - 1, COUNTER_MODULO
+        if self.source_counter is not None:
+            return tuple(self.source_counter)
+        return None
+
+    def _read_message(self):
+        typ, length = MESSAGE_HEADER.unpack(bytes(self._recv(MESSAGE_HEADER.size)))
+        return typ, self._recv(length)
+
+    def _recv(self, size):
+        """Receive exactly ``size`` bytes."""
+        buf = bytearray(size)
+        view = memoryview(buf)
+        pos = 0
+        while pos < size:
+            n = self.sock.recv_into(view[pos:], size - pos)
+            if n == 0:
+                raise RuntimeError('Connection closed by stream server.')
+            pos += n
+        return buf
+
+    def get_channels(self):
+        return self.channels
+
+    def get_sampling_frequency(self):
+        return self.fs
+
+    @staticmethod
+    def is_available():
+        """The NetAmp is never listed as available.
+
+        It needs the address of a stream server, see :meth:`configure`,
+        and probing a server would connect to it as a client.
+
+        """
+        return False
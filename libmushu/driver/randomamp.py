@@ -17,13 +17,10 @@
 
 from __future__ import division
 
-import time
-import math
-import json
-
 import numpy as np
 
 from libmushu.amplifier import Amplifier
+from libmushu.clock import system_clock
 
 
 PRESETS = [
@@ -37,30 +34,33 @@ PRESETS = [
 class RandomAmp(Amplifier):
     """An amplifier that produces random data."""
 
+    # the clock used for pacing, see libmushu.clock
+    clock = system_clock
+
+    presets = PRESETS
+
     def __init__(self):
-        self.presets = PRESETS
         self.channels = 17
         self.fs = 100
 
     def start(self):
-        self.last_sample = time.time()
+        self.t_start = self.clock.monotonic()
+        self.pos = 0
 
     @property
     def sample_len(self):
         return 1 / self.fs
 
     def get_data(self):
-        # simulate blocking until we have enough data
-        elapsed = time.time() - self.last_sample
-        if elapsed < self.sample_len:
-            time.sleep(self.sample_len - elapsed)
-        # ready
-        dt = time.time() - self.last_sample
-        samples = math.floor(self.fs * dt)
-        # actual time according to number of samples we're sending out
-        dt = samples / self.fs
-        data = np.random.randint(0, 1024, (samples, self.channels))
-        self.last_sample += dt
+        # simulate blocking until we have enough data, the deadlines are
+        # absolute so errors of the sleep do not accumulate
+        now = self.clock.monotonic()
+        due = int((now - self.t_start) * self.fs)
+        if due <= self.pos:
+            due = self.pos + 1
+            self.clock.sleep(self.t_start + due / self.fs - now)
+        data = np.random.randint(0, 1024, (due - self.pos, self.channels))
+        self.pos = due
         return data, []
 
     def configure(self, fs, channels):
@@ -2,16 +2,25 @@
 
 from __future__ import division
 
-import time
+import json
 
 import numpy as np
 
 from libmushu.amplifier import Amplifier
+from libmushu.clock import system_clock
 
 
 class ReplayAmp(Amplifier):
 
-    def configure(self, data, marker, channels, fs, realtime=True, blocksize_ms=None, blocksize_samples=None):
+    # the clock used for pacing, see libmushu.clock
+    clock = system_clock
+
+    # the replay state, see start
+    t_start = None
+    pos = 0
+    lag = 0
+
+    def configure(self, data=None, marker=None, channels=None, fs=None, realtime=True, blocksize_ms=None, blocksize_samples=None, path=None, speed=1):
         """
 
         Parameters
@@ -20,11 +29,28 @@ class ReplayAmp(Amplifier):
         marker
         channels
         fs
-        realtime
+        realtime : bool
+            if True, the replay is paced like a real amplifier:
+            :meth:`get_data` blocks until the next block is due and
+            returns all blocks that are due. If False, every call
+            returns the next block immediately, so the recording is
+            replayed as fast as it is read.
         blocksize_ms : float
             blocksize in milliseconds
         blocksize_samples : int
             blocksize in samples
+        path : str, optional
+            replay a recording of the
+            :class:`libmushu.ampdecorator.AmpDecorator` instead of
+            ``data`` and ``marker``. ``path`` is the filename without
+            the ``.eeg``, ``.marker`` and ``.meta`` extensions. The
+            samples are memory mapped and the markers are read while
+            replaying, so the recording is never loaded into memory.
+            ``channels`` and ``fs`` default to the values in the
+            ``.meta`` file.
+        speed : float, optional
+            the speed of the replay relative to real time if
+            ``realtime`` is True, e.g. 10 replays ten times faster
 
         Raises
         ------
@@ -35,15 +61,31 @@ class ReplayAmp(Amplifier):
         if [blocksize_ms, blocksize_samples].count(None) != 1:
             raise TypeError("blocksize_ms and blocksize_samples are mutually exclusive.")
 
+        self.path = path
+        if path is not None:
+            with open(path + '.meta') as fh:
+                meta = json.load(fh)
+            if channels is None:
+                channels = meta['Channels']
+            if fs is None:
+                fs = meta['Sampling Frequency']
+            data = np.memmap(path + '.eeg', dtype=np.float32, mode='r')
+            # ignore an incomplete sample at the end of the file
+            n = len(data) // len(channels)
+            data = data[:n * len(channels)].reshape(n, len(channels))
+            marker = []
         self.data = data
-        # slow python
         self.marker = marker
-        # fast numpy
-        self.marker_ts = np.array([ts for ts, s in marker])
-        self.marker_s = np.array([s for ts, s in marker])
+        # the markers sorted by their time in ms since the first sample,
+        # the markers of a block are found by binary search
+        marker_ts = np.array([ts for ts, s in marker], dtype=float)
+        order = np.argsort(marker_ts, kind='mergesort')
+        self.marker_ts = marker_ts[order]
+        self.marker_s = np.array([s for ts, s in marker])[order]
         self.channels = channels
         self.fs = fs
         self.realtime = realtime
+        self.speed = speed
 
         if blocksize_ms:
             samples = fs * (blocksize_ms / 1000)
@@ -54,11 +96,18 @@ class ReplayAmp(Amplifier):
             self.samples = blocksize_samples
 
     def start(self):
-        self.last_sample_time = time.time()
+        self.t_start = self.clock.monotonic()
+        self.lag = 0
         self.pos = 0
+        # index of the first marker not returned yet
+        self.marker_pos = 0
+        if self.path is not None:
+            self.marker_file = open(self.path + '.marker')
+            self.next_marker = None
 
     def stop(self):
-        pass
+        if self.path is not None:
+            self.marker_file.close()
 
     def get_data(self):
         """
@@ -70,33 +119,83 @@ class ReplayAmp(Amplifier):
 
         """
         if self.realtime:
-            elapsed = time.time() - self.last_sample_time
-            blocks = (self.fs * elapsed) // self.samples
-            samples = blocks * self.samples
+            # the deadlines of the blocks are relative to the start, so
+            # errors of the sleep do not accumulate
+            rate = self.fs * self.speed
+            now = self.clock.monotonic()
+            due = int((now - self.t_start) * rate) // self.samples * self.samples
+            if due <= self.pos:
+                due = self.pos + self.samples
+                self.clock.sleep(max(0, self.t_start + due / rate - now))
+                now = self.clock.monotonic()
+            samples = due - self.pos
+            self.lag = now - (self.t_start + due / rate)
         else:
             samples = self.samples
-        elapsed = samples / self.fs
-        self.last_sample_time += elapsed
+        # stop at the end of the recording
+        samples = max(0, min(samples, len(self.data) - self.pos))
         # data
         chunk = self.data[self.pos:self.pos+samples]
-        #self.data = self.data[samples:]
         # markers
-
-        # slow python version
-        #markers = [x for x in self.marker if x[0] < elapsed * 1000]
-        #self.marker = [x for x in self.marker if x[0] >= elapsed * 1000]
-        #self.marker = [[x[0] - elapsed * 1000, x[1]] for x in self.marker]
-
-        # fast numpy version
-        mask = self.marker_ts < (elapsed * 1000)
-        markers = zip(self.marker_ts[mask], self.marker_s[mask])
-        self.marker_ts = self.marker_ts[~mask]
-        self.marker_s = self.marker_s[~mask]
-        self.marker_ts -= elapsed * 1000
+        t_start = self.pos * 1000 / self.fs
+        t_end = (self.pos + samples) * 1000 / self.fs
+        if self.path is not None:
+            markers = self._read_markers(t_start, t_end)
+        else:
+            end = np.searchsorted(self.marker_ts, t_end, side='left')
+            markers = list(zip(self.marker_ts[self.marker_pos:end] - t_start,
+                               self.marker_s[self.marker_pos:end]))
+            self.marker_pos = max(self.marker_pos, end)
 
         self.pos += samples
         return chunk, markers
 
+    def get_stats(self):
+        """Get the requested and the achieved replay rate.
+
+        Returns
+        -------
+        stats : dict
+            the requested rate in samples per second (None if not
+            ``realtime``), the achieved rate and the achieved speed
+            relative to real time since the start, the number of
+            samples replayed and the lag of the last block behind its
+            deadline in seconds. Before :meth:`start` the rates are 0.
+
+        """
+        if self.t_start is None:
+            elapsed = 0
+        else:
+            elapsed = self.clock.monotonic() - self.t_start
+        achieved = self.pos / elapsed if elapsed > 0 else 0
+        return {'requested_rate': self.fs * self.speed if self.realtime else None,
+                'achieved_rate': achieved,
+                'achieved_speed': achieved / self.fs,
+                'samples': self.pos,
+                'lag': self.lag}
+
+    def _read_markers(self, t_start, t_end):
+        """Read the markers of a block from the marker file.
+
+        The lines of the marker file are read until the first marker
+        after the block, which is kept for the next block.
+
+        """
+        markers = []
+        while True:
+            if self.next_marker is None:
+                line = self.marker_file.readline()
+                if not line:
+                    break
+                ts, s = line.rstrip('\n').split(' ', 1)
+                self.next_marker = float(ts), s
+            ts, s = self.next_marker
+            if ts >= t_end:
+                break
+            markers.append((ts - t_start, s))
+            self.next_marker = None
+        return markers
+
     def get_channels(self):
         return self.channels
 
@@ -0,0 +1,162 @@
+# sharedmemoryamp.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+from __future__ import division
+
+import time
+import logging
+
+import numpy as np
+
+from libmushu.amplifier import Amplifier
+from libmushu.sharedmemory import Ring, get_path, get_available_rings
+
+
+logger = logging.getLogger(__name__)
+logger.info('Logger started.')
+
+
+class SharedMemoryAmp(Amplifier):
+    """Pseudo Amplifier reading from a shared memory ring buffer.
+
+    This amplifier reads the data another process on the same computer
+    publishes with the :class:`libmushu.sharedmemory.SharedMemoryPublisher`.
+    The ring buffer is mapped read-only, so any number of readers can
+    attach without affecting the publishing process.
+
+    Examples
+    --------
+
+    >>> amp = libmushu.get_amp('sharedmemoryamp')
+    >>> amp.configure(name='eeg')
+    >>> amp.start()
+    >>> while True:
+    ...     data, marker = amp.get_data()
+    ...     # do something with data and/or break the loop
+    >>> amp.stop()
+
+    """
+
+    def __init__(self):
+        self.ring = None
+        self.overruns = 0
+        self.lost_samples = 0
+
+    def configure(self, name=None, poll_interval=0.001, timeout=1.0):
+        """Attach to a ring buffer.
+
+        Parameters
+        ----------
+        name : str, optional
+            the name of the ring buffer. If None, the first available
+            ring buffer is used.
+        poll_interval : float, optional
+            the time in seconds :meth:`get_data` sleeps while waiting
+            for new data
+        timeout : float, optional
+            the maximum time in seconds :meth:`get_data` waits for new
+            data before it returns an empty block
+
+        """
+        if name is None:
+            names = get_available_rings()
+            if not names:
+                raise RuntimeError('No shared memory ring buffer available.')
+            if len(names) > 1:
+                logger.warning('Number of ring buffers is > 1, picking the first one.')
+            name = names[0]
+        if self.ring is not None:
+            self.ring.close()
+        self.ring = Ring.open(get_path(name))
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.channels = self.ring.meta['channels']
+        self.fs = self.ring.meta['fs']
+
+    def start(self):
+        # start reading at the current position of the writer
+        self.pos = self.ring['write_count']
+        self.marker_pos = self.ring['marker_count']
+        self.overruns = 0
+        self.lost_samples = 0
+
+    def stop(self):
+        pass
+
+    def get_data(self):
+        """Get the new data from the ring buffer.
+
+        Blocks until new data is available or the timeout expired. If
+        the reader was too slow and the writer has overwritten data that
+        was not read yet, the overwritten samples are skipped and
+        counted in :attr:`lost_samples`.
+
+        Returns
+        -------
+        chunk, markers: Markers is time in ms since relative to the
+        first sample of that block.
+
+        """
+        ring = self.ring
+        deadline = time.time() + self.timeout
+        written = ring['write_count']
+        while written == self.pos:
+            if ring['closed'] or time.time() > deadline:
+                return np.empty((0, ring.n_channels), dtype=ring.dtype), []
+            time.sleep(self.poll_interval)
+            written = ring['write_count']
+        self._skip_overwritten(written - ring.capacity)
+        start = self.pos
+        idx = np.arange(start, written) % ring.capacity
+        data = ring.data.take(idx, axis=0)
+        # the writer may have overwritten the beginning of the data
+        # while we were copying it
+        overwritten = ring['write_count'] - ring.capacity - start
+        if overwritten > 0:
+            data = data[overwritten:]
+            self._skip_overwritten(start + overwritten)
+            start = self.pos
+        self.pos = written
+        # markers
+        marker_count = ring['marker_count']
+        if marker_count - self.marker_pos > ring.marker_capacity:
+            logger.warning('Lost %d markers.' % (marker_count - self.marker_pos - ring.marker_capacity))
+            self.marker_pos = marker_count - ring.marker_capacity
+        slots = np.arange(self.marker_pos, marker_count) % ring.marker_capacity
+        markers = ring.markers.take(slots)
+        self.marker_pos = marker_count
+        markers = [[(pos - start) * 1000 / self.fs, text.decode('utf-8')]
+                   for pos, text in zip(markers['pos'], markers['text'])]
+        return data, markers
+
+    def _skip_overwritten(self, pos):
+        if pos > self.pos:
+            logger.warning('Reader too slow, lost %d samples.' % (pos - self.pos))
+            self.overruns += 1
+            self.lost_samples += pos - self.pos
+            self.pos = pos
+
+    def get_channels(self):
+        return self.channels
+
+    def get_sampling_frequency(self):
+        return self.fs
+
+    @staticmethod
+    def is_available():
+        return len(get_available_rings()) > 0
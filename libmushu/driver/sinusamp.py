@@ -18,12 +18,12 @@
 from __future__ import division
 
 import time
-import math
 import json
 
 import numpy as np
 
 from libmushu.amplifier import Amplifier
+from libmushu.clock import system_clock
 
 
 PRESETS = [['Sine wave at 50Hz, 16Channels', {'f' : 1, 'fs' : 10, 'channels' : 16}],
@@ -32,38 +32,69 @@ PRESETS = [['Sine wave at 50Hz, 16Channels', {'f' : 1, 'fs' : 10, 'channels' : 1
 
 
 class SinusAmp(Amplifier):
-    """An amplifier that produces sinus data."""
+    """An amplifier that produces sinus data.
+
+    The signal is computed from a sample counter, so it is phase
+    continuous between the blocks and the amplifier produces exactly
+    ``fs`` samples per second.
+
+    """
+
+    # the clock used for pacing, see libmushu.clock
+    clock = system_clock
+
+    presets = PRESETS
 
     def __init__(self):
-        self.presets = PRESETS
         self.configure(**self.presets[0][1])
-        self.last_sample = time.time()
+        self.start()
 
     @property
     def sample_len(self):
         return 1 / self.fs
 
-    @property
-    def elapsed(self):
-        return time.time() - self.last_sample
+    def start(self):
+        self.t_start = self.clock.monotonic()
+        self.pos = 0
 
     def get_data(self):
-        # simulate blocking until we have enough data
-        elapsed = self.elapsed
-        if elapsed < self.sample_len:
-            time.sleep(self.sample_len - elapsed)
-        dt = self.elapsed
-        samples = math.floor(self.fs * dt)
-        t = np.linspace(self.last_sample, self.last_sample + dt, samples)
-        t = np.array([t for i in range(self.channels)]).T
-        data = np.sin(np.pi*2*t*self.f)
-        self.last_sample = time.time()
+        # simulate blocking until we have enough data. the sample times
+        # are relative to the start, so errors of the sleep do not
+        # accumulate
+        now = self.clock.monotonic()
+        due = int((now - self.t_start) * self.fs)
+        if due <= self.pos:
+            due = self.pos + 1
+            self.clock.sleep(max(0, self.t_start + due / self.fs - now))
+        t = np.arange(self.pos, due)[:, np.newaxis] / self.fs
+        data = self.amplitude * np.sin(2 * np.pi * self.f * t + self.phase)
+        self.pos = due
         return data, []
 
-    def configure(self, f, fs, channels):
-        self.f = f
+    def configure(self, f, fs, channels, amplitude=1, phase=0):
+        """Configure the amplifier.
+
+        Parameters
+        ----------
+        f : float or sequence of floats
+            the frequency in Hz, for all channels or per channel
+        fs : float
+            the sampling frequency
+        channels : int
+            the number of channels
+        amplitude : float or sequence of floats, optional
+            the amplitude, for all channels or per channel
+        phase : float or sequence of floats, optional
+            the phase in radians, for all channels or per channel
+
+        """
         self.fs = fs
         self.channels = channels
+        # per channel vectors, broadcasted over the samples of a block
+        shape = (channels,)
+        self.f = np.broadcast_to(np.asarray(f, dtype=float), shape)
+        self.amplitude = np.broadcast_to(np.asarray(amplitude, dtype=float), shape)
+        self.phase = np.broadcast_to(np.asarray(phase, dtype=float), shape)
 
     def get_channels(self):
         return ['Ch_%d' % i for i in range(self.channels)]
@@ -0,0 +1,167 @@
+# lsloutlet.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""
+This module provides the :class:`LSLOutlet` which publishes the data of
+an amplifier as a lab streaming layer (lsl) stream, so lsl based tools
+can use any amplifier supported by mushu::
+
+    amp = libmushu.get_amp('gusbamp')
+    amp.add_sink(LSLOutlet(name='gusbamp'))
+    amp.start()
+    while True:
+        data, marker = amp.get_data()
+
+The samples are published on an `EEG` stream and the markers on a paired
+`Markers` stream. The lsl time stamps are derived from the onset of each
+block as estimated by the :class:`libmushu.ampdecorator.AmpDecorator`,
+the markers are stamped with the same clock as the samples.
+
+https://code.google.com/p/labstreaminglayer/
+
+"""
+
+
+from __future__ import division
+
+import logging
+import uuid
+
+import numpy as np
+import pylsl
+
+from libmushu.clock import system_clock
+
+
+logger = logging.getLogger(__name__)
+logger.info('Logger started')
+
+
+# the lsl channel formats of the supported numpy types
+CHANNEL_FORMATS = {
+    np.dtype(np.float32): pylsl.cf_float32,
+    np.dtype(np.float64): pylsl.cf_double64,
+    np.dtype(np.int8): pylsl.cf_int8,
+    np.dtype(np.int16): pylsl.cf_int16,
+    np.dtype(np.int32): pylsl.cf_int32,
+    np.dtype(np.int64): pylsl.cf_int64,
+}
+
+
+class LSLOutlet(object):
+    """Publish the data of an amplifier via lsl.
+
+    The outlet is a sink for the
+    :class:`libmushu.ampdecorator.AmpDecorator`, see
+    :meth:`libmushu.ampdecorator.AmpDecorator.add_sink`. The streams
+    are created when the amplifier is started and destroyed when it is
+    stopped.
+
+    """
+
+    def __init__(self, name='mushu', type_='EEG', source_id=None, dtype=np.float32,
+                 max_buffered=360):
+        """Initialize the outlet.
+
+        Parameters
+        ----------
+        name : str, optional
+            the name of the data stream, the marker stream is called
+            ``name + '-Markers'``
+        type_ : str, optional
+            the content type of the data stream
+        source_id : str, optional
+            the unique id of the stream, which lets lsl clients
+            reconnect when the outlet is recreated. Defaults to a random
+            id
+        dtype : numpy dtype, optional
+            the data type of the samples in the stream, must be a key of
+            :data:`CHANNEL_FORMATS`
+        max_buffered : int, optional
+            the maximum number of seconds buffered for each client
+
+        """
+        self.name = name
+        self.type_ = type_
+        self.source_id = source_id if source_id is not None else uuid.uuid4().hex
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in CHANNEL_FORMATS:
+            raise ValueError('Unsupported dtype %s.' % self.dtype)
+        self.max_buffered = max_buffered
+        self.outlet = None
+        self.marker_outlet = None
+
+    def open(self, amp):
+        """Create the lsl streams.
+
+        Parameters
+        ----------
+        amp : Amplifier
+            the amplifier whose data will be published
+
+        """
+        channels = amp.get_channels()
+        self.fs = amp.get_sampling_frequency()
+        # the host clock of the decorator, the time stamps of the blocks
+        # are converted from this clock into the lsl clock
+        self.host_clock = getattr(amp, 'host_clock', system_clock)
+        info = pylsl.StreamInfo(self.name, self.type_, len(channels), self.fs,
+                                CHANNEL_FORMATS[self.dtype], self.source_id)
+        desc = info.desc().append_child('channels')
+        for channel in channels:
+            desc.append_child('channel').append_child_value('label', str(channel))
+        self.outlet = pylsl.StreamOutlet(info, max_buffered=self.max_buffered)
+        info = pylsl.StreamInfo(self.name + '-Markers', 'Markers', 1, pylsl.IRREGULAR_RATE,
+                                pylsl.cf_string, self.source_id + '-Markers')
+        self.marker_outlet = pylsl.StreamOutlet(info, max_buffered=self.max_buffered)
+        logger.debug('Created lsl outlets %s.' % self.name)
+
+    def write(self, data, marker, t0):
+        """Push a block of data and markers to the lsl streams.
+
+        Parameters
+        ----------
+        data : 2darray
+            the block of data
+        marker : list of (float, str)
+            the markers, the timestamps are in ms relative to the onset
+            of the block
+        t0 : float
+            the host time of the onset of the block
+
+        """
+        t0 += pylsl.local_clock() - self.host_clock.time()
+        if len(data) > 0:
+            # pylsl pushes contiguous arrays of the stream's type from
+            # their buffer, everything else is converted sample by
+            # sample. the buffer must be writable, so read-only blocks
+            # are copied
+            data = np.ascontiguousarray(data, dtype=self.dtype)
+            if not data.flags.writeable:
+                data = data.copy()
+            # lsl expects the time stamp of the last sample of the chunk
+            self.outlet.push_chunk(data, t0 + (len(data) - 1) / self.fs)
+        for ts, m in marker:
+            self.marker_outlet.push_sample([str(m)], t0 + ts / 1000)
+
+    def close(self):
+        """Destroy the lsl streams."""
+        # pylsl destroys the outlets when they are garbage collected
+        self.outlet = None
+        self.marker_outlet = None
+        logger.debug('Destroyed lsl outlets %s.' % self.name)
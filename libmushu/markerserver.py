@@ -0,0 +1,231 @@
+# markerserver.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""
+This module provides the marker server of the
+:class:`libmushu.ampdecorator.AmpDecorator`.
+
+The server runs in a separate process while the amplifier is running
+and receives markers via TCP and UDP on port :data:`PORT`. Every marker
+is a string terminated by :data:`END_MARKER`, it is put together with
+the time it arrived into a queue, which is read by the decorator. The
+markers are expected to be UTF-8 encoded.
+
+The module is imported when the amplifier is started, so ``import
+libmushu`` does not pay for ``multiprocessing`` and ``asyncore``.
+
+"""
+
+
+from __future__ import division
+
+import asynchat
+import asyncore
+import logging
+import socket
+import time
+
+
+logger = logging.getLogger(__name__)
+logger.info('Logger started')
+
+
+END_MARKER = b'\n'
+BUFSIZE = 2**16
+PORT = 12344
+
+
+def marker_reader(queue, running, ready):
+    """Start the TCP and UDP MarkerServers and start the receiving loop.
+
+    This method runs in a separate process and receives UDP and TCP
+    markers. Whenever a marker is received, it is put together with a
+    timestamp into a queue.
+
+    After the TCP and UDP servers are set up the ``ready`` event is set
+    and the method enters the loop that runs forever until the
+    ``running`` Event is cleared. Received markers are put in the
+    ``queue``.
+
+    Parameters
+    ----------
+    queue : Queue
+        this queue is used to send markers to a different process
+    running : Event
+        this event is used to signal this process to terminate its main
+        loop
+    ready : Event
+        this signal is used to signal the "parent"-process that this
+        process is ready to receive marker
+
+    """
+    MarkerServer(queue, 'udp')
+    MarkerServer(queue, 'tcp')
+    ready.set()
+    # the timeout is the time it takes to notice that running was
+    # cleared
+    while running.is_set():
+        asyncore.loop(timeout=.1, count=1)
+
+
+class MarkerServer(asyncore.dispatcher):
+    """The marker server.
+
+    It opens a TCP or UDP socket and assigns a :class:`MarkerHandler` to
+    the opened socket.
+
+    """
+
+    def __init__(self, queue, proto):
+        """Initialize the Server.
+
+        Parameters
+        ----------
+        queue : multiprocessing.Queue instance
+        proto : string
+            The protocol to use. Can be either 'tcp' or 'udp'.
+
+        Raises
+        ------
+        ValueError : if the protocol is unsupported
+
+        """
+        asyncore.dispatcher.__init__(self)
+        self.queue = queue
+        if proto.lower() == 'tcp':
+            logger.debug('Opening TCP socket.')
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.bind(('', PORT))
+            self.listen(5)
+        elif proto.lower() == 'udp':
+            logger.debug('Opening UDP socket.')
+            self.create_socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.bind(('', PORT))
+            # in contrast to a TCP socket, an UDP socket has no
+            # connection, so the socket is immediately ready to receive
+            # data
+            handler = MarkerHandler(self.socket, self.queue)
+        else:
+            raise ValueError('Unsupported protocol: {proto}'.format(proto=proto))
+
+    def handle_accept(self):
+        """Accept an incomming TCP connection.
+
+        """
+        pair = self.accept()
+        if pair is not None:
+            sock, addr = pair
+            logger.debug('Incoming connection from {addr}'.format(addr=addr))
+            handler = MarkerHandler(sock, self.queue)
+
+
+class MarkerHandler(asynchat.async_chat):
+    """Handler for incoming data streams.
+
+    This handler processes incoming data from a TCP or UDP sockets. Each
+    packet ends with a terminator character sequence. The handler takes
+    care of incomplete packets and puts complete packets in the queue.
+
+    """
+
+    def __init__(self, socket, queue):
+        """Initialize the Handler.
+
+        Parameters
+        ----------
+        socket : socket.socket
+            the socket can be TCP or UDP. In case of UDP the socket must
+            be binded already, the TCP socket must be an opened
+            connection (i.e. after accept)
+        queue : multiprocessing.Queue instance
+            The queue to send the received markers to.
+
+        """
+        asynchat.async_chat.__init__(self, socket)
+        self.set_terminator(END_MARKER)
+        self.data = b''
+        self.timestamp = None
+        self.queue = queue
+
+    def handle_close(self):
+        logger.debug('Connection closed by peer, closing connection.')
+        self.close()
+
+    def writable(self):
+        """Signal weather the socket is ready to send data.
+
+        Returns
+        -------
+        writable : bool
+            ready to send or not
+
+        """
+        # if we don't set the writable flag to false, the UDP socket
+        # will signal that it is ready to send data on every iteration
+        # of the asycore loop, which will cause massive CPU strain. this
+        # is not the case for TCP sockets, but doesn't hurt either.
+        return False
+
+    def collect_incoming_data(self, data):
+        """Got potentially partial data packet.
+
+        This method collects potentially incomplete data packets and
+        records the timestamp when the first part of the incomplete data
+        packet arrived.
+
+        Parameters
+        ----------
+        data : bytes
+            the data packet
+
+        """
+        if self.timestamp is None:
+            self.timestamp = time.time()
+        #logger.debug('Received maybe incomlete data: {data}'.format(data=data))
+        self.data = self.data + data
+
+    def found_terminator(self):
+        """Found a complete packet.
+
+        A complete data packet has arrived. Put the data packet with its
+        timestamp in the queue. And reset the timestamp.
+
+        """
+        # to something with data
+        #logger.debug('Received {data}'.format(data=self.data))
+        marker = self.data
+        if not isinstance(marker, str):
+            # Python 3
+            marker = marker.decode('utf-8', 'replace')
+        self.queue.put([self.timestamp, marker])
+        self.data = b''
+        self.timestamp = None
+
+    def handle_error(self):
+        """An error occurred.
+
+        """
+        logger.error('An error occurred.')
+        self.close()
+        # the default implementation prints a condensed tracebackk which
+        # is not useful at all, so we re-raise the exception
+        raise
+
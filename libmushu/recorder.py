@@ -0,0 +1,244 @@
+# recorder.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""
+This module provides ``mushu-record``, a recorder for the command line.
+
+In contrast to the GUI, the recorder needs no display and does not plot
+the data, it is meant for acquisition servers. It records an amplifier
+via the :class:`libmushu.ampdecorator.AmpDecorator` for a given
+duration or until it receives SIGINT or SIGTERM, and periodically prints
+statistics::
+
+    $ mushu-record --list
+    $ mushu-record gusbamp --duration 600 --output subject1
+    $ mushu-record sinusamp --preset 1 --duration 10
+
+The recorder only imports the driver of the selected amplifier and
+neither Tkinter nor matplotlib.
+
+"""
+
+
+from __future__ import division, print_function
+
+import argparse
+import json
+import logging
+import signal
+import sys
+import time
+
+import libmushu
+
+
+logger = logging.getLogger(__name__)
+logger.info('Logger started')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='mushu-record',
+        description='Record an amplifier without a GUI.')
+    parser.add_argument('amp', nargs='?',
+                        help='the name of the amplifier, see --list')
+    parser.add_argument('-l', '--list', action='store_true',
+                        help='list the available amplifiers and their presets and exit')
+    parser.add_argument('-p', '--preset',
+                        help='the name or index of the configuration preset')
+    parser.add_argument('-c', '--config', action='append', default=[], metavar='KEY=VALUE',
+                        help='a configuration parameter of the amplifier, the value is '
+                             'parsed as JSON if possible. Can be given several times and '
+                             'overrides the preset')
+    parser.add_argument('-o', '--output',
+                        help='record to OUTPUT.eeg, OUTPUT.marker and OUTPUT.meta')
+    parser.add_argument('-d', '--duration', type=float,
+                        help='stop after DURATION seconds, default: until SIGINT or SIGTERM')
+    parser.add_argument('-s', '--stats-interval', type=float, default=1, metavar='SECONDS',
+                        help='print statistics every SECONDS seconds, 0 disables them')
+    parser.add_argument('-t', '--threaded', action='store_true',
+                        help='read the amplifier in a separate thread')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='print debug messages')
+    args = parser.parse_args(argv)
+    if not args.list and args.amp is None:
+        parser.error('an amplifier is required unless --list is given')
+    return args
+
+
+def get_config(presets, preset, params):
+    """Get the configuration of the amplifier.
+
+    Parameters
+    ----------
+    presets : list of [str, dict]
+        the presets of the amplifier
+    preset : str or None
+        the name or index of the preset
+    params : list of str
+        ``KEY=VALUE`` strings which override the preset
+
+    Returns
+    -------
+    config : dict
+        the keyword arguments for ``configure``, None if the amplifier
+        should not be configured
+
+    Raises
+    ------
+    ValueError : if the preset or a parameter is invalid
+
+    """
+    if preset is None and not params:
+        return None
+    config = {}
+    if preset is not None:
+        names = [name for name, _ in presets]
+        if preset in names:
+            config.update(presets[names.index(preset)][1])
+        elif preset.isdigit() and int(preset) < len(presets):
+            config.update(presets[int(preset)][1])
+        else:
+            raise ValueError('Unknown preset: %s' % preset)
+    for param in params:
+        key, sep, value = param.partition('=')
+        if not sep:
+            raise ValueError('Invalid parameter, expected KEY=VALUE: %s' % param)
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        config[key] = value
+    return config
+
+
+def list_amps():
+    """Print the available amplifiers and their presets.
+
+    The presets are read from the driver classes, the drivers are not
+    instantiated as that would open the devices.
+
+    """
+    for name in libmushu.get_available_amps():
+        print(name)
+        for i, (preset, _) in enumerate(libmushu.get_driver(name).presets):
+            print('  %d: %s' % (i, preset))
+
+
+def format_stats(elapsed, rate, stats, markers):
+    return ('%8.1f s  %9d samples  %9.1f Hz  %6d markers  %6d lost  %6d dropped' %
+            (elapsed, stats['received_samples'], rate,
+             markers, stats['lost_samples'], stats['dropped_samples']))
+
+
+def record(amp, filename, duration, stats_interval):
+    """Record until the duration elapsed or a signal is received.
+
+    Returns
+    -------
+    stats : dict
+        the statistics of the amplifier after it stopped
+    markers : int
+        the number of received markers
+    elapsed : float
+        the duration of the recording in seconds
+
+    """
+    stopped = []
+
+    def stop(signum, frame):
+        logger.debug('Received signal %d, stopping.' % signum)
+        stopped.append(signum)
+
+    handlers = {}
+    for signum in signal.SIGINT, signal.SIGTERM:
+        handlers[signum] = signal.signal(signum, stop)
+    markers = 0
+    elapsed = 0
+    try:
+        amp.start(filename)
+        try:
+            t_start = time.time()
+            t_stats = t_start
+            samples_stats = 0
+            while not stopped:
+                data, marker = amp.get_data()
+                markers += len(marker)
+                now = time.time()
+                elapsed = now - t_start
+                if duration is not None and elapsed >= duration:
+                    break
+                if stats_interval and now - t_stats >= stats_interval:
+                    stats = amp.get_stats()
+                    rate = (stats['received_samples'] - samples_stats) / (now - t_stats)
+                    print(format_stats(elapsed, rate, stats, markers))
+                    sys.stdout.flush()
+                    t_stats = now
+                    samples_stats = stats['received_samples']
+        finally:
+            amp.stop()
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    return amp.get_stats(), markers, elapsed
+
+
+def main(argv=None):
+    """Run the recorder.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        the command line arguments, defaults to ``sys.argv[1:]``
+
+    Returns
+    -------
+    status : int
+        the exit status
+
+    """
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    if args.list:
+        list_amps()
+        return 0
+    try:
+        amp = libmushu.get_amp(args.amp, threaded=args.threaded)
+        config = get_config(amp.presets, args.preset, args.config)
+        if config is not None:
+            amp.configure(**config)
+    except (TypeError, ValueError) as e:
+        # a TypeError is raised for unknown configuration parameters
+        print('mushu-record: %s' % e, file=sys.stderr)
+        return 2
+    try:
+        stats, markers, elapsed = record(amp, args.output, args.duration, args.stats_interval)
+    except EnvironmentError as e:
+        # e.g. the output files exist already
+        print('mushu-record: %s' % e, file=sys.stderr)
+        return 1
+    print('Recorded %d samples and %d markers in %.1f s, effective sampling frequency %.3f Hz, '
+          '%d samples lost in %d gaps, %d samples dropped.' %
+          (stats['received_samples'], markers, elapsed, stats['effective_fs'],
+           stats['lost_samples'], stats['gaps'], stats['dropped_samples']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,308 @@
+# sharedmemory.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""
+This module provides the :class:`SharedMemoryPublisher` which publishes
+the data of an amplifier to other processes on the same computer.
+
+The publisher writes every block of data into a ring buffer in shared
+memory. Any number of processes can read the ring buffer via the
+:class:`libmushu.driver.sharedmemoryamp.SharedMemoryAmp` driver, without
+slowing down the process that owns the amplifier::
+
+    # producer
+    amp = libmushu.get_amp('gusbamp')
+    amp.add_sink(SharedMemoryPublisher('eeg'))
+    amp.start()
+    while True:
+        data, marker = amp.get_data()
+
+    # consumer, in another process
+    amp = libmushu.get_amp('sharedmemoryamp')
+    amp.configure(name='eeg')
+    amp.start()
+    while True:
+        data, marker = amp.get_data()
+
+The ring buffer is a memory mapped file in ``/dev/shm`` (or the
+temporary directory if ``/dev/shm`` does not exist) and consists of a
+fixed size header, the data ring and the marker ring. The header
+contains counters for the number of samples and markers written so far,
+the readers use them to find new data and to detect if the writer has
+overwritten data they did not read yet.
+
+"""
+
+
+from __future__ import division
+
+import glob
+import json
+import logging
+import mmap
+import os
+import tempfile
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+logger.info('Logger started')
+
+
+MAGIC = b'MUSHUSHM'
+VERSION = 1
+PREFIX = 'mushu-'
+if os.path.isdir('/dev/shm'):
+    SHM_DIR = '/dev/shm'
+else:
+    SHM_DIR = tempfile.gettempdir()
+
+# header: magic, control block, json encoded meta data
+CONTROL_FIELDS = ['version', 'closed', 'write_count', 'marker_count',
+                  'capacity', 'marker_capacity', 'data_offset',
+                  'marker_offset']
+CONTROL_OFFSET = len(MAGIC)
+META_OFFSET = CONTROL_OFFSET + 8 * len(CONTROL_FIELDS)
+META_SIZE = 2**16
+HEADER_SIZE = META_OFFSET + META_SIZE
+
+MARKER_DTYPE = np.dtype([('pos', '<f8'), ('text', 'S248')])
+
+
+def get_path(name):
+    """Get the path of the ring buffer file with the given name."""
+    return os.path.join(SHM_DIR, PREFIX + name)
+
+
+def get_available_rings():
+    """Get the names of all ring buffers on this computer.
+
+    Returns
+    -------
+    names : list of strings
+
+    """
+    paths = glob.glob(os.path.join(SHM_DIR, PREFIX + '*'))
+    return sorted(os.path.basename(p)[len(PREFIX):] for p in paths
+                  if not p.endswith('.tmp'))
+
+
+class Ring(object):
+    """A ring buffer in a memory mapped file.
+
+    This class only maps the file and provides numpy views on the
+    different parts of the ring buffer, reading and writing is done by
+    :class:`SharedMemoryPublisher` and
+    :class:`libmushu.driver.sharedmemoryamp.SharedMemoryAmp`.
+
+    """
+
+    def __init__(self, fh, writable):
+        """Map the file.
+
+        Parameters
+        ----------
+        fh : file
+            the open ring buffer file
+        writable : bool
+            map the file read-write or read-only
+
+        Raises
+        ------
+        ValueError : if the file is not a ring buffer
+
+        """
+        self.fh = fh
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        self.mm = mmap.mmap(fh.fileno(), 0, access=access)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a mushu shared memory ring buffer.')
+        self.control = np.frombuffer(self.mm, dtype='<u8', count=len(CONTROL_FIELDS), offset=CONTROL_OFFSET)
+        if self['version'] != VERSION:
+            raise ValueError('Unsupported ring buffer version: %d' % self['version'])
+        meta = self.mm[META_OFFSET:META_OFFSET + META_SIZE].rstrip(b'\x00')
+        self.meta = json.loads(meta.decode('utf-8'))
+        self.dtype = np.dtype(self.meta['dtype'])
+        self.n_channels = len(self.meta['channels'])
+        self.capacity = int(self['capacity'])
+        self.marker_capacity = int(self['marker_capacity'])
+        self.data = np.frombuffer(self.mm, dtype=self.dtype,
+                                  count=self.capacity * self.n_channels,
+                                  offset=int(self['data_offset'])).reshape(self.capacity, self.n_channels)
+        self.markers = np.frombuffer(self.mm, dtype=MARKER_DTYPE,
+                                     count=self.marker_capacity,
+                                     offset=int(self['marker_offset']))
+
+    def __getitem__(self, field):
+        return int(self.control[CONTROL_FIELDS.index(field)])
+
+    def __setitem__(self, field, value):
+        self.control[CONTROL_FIELDS.index(field)] = value
+
+    @staticmethod
+    def create(path, channels, fs, dtype, capacity, marker_capacity):
+        """Create a new ring buffer file.
+
+        Returns
+        -------
+        ring : Ring
+            the ring buffer, mapped read-write
+
+        """
+        dtype = np.dtype(dtype)
+        meta = json.dumps({'channels': channels, 'fs': fs, 'dtype': dtype.str}).encode('utf-8')
+        if len(meta) > META_SIZE:
+            raise ValueError('Too many channels for the ring buffer header.')
+        data_offset = HEADER_SIZE
+        marker_offset = data_offset + capacity * len(channels) * dtype.itemsize
+        # align the marker ring to 8 bytes
+        marker_offset += -marker_offset % 8
+        size = marker_offset + marker_capacity * MARKER_DTYPE.itemsize
+        # create the file under a temporary name and rename it when it
+        # is ready, so readers never see a half initialized file
+        tmp = path + '.tmp'
+        fh = open(tmp, 'w+b')
+        fh.truncate(size)
+        fh.write(MAGIC)
+        control = np.array([VERSION, 0, 0, 0, capacity, marker_capacity,
+                            data_offset, marker_offset], dtype='<u8')
+        fh.write(control.tobytes())
+        fh.write(meta)
+        fh.flush()
+        os.rename(tmp, path)
+        return Ring(fh, writable=True)
+
+    @staticmethod
+    def open(path):
+        """Open an existing ring buffer file.
+
+        Returns
+        -------
+        ring : Ring
+            the ring buffer, mapped read-only
+
+        """
+        return Ring(open(path, 'rb'), writable=False)
+
+    def close(self):
+        # the numpy views keep references to the mmap, we have to delete
+        # them before we can close it
+        del self.control, self.data, self.markers
+        self.mm.close()
+        self.fh.close()
+
+
+class SharedMemoryPublisher(object):
+    """Publish the data of an amplifier in shared memory.
+
+    The publisher is a sink for the
+    :class:`libmushu.ampdecorator.AmpDecorator`, see
+    :meth:`libmushu.ampdecorator.AmpDecorator.add_sink`. The ring buffer
+    is created when the amplifier is started and removed when it is
+    stopped.
+
+    """
+
+    def __init__(self, name, seconds=10, marker_capacity=4096, dtype=np.float32):
+        """Initialize the publisher.
+
+        Parameters
+        ----------
+        name : str
+            the name under which the readers find the ring buffer
+        seconds : float, optional
+            the capacity of the data ring in seconds
+        marker_capacity : int, optional
+            the capacity of the marker ring
+        dtype : numpy dtype, optional
+            the data type the samples are stored as
+
+        """
+        self.name = name
+        self.seconds = seconds
+        self.marker_capacity = marker_capacity
+        self.dtype = np.dtype(dtype)
+        self.ring = None
+
+    def open(self, amp):
+        """Create the ring buffer.
+
+        Parameters
+        ----------
+        amp : Amplifier
+            the amplifier whose data will be published
+
+        """
+        fs = amp.get_sampling_frequency()
+        capacity = int(max(1, self.seconds * fs))
+        self.path = get_path(self.name)
+        if os.path.exists(self.path):
+            logger.warning('Removing stale ring buffer %s.' % self.path)
+            os.remove(self.path)
+        self.ring = Ring.create(self.path, amp.get_channels(), fs, self.dtype,
+                                capacity, self.marker_capacity)
+        self.fs = fs
+        logger.debug('Created ring buffer %s.' % self.path)
+
+    def write(self, data, marker, t0):
+        """Write a block of data and markers into the ring buffer.
+
+        Parameters
+        ----------
+        data : 2darray
+            the block of data
+        marker : list of (float, str)
+            the markers, the timestamps are in ms relative to the onset
+            of the block
+        t0 : float
+            the host time of the onset of the block
+
+        """
+        ring = self.ring
+        written = ring['write_count']
+        # markers are stored with their absolute sample position
+        marker_count = ring['marker_count']
+        for ts, m in marker:
+            slot = marker_count % ring.marker_capacity
+            ring.markers['pos'][slot] = written + ts * self.fs / 1000
+            ring.markers['text'][slot] = str(m).encode('utf-8')
+            marker_count += 1
+        # copy the data into the ring, in at most two slices. if the
+        # block is larger than the ring, only its end is kept
+        n_total = len(data)
+        data = data[-ring.capacity:]
+        n = len(data)
+        start = (written + n_total - n) % ring.capacity
+        first = min(n, ring.capacity - start)
+        ring.data[start:start+first] = data[:first]
+        ring.data[:n-first] = data[first:]
+        # publish the new markers and samples. the counters are updated
+        # last, so readers only see data that is completely written
+        ring['marker_count'] = marker_count
+        ring['write_count'] = written + n_total
+
+    def close(self):
+        """Mark the ring buffer as closed and remove it."""
+        if self.ring is None:
+            return
+        self.ring['closed'] = 1
+        self.ring.close()
+        self.ring = None
+        os.remove(self.path)
+        logger.debug('Removed ring buffer %s.' % self.path)
@@ -0,0 +1,310 @@
+# streamserver.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""
+This module provides the :class:`StreamServer` which streams the data of
+an amplifier to other computers via TCP or to other processes via a
+Unix domain socket.
+
+The server is a sink for the :class:`libmushu.ampdecorator.AmpDecorator`
+and the clients use the :class:`libmushu.driver.netamp.NetAmp` driver::
+
+    # server
+    amp = libmushu.get_amp('gusbamp')
+    amp.add_sink(StreamServer(port=12345))
+    amp.start()
+    while True:
+        data, marker = amp.get_data()
+
+    # client, on another computer
+    amp = libmushu.get_amp('netamp')
+    amp.configure(host='eeg-server', port=12345)
+    amp.start()
+    while True:
+        data, marker = amp.get_data()
+
+The protocol consists of messages with an 8 byte header: the 4 byte
+message type and the length of the payload as little endian unsigned
+int. The first message a client receives is a ``HEAD`` message with the
+JSON encoded channel names, sampling frequency, data type and sample
+counter channel of the amplifier. All following messages are ``DATA``
+messages, whose payload consists of the onset of the block in host time
+(double), the number of samples written before the block (unsigned long
+long), the number of samples and the length of the JSON encoded markers
+(unsigned ints), the markers and the raw samples.
+
+Every client has its own bounded queue of messages, if a client is too
+slow, its oldest messages are dropped, so it can never stall the
+acquisition. The clients detect dropped messages by the number of
+samples written before each block.
+
+"""
+
+
+from __future__ import division
+
+from collections import deque
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+logger.info('Logger started')
+
+
+PORT = 12345
+
+MESSAGE_HEADER = struct.Struct('<4sI')
+DATA_HEADER = struct.Struct('<dQII')
+HEAD = b'HEAD'
+DATA = b'DATA'
+
+
+class StreamServer(object):
+    """Stream the data of an amplifier to any number of clients."""
+
+    def __init__(self, host='', port=PORT, path=None, queue_size=256, dtype=np.float32):
+        """Initialize the server.
+
+        Parameters
+        ----------
+        host : str, optional
+            the interface the TCP server listens on, defaults to all
+            interfaces
+        port : int, optional
+            the port the TCP server listens on
+        path : str, optional
+            if given, listen on a Unix domain socket with this path
+            instead of TCP
+        queue_size : int, optional
+            the maximum number of blocks queued per client
+        dtype : numpy dtype, optional
+            the data type of the samples on the wire
+
+        """
+        self.host = host
+        self.port = port
+        self.path = path
+        self.queue_size = queue_size
+        self.dtype = np.dtype(dtype)
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+
+    def open(self, amp):
+        """Start listening for clients.
+
+        Parameters
+        ----------
+        amp : Amplifier
+            the amplifier whose data will be streamed
+
+        """
+        meta = {'channels': amp.get_channels(),
+                'fs': amp.get_sampling_frequency(),
+                'dtype': self.dtype.str,
+                'counter': amp.get_counter()}
+        self.samples = 0
+        meta = json.dumps(meta).encode('utf-8')
+        self.head = MESSAGE_HEADER.pack(HEAD, len(meta)) + meta
+        if self.path is not None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(self.path)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind((self.host, self.port))
+            # the port may have been chosen by the os
+            self.port = self.sock.getsockname()[1]
+        self.sock.listen(5)
+        # timeout for accept, so the thread can be stopped
+        self.sock.settimeout(0.1)
+        self.running.set()
+        self.accept_thread = threading.Thread(target=self._accept_loop, name='StreamServerAccept')
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+        logger.debug('Stream server listening.')
+
+    def write(self, data, marker, t0):
+        """Send a block of data and markers to all clients.
+
+        Parameters
+        ----------
+        data : 2darray
+            the block of data
+        marker : list of (float, str)
+            the markers, the timestamps are in ms relative to the onset
+            of the block
+        t0 : float
+            the host time of the onset of the block
+
+        """
+        # the data is sent asynchronously, so it is always copied, the
+        # caller may reuse its array
+        data = np.array(data, dtype=self.dtype, order='C')
+        marker = json.dumps([[ts, str(m)] for ts, m in marker]).encode('utf-8')
+        payload_len = DATA_HEADER.size + len(marker) + data.nbytes
+        header = (MESSAGE_HEADER.pack(DATA, payload_len) +
+                  DATA_HEADER.pack(t0, self.samples, len(data), len(marker)) +
+                  marker)
+        self.samples += len(data)
+        # the same buffers are queued for all clients
+        message = (header, _byte_view(data))
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def close(self):
+        """Stop the server and disconnect all clients."""
+        self.running.clear()
+        self.accept_thread.join()
+        self.sock.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for subscriber in subscribers:
+            subscriber.close()
+        logger.debug('Stream server stopped.')
+
+    def get_stats(self):
+        """Get the number of dropped blocks per client.
+
+        Returns
+        -------
+        stats : list of (address, int)
+
+        """
+        with self.lock:
+            return [(s.address, s.dropped) for s in self.subscribers]
+
+    def _accept_loop(self):
+        while self.running.is_set():
+            try:
+                sock, address = self.sock.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                if self.running.is_set():
+                    logger.error('Error while accepting a client.', exc_info=True)
+                continue
+            logger.debug('Client connected: %s' % (address,))
+            sock.settimeout(None)
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            subscriber = Subscriber(sock, address, self.queue_size, self._remove)
+            subscriber.put((self.head,))
+            with self.lock:
+                self.subscribers.append(subscriber)
+
+    def _remove(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+
+def _byte_view(data):
+    """Get a zero-copy byte buffer of a contiguous array."""
+    try:
+        return memoryview(data.reshape(-1)).cast('B')
+    except AttributeError:
+        # Python 2
+        return buffer(data)
+
+
+class Subscriber(object):
+    """A connected client of the :class:`StreamServer`.
+
+    Each client has its own queue and thread that sends the queued
+    messages.
+
+    """
+
+    def __init__(self, sock, address, queue_size, on_disconnect):
+        self.sock = sock
+        self.address = address
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.cond = threading.Condition()
+        self.dropped = 0
+        self.running = True
+        self.on_disconnect = on_disconnect
+        self.thread = threading.Thread(target=self._send_loop, name='StreamServerSend')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, message):
+        """Queue a message, dropping the oldest if the queue is full."""
+        with self.cond:
+            if len(self.queue) >= self.queue_size:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append(message)
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        # a client which stopped reading blocks the send, shutting down
+        # the socket makes it fail
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.thread.join()
+        self.sock.close()
+
+    def _send_loop(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait(0.1)
+                if not self.running:
+                    return
+                message = self.queue.popleft()
+            try:
+                self._send(message)
+            except socket.error:
+                logger.debug('Client disconnected: %s' % (self.address,))
+                self.running = False
+                self.sock.close()
+                self.on_disconnect(self)
+                return
+
+    def _send(self, buffers):
+        if hasattr(self.sock, 'sendmsg'):
+            total = sum(len(b) for b in buffers)
+            sent = self.sock.sendmsg(buffers)
+            if sent == total:
+                return
+            # partial send, send the rest as a single buffer
+            rest = b''.join(bytes(b) for b in buffers)[sent:]
+            self.sock.sendall(rest)
+        else:
+            for b in buffers:
+                self.sock.sendall(b)
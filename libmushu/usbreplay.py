@@ -0,0 +1,454 @@
+# usbreplay.py
+# Copyright (C) 2013  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""
+This module replays USB traffic captured with usbmon, so the USB drivers
+can be run, tested and benchmarked without the hardware.
+
+The captures in ``usb-dumps`` are in the text format of usbmon, to
+create new ones, run ``tools/usbmon/setup.sh`` and read the bus the
+amplifier is connected to::
+
+    $ cat /sys/kernel/debug/usb/usbmon/2u > capture.mon
+
+The :class:`ReplayHandle` emulates a device handle of the legacy pyusb
+API used by :class:`libmushu.driver.gtec.GUSBamp` and a device of the
+pyusb 1.0 API used by :class:`libmushu.driver.emotiv.Epoc`. It returns
+the captured payloads of the in-endpoints and checks the control
+messages the driver sends against the capture. :func:`replay` makes the
+drivers find the replayed device instead of real hardware::
+
+    handle = ReplayHandle(read_dump('usb-dumps/set-sine-amp-1-10-2000.mon'))
+    with replay(handle):
+        amp = GUSBamp()
+    amp.start()
+    data, marker = amp.get_data()
+
+Note that usbmon captures at most 32 bytes of every transfer in the text
+format, longer payloads are padded with zeros to their original length.
+
+"""
+
+
+from __future__ import division
+
+import array
+import binascii
+import errno
+from collections import namedtuple
+from contextlib import contextmanager
+import logging
+import struct
+
+import usb
+import usb.core
+import usb.util
+
+
+logger = logging.getLogger(__name__)
+logger.info('Logger started')
+
+
+LIBUSB_ERROR_TIMEOUT = -7
+
+
+class Urb(namedtuple('Urb', ['tag', 'timestamp', 'event', 'type', 'bus', 'device',
+                             'endpoint', 'status', 'setup', 'length', 'data'])):
+    """One event of a USB request block in a usbmon capture.
+
+    The ``event`` is ``S`` for submissions, ``C`` for callbacks and
+    ``E`` for errors, the ``type`` is the transfer type and direction
+    like ``Ci`` or ``Bo``. ``setup`` is the tuple (bmRequestType,
+    bRequest, wValue, wIndex, wLength) for control submissions and None
+    otherwise, ``data`` the captured bytes or None if no data was
+    captured.
+
+    """
+    __slots__ = ()
+
+
+def parse(lines):
+    """Parse the lines of a usbmon text capture.
+
+    Isochronous transfers are not supported and skipped.
+
+    Parameters
+    ----------
+    lines : iterable of str
+
+    Returns
+    -------
+    urbs : generator of :class:`Urb`
+
+    Raises
+    ------
+    ValueError : if a line is malformed
+
+    """
+    for lineno, line in enumerate(lines, 1):
+        words = line.split()
+        if not words:
+            continue
+        try:
+            urb = _parse_words(words)
+        except (IndexError, ValueError, TypeError):
+            raise ValueError('Malformed usbmon line %d: %s' % (lineno, line.strip()))
+        if urb is not None:
+            yield urb
+
+
+def _parse_words(words):
+    tag, timestamp, event, address = words[:4]
+    type_, bus, device, endpoint = address.split(':')
+    if type_.startswith('Z'):
+        return None
+    rest = words[4:]
+    setup, status = None, None
+    if rest[0] == 's':
+        setup = tuple(int(w, 16) for w in rest[1:6])
+        rest = rest[6:]
+    else:
+        # interrupt transfers have the interval after the status
+        status = int(rest[0].split(':')[0])
+        rest = rest[1:]
+    length = int(rest[0]) if rest else 0
+    data = None
+    if len(rest) > 1 and rest[1] == '=':
+        data = binascii.unhexlify(''.join(rest[2:]))
+    return Urb(tag, int(timestamp), event, type_, int(bus), int(device),
+               int(endpoint), status, setup, length, data)
+
+
+def read_dump(path, bus=None, device=None):
+    """Read the transfers of one device from a usbmon text capture.
+
+    A capture contains the transfers of all devices on the bus, only
+    the transfers of one device are returned. The captures of several
+    sessions with the same device can be concatenated.
+
+    Parameters
+    ----------
+    path : str
+    bus, device : int, optional
+        the address of the device, defaults to the first device which
+        received vendor specific control messages, which is usually
+        the amplifier
+
+    Returns
+    -------
+    urbs : list of :class:`Urb`
+
+    Raises
+    ------
+    ValueError : if the capture contains no matching device
+
+    """
+    with open(path) as fh:
+        urbs = list(parse(fh))
+    if device is None:
+        for urb in urbs:
+            if (urb.setup is not None and urb.setup[0] & 0x60 == 0x40 and
+                    bus in (None, urb.bus)):
+                bus, device = urb.bus, urb.device
+                break
+        else:
+            raise ValueError('No device with vendor requests in %s.' % path)
+    urbs = [u for u in urbs if u.device == device and bus in (None, u.bus)]
+    if not urbs:
+        raise ValueError('Device %s:%03d not in %s.' % (bus, device, path))
+    return urbs
+
+
+class ReplayError(Exception):
+    """A driver sent a control message the replayed device does not know."""
+    pass
+
+
+class ReplayHandle(object):
+    """A fake pyusb device replaying a usbmon capture.
+
+    Every read of an in-endpoint returns the payload of the next
+    completed transfer of that endpoint in the capture. If all payloads
+    are consumed, reads time out like on a real device, unless ``loop``
+    is set.
+
+    Every control message is checked against the control messages in
+    the capture. Requests the device never received in the capture
+    raise a :class:`ReplayError`. In ``strict`` mode the control
+    messages must match the capture exactly, including their values and
+    data, and in the same order.
+
+    The issued control messages are recorded in :attr:`control` as
+    tuples of (setup, data).
+
+    """
+
+    iSerialNumber = 3
+
+    def __init__(self, urbs, strict=False, loop=False, id_vendor=None,
+                 id_product=None, serial=None):
+        """Initialize the handle.
+
+        Parameters
+        ----------
+        urbs : list of :class:`Urb`
+            the transfers of the device, see :func:`read_dump`
+        strict : bool, optional
+            require control messages to match the capture exactly
+        loop : bool, optional
+            restart the payloads from the beginning when they are
+            consumed
+        id_vendor, id_product : int, optional
+            the USB ids of the device, default to the ids from the
+            device descriptor in the capture, if it contains one
+        serial : str, optional
+            the serial number reported to ``usb.util.get_string``
+
+        """
+        self.strict = strict
+        self.loop = loop
+        self.serial = serial
+        self.truncated = 0
+        self.payloads = {}
+        self.expected = []
+        submitted = {}
+        for urb in urbs:
+            if urb.type[0] == 'C':
+                if urb.event == 'S':
+                    submitted[urb.tag] = len(self.expected)
+                    self.expected.append((urb.setup, urb.data or b'', None))
+                elif urb.event == 'C' and urb.tag in submitted:
+                    # the response of a control in transfer
+                    i = submitted.pop(urb.tag)
+                    setup, data, _ = self.expected[i]
+                    self.expected[i] = (setup, data, self._pad(urb))
+            elif urb.type[1] == 'i' and urb.event == 'C' and urb.status == 0 and urb.length > 0:
+                self.payloads.setdefault(urb.endpoint | usb.ENDPOINT_IN, []).append(self._pad(urb))
+        self.known_requests = set((s[0], s[1]) for s, _, _ in self.expected)
+        self.id_vendor, self.id_product = id_vendor, id_product
+        for setup, _, response in self.expected:
+            # the device descriptor
+            if setup[:3] == (0x80, 0x06, 0x0100) and response and len(response) >= 12:
+                vendor, product = struct.unpack('<HH', response[8:12])
+                if self.id_vendor is None:
+                    self.id_vendor = vendor
+                if self.id_product is None:
+                    self.id_product = product
+                break
+        if self.truncated:
+            logger.warning('%d payloads were truncated in the capture and are padded with zeros.' % self.truncated)
+        self.rewind()
+
+    def _pad(self, urb):
+        data = urb.data or b''
+        if len(data) < urb.length:
+            self.truncated += 1
+            data += b'\x00' * (urb.length - len(data))
+        return data
+
+    def rewind(self):
+        """Restart the replay from the beginning of the capture."""
+        self.control = []
+        self._position = dict((ep, 0) for ep in self.payloads)
+        self._rest = dict((ep, b'') for ep in self.payloads)
+        self._next_control = 0
+
+    def _read(self, endpoint, size):
+        endpoint |= usb.ENDPOINT_IN
+        rest = self._rest.get(endpoint, b'')
+        if not rest:
+            payloads = self.payloads.get(endpoint, [])
+            i = self._position.get(endpoint, 0)
+            if i >= len(payloads):
+                if not self.loop or not payloads:
+                    # like the timeout of the libusb backend
+                    raise usb.core.USBError('Operation timed out', LIBUSB_ERROR_TIMEOUT,
+                                            errno.ETIMEDOUT)
+                i = 0
+            rest = payloads[i]
+            self._position[endpoint] = i + 1
+        self._rest[endpoint] = rest[size:]
+        return array.array('B', rest[:size])
+
+    def _control(self, setup, data):
+        """Validate a control message and get the captured response."""
+        self.control.append((setup, data))
+        if (setup[0], setup[1]) not in self.known_requests:
+            raise ReplayError('Unknown request 0x%02x 0x%02x.' % setup[:2])
+        candidates = list(enumerate(self.expected))
+        if self.strict:
+            candidates = candidates[self._next_control:self._next_control+1]
+        for i, (expected, expected_data, response) in candidates:
+            out = not setup[0] & usb.ENDPOINT_IN
+            if expected == setup and (not out or data.startswith(expected_data)):
+                self._next_control = i + 1
+                return response
+        if self.strict:
+            raise ReplayError('Unexpected control message %s, expected %s.' %
+                              (_format_setup(setup), _format_setup(candidates[0][1][0]) if candidates else None))
+        # a known request with other parameters, like a different
+        # sampling frequency
+        return None
+
+    # legacy pyusb API
+
+    def setConfiguration(self, configuration):
+        pass
+
+    def claimInterface(self, interface):
+        pass
+
+    def releaseInterface(self):
+        pass
+
+    def setAltInterface(self, alternate):
+        pass
+
+    def reset(self):
+        pass
+
+    def controlMsg(self, requestType, request, buffer, value=0, index=0, timeout=100):
+        if isinstance(buffer, int):
+            data, length = b'', buffer
+        else:
+            data = _to_bytes(buffer)
+            length = len(data)
+        response = self._control((requestType, request, value, index, length), data)
+        if requestType & usb.ENDPOINT_IN:
+            return tuple(bytearray((response or b'')[:length]))
+        return length
+
+    def bulkRead(self, endpoint, size, timeout=100):
+        return self._read(endpoint, size)
+
+    interruptRead = bulkRead
+
+    # pyusb 1.0 API
+
+    def is_kernel_driver_active(self, interface):
+        return False
+
+    def detach_kernel_driver(self, interface):
+        pass
+
+    def set_configuration(self, configuration=None):
+        pass
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0, data_or_wLength=None, timeout=None):
+        if data_or_wLength is None or isinstance(data_or_wLength, int):
+            data, length = b'', data_or_wLength or 0
+        else:
+            data = _to_bytes(data_or_wLength)
+            length = len(data)
+        response = self._control((bmRequestType, bRequest, wValue, wIndex, length), data)
+        if bmRequestType & usb.ENDPOINT_IN:
+            return bytearray((response or b'')[:length])
+        return length
+
+    def read(self, endpoint, size_or_buffer, timeout=None):
+        return self._read(endpoint, size_or_buffer)
+
+
+def _to_bytes(buffer):
+    if isinstance(buffer, bytes):
+        return buffer
+    if isinstance(buffer, str):
+        return buffer.encode('latin-1')
+    return bytes(bytearray(buffer))
+
+
+def _format_setup(setup):
+    if setup is None:
+        return None
+    return '%02x %02x %04x %04x %04x' % setup
+
+
+class _Interface(object):
+    interfaceNumber = 0
+    alternateSetting = 0
+
+
+class _Configuration(object):
+    value = 1
+    interfaces = [[_Interface()]]
+
+
+class _Device(object):
+    """A device of the legacy pyusb API opening the replay handle."""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.idVendor = handle.id_vendor
+        self.idProduct = handle.id_product
+        self.configurations = [_Configuration()]
+
+    def open(self):
+        return self.handle
+
+
+class _Bus(object):
+
+    def __init__(self, devices):
+        self.devices = devices
+
+
+@contextmanager
+def replay(*handles):
+    """Make the USB drivers find the replayed devices.
+
+    While active, the device enumeration of the legacy and the 1.0
+    pyusb API only find the given handles.
+
+    Parameters
+    ----------
+    handles : :class:`ReplayHandle`
+
+    """
+    def busses():
+        return [_Bus([_Device(h) for h in handles])]
+
+    def find(find_all=False, **kwargs):
+        found = [h for h in handles
+                 if kwargs.get('idVendor', h.id_vendor) == h.id_vendor and
+                 kwargs.get('idProduct', h.id_product) == h.id_product]
+        if find_all:
+            return iter(found)
+        return found[0] if found else None
+
+    def get_string(dev, index, langid=None):
+        if dev in handles:
+            return dev.serial
+        return original[usb.util, 'get_string'](dev, index, langid)
+
+    def claim_interface(dev, interface):
+        if dev not in handles:
+            original[usb.util, 'claim_interface'](dev, interface)
+
+    patches = [(usb, 'busses', busses),
+               (usb.core, 'find', find),
+               (usb.util, 'get_string', get_string),
+               (usb.util, 'claim_interface', claim_interface)]
+    original = {}
+    for module, name, function in patches:
+        original[module, name] = getattr(module, name)
+        setattr(module, name, function)
+    try:
+        yield
+    finally:
+        for (module, name), function in original.items():
+            setattr(module, name, function)
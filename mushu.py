@@ -19,6 +19,8 @@
 
 
 import logging
+import Queue
+import threading
 import time
 import ttk
 import Tkinter as tk
@@ -47,7 +49,15 @@ class Gui(ttk.Frame):
         self.master.title('Mushu')
         self.pack()
 
-        self.available_amps = libmushu.get_available_amps()
+        # the amplifiers are added to the list as they are found, so
+        # the gui does not freeze while slow amplifiers are tested
+        self.available_amps = []
+        self.amp_queue = Queue.Queue()
+        t = threading.Thread(target=libmushu.get_available_amps,
+                             kwargs={'callback': self.on_amp_reported},
+                             name='AmpDiscovery')
+        t.daemon = True
+        t.start()
 
         frame = tk.Frame(self)
         frame.pack(fill=tk.BOTH, expand=1)
@@ -84,6 +94,19 @@ class Gui(ttk.Frame):
 
         self.init_plot()
         self.master.after_idle(self.visualizer)
+        self.master.after(100, self.update_amp_list)
+
+    def on_amp_reported(self, name, available):
+        # called by the discovery thread, tk must only be used by the
+        # main thread
+        if available:
+            self.amp_queue.put(name)
+
+    def update_amp_list(self):
+        while not self.amp_queue.empty():
+            self.available_amps.append(self.amp_queue.get())
+            self.amp_combobox.configure(values=self.available_amps)
+        self.master.after(100, self.update_amp_list)
 
     def onStartStopButtonClicked(self):
         logger.debug('Start.')
@@ -34,6 +34,6 @@ setup(
         'Topic :: Software Development :: Libraries',
         ],
     packages = ['libmushu', 'libmushu.driver'],
-    scripts = ['mushu.py'],
+    scripts = ['mushu.py', 'mushu-record'],
 )
 
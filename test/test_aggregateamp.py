@@ -0,0 +1,141 @@
+from __future__ import division
+
+import threading
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from libmushu.amplifier import Amplifier
+from libmushu.driver.aggregateamp import AggregateAmp
+
+
+class ClockAmp(Amplifier):
+    """Amplifier whose only channel is the time of the sample in s."""
+
+    def __init__(self, fs, blocksize):
+        self.fs = fs
+        self.blocksize = blocksize
+
+    def start(self):
+        self.t_start = time.time()
+        self.n = 0
+
+    def get_data(self):
+        self.n += self.blocksize
+        dt = self.t_start + self.n / self.fs - time.time()
+        if dt > 0:
+            time.sleep(dt)
+        data = (np.arange(self.n - self.blocksize, self.n) / self.fs + self.t_start).reshape(-1, 1)
+        marker = []
+        if self.n % (5 * self.blocksize) == 0:
+            marker = [[0., 'fs=%d' % self.fs]]
+        return data, marker
+
+    def get_channels(self):
+        return ['Time']
+
+    def get_sampling_frequency(self):
+        return self.fs
+
+
+class ManualAmp(Amplifier):
+    """Amplifier whose blocks are put into its stream by the test."""
+
+    def __init__(self, fs):
+        self.fs = fs
+
+    def start(self):
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def get_data(self):
+        self.stopped.wait()
+        return np.empty((0, 1)), []
+
+    def get_channels(self):
+        return ['Time']
+
+    def get_sampling_frequency(self):
+        return self.fs
+
+
+class TestAggregateAmp(TestCase):
+
+    def test_alignment(self):
+        """Slower amplifiers are resampled to the time line of the master."""
+        amp = AggregateAmp()
+        amp.configure(amps=[ClockAmp(100, 4), ClockAmp(500, 10)])
+        self.assertEqual(amp.master, 1)
+        self.assertEqual(amp.get_sampling_frequency(), 500)
+        self.assertEqual(amp.get_channels(), ['Time', 'Time (amp 1)'])
+        amp.start()
+        data, markers = [], []
+        t_end = time.time() + .5
+        while time.time() < t_end:
+            d, m = amp.get_data()
+            data.append(d)
+            markers.extend(m)
+        amp.stop()
+        data = np.concatenate(data)
+        self.assertGreater(len(data), 100)
+        # the master is not resampled
+        np.testing.assert_allclose(np.diff(data[:, 1]), 1 / 500, atol=1e-6)
+        # the slave is aligned up to the jitter of the arrival times
+        self.assertLess(np.abs(data[50:, 0] - data[50:, 1]).max(), .02)
+        self.assertEqual(set(m for _, m in markers), set(['fs=100', 'fs=500']))
+
+    def test_error(self):
+        """An exception of an amplifier is raised by get_data."""
+        class FailingAmp(ClockAmp):
+            def get_data(self):
+                if self.n >= 20:
+                    raise IOError('device lost')
+                return ClockAmp.get_data(self)
+        amp = AggregateAmp()
+        amp.configure(amps=[ClockAmp(100, 4), FailingAmp(100, 4)])
+        amp.start()
+        with self.assertRaises(IOError):
+            t_end = time.time() + 2
+            while time.time() < t_end:
+                amp.get_data()
+        amp.stop()
+
+    def test_stop_blocked(self):
+        """stop does not wait forever for an amplifier that blocks."""
+        class BlockingAmp(ClockAmp):
+            def get_data(self):
+                if self.n >= 20:
+                    time.sleep(5)
+                return ClockAmp.get_data(self)
+        amp = AggregateAmp()
+        amp.configure(amps=[ClockAmp(100, 4), BlockingAmp(100, 4)])
+        amp.start()
+        time.sleep(.3)
+        t = time.time()
+        amp.stop()
+        self.assertLess(time.time() - t, 2)
+
+    def test_is_available(self):
+        """The amplifier has to be configured and is never listed."""
+        self.assertFalse(AggregateAmp.is_available())
+
+    def test_sample_index(self):
+        """A block arriving with its last sample aligns the amplifiers exactly."""
+        amp = AggregateAmp()
+        amp.configure(amps=[ManualAmp(500), ManualAmp(100)])
+        amp.start()
+        try:
+            master, slave = amp.streams
+            with amp.cond:
+                for stream, blocksize, n in (master, 10, 200), (slave, 2, 40):
+                    for end in range(blocksize, n + 1, blocksize):
+                        t = np.arange(end - blocksize, end) / stream.fs
+                        stream.blocks.append((t[-1], t.reshape(-1, 1), []))
+            data, marker = amp.get_data()
+        finally:
+            amp.stop()
+        self.assertGreater(len(data), 100)
+        np.testing.assert_allclose(data[:, 1], data[:, 0], atol=1e-9)
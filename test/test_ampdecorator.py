@@ -0,0 +1,412 @@
+from __future__ import division
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import numpy as np
+
+from libmushu import markerserver
+from libmushu.ampdecorator import AmpDecorator, BlockStream
+from libmushu.amplifier import Amplifier
+from libmushu.clock import VirtualClock, system_clock
+
+
+class BlockAmp(Amplifier):
+    """Amplifier returning blocks of 10 samples with one marker each."""
+
+    clock = system_clock
+
+    def __init__(self):
+        self.count = 0
+
+    def get_data(self):
+        self.clock.sleep(0.001)
+        data = np.arange(self.count, self.count + 10).reshape(-1, 1)
+        self.count += 10
+        return data, [[5., 'm%d' % (self.count // 10)]]
+
+    def get_channels(self):
+        return ['Ch_0']
+
+    def get_sampling_frequency(self):
+        return 1000
+
+
+class CounterAmp(BlockAmp):
+    """Amplifier with a sample counter that loses every 4th block."""
+
+    def get_data(self):
+        while True:
+            data, marker = BlockAmp.get_data(self)
+            if self.count % 40 != 30:
+                break
+        counter = data % 16
+        return np.hstack([counter, data]), marker
+
+    def get_channels(self):
+        return ['Counter', 'Ch_0']
+
+    def get_counter(self):
+        return 0, 16
+
+
+class TestThreadedAcquisition(TestCase):
+
+    def test_blocks_are_merged(self):
+        """All queued blocks are returned as one block."""
+        amp = AmpDecorator(BlockAmp, threaded=True)
+        amp.start()
+        time.sleep(.05)
+        data, marker = amp.get_data()
+        amp.stop()
+        self.assertGreater(len(data), 10)
+        self.assertEqual(len(data) % 10, 0)
+        np.testing.assert_array_equal(data.ravel(), np.arange(len(data)))
+        self.assertEqual(len(marker), len(data) // 10)
+        # markers are relative to the onset of the merged block
+        for i, (ts, m) in enumerate(marker):
+            self.assertAlmostEqual(ts, 5 + 10 * i)
+            self.assertEqual(m, 'm%d' % (i + 1))
+
+    def test_overflow(self):
+        """A full queue drops the oldest blocks and records a gap."""
+        amp = AmpDecorator(BlockAmp, threaded=True, queue_size=2)
+        amp.start()
+        time.sleep(.05)
+        data, marker = amp.get_data()
+        stats = amp.get_stats()
+        amp.stop()
+        self.assertLessEqual(len(data), 20)
+        self.assertGreater(stats['overflows'], 0)
+        dropped = stats['dropped_samples']
+        self.assertEqual(dropped, 10 * stats['overflows'])
+        self.assertEqual(amp.gaps, [[0, dropped]])
+        self.assertEqual(amp.amp_samples, dropped + len(data))
+        # the data continues after the dropped samples, the markers of
+        # the dropped blocks are kept with negative timestamps
+        np.testing.assert_array_equal(data.ravel(), np.arange(dropped, dropped + len(data)))
+        n = (dropped + len(data)) // 10
+        self.assertEqual(marker, [[10. * i + 5 - dropped, 'm%d' % (i + 1)] for i in range(n)])
+
+    def test_overflow_fill_gaps(self):
+        """Dropped samples are filled like gaps."""
+        amp = AmpDecorator(BlockAmp, threaded=True, queue_size=2, fill_gaps=True)
+        amp.start()
+        time.sleep(.05)
+        data, marker = amp.get_data()
+        stats = amp.get_stats()
+        amp.stop()
+        dropped = stats['dropped_samples']
+        self.assertGreater(dropped, 0)
+        self.assertTrue(np.isnan(data[:dropped]).all())
+        np.testing.assert_array_equal(data[dropped:].ravel(), np.arange(dropped, len(data)))
+        self.assertEqual(marker, [[10. * i + 5, 'm%d' % (i + 1)] for i in range(len(data) // 10)])
+
+
+class BlockingAmp(BlockAmp):
+    """Amplifier whose get_data blocks after the first block until it is stopped."""
+
+    def start(self):
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def get_data(self):
+        if self.count > 0:
+            self.stopped.wait()
+            raise IOError('Amplifier stopped.')
+        return BlockAmp.get_data(self)
+
+
+class TestThreadedStop(TestCase):
+
+    def test_blocked_amplifier(self):
+        """stop does not wait forever for an amplifier blocking in get_data."""
+        amp = AmpDecorator(BlockingAmp, threaded=True, clock=VirtualClock())
+        amp.start()
+        time.sleep(.1)
+        t = time.time()
+        amp.stop()
+        self.assertLess(time.time() - t, 2)
+        self.assertTrue(amp.amp.stopped.is_set())
+
+
+class TestIterBlocks(TestCase):
+
+    def setUp(self):
+        self.amp = AmpDecorator(BlockAmp, clock=VirtualClock())
+        self.amp.start()
+
+    def tearDown(self):
+        self.amp.stop()
+
+    def test_fixed_size_blocks(self):
+        """Blocks have a fixed size and are contiguous."""
+        blocks = self.amp.iter_blocks(25)
+        for i in range(8):
+            data, marker = next(blocks)
+            self.assertEqual(data.shape, (25, 1))
+            np.testing.assert_array_equal(data.ravel(), np.arange(25 * i, 25 * (i + 1)))
+
+    def test_overlapping_blocks(self):
+        """Blocks start hop samples apart."""
+        blocks = self.amp.iter_blocks(25, hop=10)
+        for i in range(8):
+            data, marker = next(blocks)
+            np.testing.assert_array_equal(data.ravel(), np.arange(10 * i, 10 * i + 25))
+
+    def test_gaps_between_blocks(self):
+        """hop > block_samples skips samples."""
+        blocks = self.amp.iter_blocks(5, hop=15)
+        for i in range(8):
+            data, marker = next(blocks)
+            np.testing.assert_array_equal(data.ravel(), np.arange(15 * i, 15 * i + 5))
+
+    def test_markers_between_blocks(self):
+        """Markers in the samples between two blocks are dropped."""
+        blocks = self.amp.iter_blocks(5, hop=15)
+        markers = [next(blocks)[1] for i in range(4)]
+        # markers at samples 5, 15, 25, 35, 45, blocks at 0, 15, 30, 45
+        self.assertEqual(markers, [[], [[0., 'm2']], [], [[0., 'm5']]])
+
+    def test_marker_retiming(self):
+        """Markers are relative to the onset of each block."""
+        blocks = self.amp.iter_blocks(25, hop=10)
+        data, marker = next(blocks)
+        # markers at samples 5, 15
+        self.assertEqual(marker, [[5., 'm1'], [15., 'm2']])
+        data, marker = next(blocks)
+        # markers at samples 15, 25 relative to sample 10
+        self.assertEqual(marker, [[5., 'm2'], [15., 'm3']])
+
+    def test_stream(self):
+        """stream is an asynchronous version of iter_blocks."""
+        try:
+            import asyncio
+        except ImportError:
+            self.skipTest('asyncio is not available.')
+        stream = self.amp.stream(25)
+        loop = asyncio.new_event_loop()
+        try:
+            data, marker = loop.run_until_complete(stream.__anext__())
+        finally:
+            loop.close()
+        np.testing.assert_array_equal(data.ravel(), np.arange(25))
+
+
+class TestBlockStream(TestCase):
+
+    def test_overlapping_awaits(self):
+        """Overlapping awaits return the blocks one after the other."""
+        try:
+            import asyncio
+        except ImportError:
+            self.skipTest('asyncio is not available.')
+
+        def blocks():
+            for i in range(4):
+                time.sleep(.01)
+                yield i
+
+        stream = BlockStream(blocks())
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            result = loop.run_until_complete(asyncio.gather(
+                *[stream.__anext__() for i in range(4)]))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        self.assertEqual(result, [0, 1, 2, 3])
+
+
+class TestGapDetection(TestCase):
+
+    def test_counter_gaps(self):
+        """Gaps in the sample counter are detected."""
+        amp = AmpDecorator(CounterAmp, clock=VirtualClock())
+        amp.start()
+        data = np.concatenate([amp.get_data()[0] for i in range(6)])
+        stats = amp.get_stats()
+        amp.stop()
+        self.assertEqual(len(data), 60)
+        self.assertEqual(amp.gaps, [[20, 10], [50, 10]])
+        self.assertEqual(stats['gaps'], 2)
+        self.assertEqual(stats['lost_samples'], 20)
+
+    def test_fill_gaps(self):
+        """Lost samples are replaced by NaNs."""
+        amp = AmpDecorator(CounterAmp, fill_gaps=True, clock=VirtualClock())
+        amp.start()
+        blocks = [amp.get_data() for i in range(6)]
+        amp.stop()
+        data = np.concatenate([d for d, m in blocks])
+        self.assertEqual(len(data), 80)
+        self.assertEqual(amp.gaps, [[20, 10], [60, 10]])
+        self.assertTrue(np.isnan(data[20:30]).all())
+        self.assertTrue(np.isnan(data[60:70]).all())
+        expected = np.arange(80)
+        valid = ~np.isnan(data[:, 1])
+        np.testing.assert_array_equal(data[valid, 1], expected[valid])
+        # the marker of the block after the gap is shifted by the gap
+        self.assertEqual(blocks[2][1], [[15., 'm4']])
+        # blocks with and without gaps have the same dtype
+        self.assertEqual(set(d.dtype for d, m in blocks), set([np.dtype(np.float64)]))
+
+
+class FifoAmp(Amplifier):
+    """Amplifier at 1kHz buffering its samples, returning at most 10 per call."""
+
+    def start(self):
+        self.t_start = self.clock.time()
+        self.pos = 0
+
+    def get_data(self):
+        now = self.clock.time()
+        due = self.t_start + (self.pos + 10) / 1000
+        if due > now:
+            self.clock.sleep(due - now)
+        data = np.arange(self.pos, self.pos + 10).reshape(-1, 1)
+        self.pos += 10
+        return data, []
+
+    def get_channels(self):
+        return ['Ch_0']
+
+    def get_sampling_frequency(self):
+        return 1000
+
+
+class TestLag(TestCase):
+
+    def test_buffered_samples(self):
+        """A backlog of buffered samples is not mistaken for a gap."""
+        clock = VirtualClock(1000)
+        amp = AmpDecorator(FifoAmp, clock=clock, fill_gaps=True)
+        amp.start()
+        try:
+            blocks = [amp.get_data()[0] for i in range(500)]
+            # the consumer stalls, the amplifier buffers the samples
+            clock.advance(.3)
+            blocks.append(amp.get_data()[0])
+            lag = amp.get_stats()['lag']
+            blocks.extend(amp.get_data()[0] for i in range(500))
+        finally:
+            amp.stop()
+        self.assertGreater(lag, 250)
+        self.assertEqual(amp.gaps, [])
+        self.assertEqual(amp.amp_samples, 10010)
+        data = np.concatenate(blocks)
+        np.testing.assert_array_equal(data.ravel(), np.arange(10010))
+        self.assertEqual(amp.get_stats()['lag'], 0)
+
+
+class SkewedAmp(Amplifier):
+    """Amplifier whose clock runs 1% fast, returning blocks of 10 samples."""
+
+    def get_data(self):
+        self.clock.sleep(10 / 101)
+        return np.zeros((10, 1)), []
+
+    def get_channels(self):
+        return ['Ch_0']
+
+    def get_sampling_frequency(self):
+        return 100
+
+
+class TestDriftCorrection(TestCase):
+
+    def test_network_marker(self):
+        """Network markers are placed with the fitted sample clock."""
+        clock = VirtualClock(1000)
+        amp = AmpDecorator(SkewedAmp, clock=clock)
+        amp.start()
+        # the marker server cannot stamp the markers with the virtual
+        # clock, they are put into the queue directly
+        self.assertIsNone(amp.tcp_reader)
+        try:
+            for i in range(100):
+                amp.get_data()
+            # a network marker at sample 1005, i.e. 5 samples into the
+            # next block, at the amplifier's effective rate of 101 Hz
+            amp.marker_queue.put([1000 + 1005 / 101, 'net'])
+            time.sleep(.1)
+            data, marker = amp.get_data()
+        finally:
+            amp.stop()
+        self.assertAlmostEqual(amp.get_stats()['effective_fs'], 101)
+        # 5 samples at the nominal 100 Hz, not the 49.5 ms that passed
+        # on the host's clock since the onset of the block
+        ts, m = marker[0]
+        self.assertEqual(m, 'net')
+        self.assertAlmostEqual(ts, 50, places=3)
+
+
+def dead_marker_reader(queue, running, ready):
+    """A marker server which never becomes ready."""
+
+
+class TestMarkerServer(TestCase):
+
+    def test_tcp_and_udp(self):
+        """Markers are received via TCP and UDP."""
+        amp = AmpDecorator(BlockAmp)
+        amp.start()
+        try:
+            tcp = socket.create_connection(('localhost', markerserver.PORT))
+            tcp.sendall(b'tcp\n')
+            tcp.close()
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp.sendto(b'udp\n', ('localhost', markerserver.PORT))
+            udp.close()
+            markers = []
+            t_end = time.time() + 2
+            while len(markers) < 2 and time.time() < t_end:
+                markers.extend(m for ts, m in amp.get_data()[1] if m in ('tcp', 'udp'))
+        finally:
+            amp.stop()
+        self.assertEqual(sorted(markers), ['tcp', 'udp'])
+
+    def test_timeout(self):
+        """start raises if the marker server does not start."""
+        amp = AmpDecorator(BlockAmp)
+        with mock.patch('libmushu.markerserver.marker_reader', dead_marker_reader), \
+                mock.patch('libmushu.ampdecorator.MARKER_SERVER_TIMEOUT', .5):
+            with self.assertRaises(RuntimeError):
+                amp.start()
+        self.assertIsNone(amp.tcp_reader)
+
+
+class TestMetaData(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_clock_is_written_to_meta(self):
+        """The fitted sample clock is saved in the meta data."""
+        filename = os.path.join(self.tmpdir, 'rec')
+        amp = AmpDecorator(BlockAmp, clock=VirtualClock())
+        amp.start(filename)
+        for i in range(20):
+            amp.get_data()
+        amp.stop()
+        with open(filename + '.meta') as fh:
+            meta = json.load(fh)
+        self.assertEqual(meta['Sampling Frequency'], 1000)
+        self.assertEqual(meta['Clock']['Updates'], 20)
+        self.assertGreater(meta['Effective Sampling Frequency'], 0)
@@ -0,0 +1,57 @@
+from __future__ import division
+
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from libmushu.driver.benchamp import BenchAmp
+
+
+class TestBenchAmp(TestCase):
+
+    def setUp(self):
+        self.amp = BenchAmp()
+
+    def test_phase_continuous(self):
+        """The data continues smoothly when the buffer wraps around."""
+        self.amp.configure(fs=100, channels=3, blocksize=7, realtime=False)
+        self.amp.start()
+        data = np.concatenate([self.amp.get_data()[0] for i in range(50)])
+        t = np.arange(350) / 100
+        expected = np.sin(2 * np.pi * t[:, np.newaxis] * np.array([1, 2, 3]))
+        np.testing.assert_allclose(data, expected, atol=1e-6)
+
+    def test_dtype(self):
+        self.amp.configure(fs=100, channels=2, dtype=np.int16, realtime=False)
+        self.amp.start()
+        data, marker = self.amp.get_data()
+        self.assertEqual(data.dtype, np.int16)
+        self.assertEqual(data.shape, (1, 2))
+        self.assertFalse(data.flags.writeable)
+
+    def test_markers(self):
+        """Markers are injected at the marker rate."""
+        self.amp.configure(fs=1000, channels=1, blocksize=30, marker_rate=40, realtime=False)
+        self.amp.start()
+        markers = []
+        for i in range(10):
+            data, marker = self.amp.get_data()
+            markers.extend([i * 30 + ts, m] for ts, m in marker)
+            for ts, m in marker:
+                self.assertTrue(0 <= ts < 30)
+        self.assertEqual(len(markers), 12)
+        np.testing.assert_allclose([ts for ts, m in markers], np.arange(12) * 25)
+
+    def test_realtime(self):
+        """The data is paced at the sampling frequency."""
+        self.amp.configure(fs=1000, channels=1, blocksize=10)
+        self.amp.start()
+        t = time.time()
+        samples = 0
+        while samples < 200:
+            samples += len(self.amp.get_data()[0])
+        elapsed = time.time() - t
+        self.assertEqual(samples, 200)
+        self.assertGreaterEqual(elapsed, 0.2 - 0.005)
+        self.assertLess(elapsed, 0.3)
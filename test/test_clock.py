@@ -0,0 +1,80 @@
+from __future__ import division
+
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from libmushu.ampdecorator import AmpDecorator
+from libmushu.clock import VirtualClock
+from libmushu.driver.randomamp import RandomAmp
+from libmushu.driver.replayamp import ReplayAmp
+from libmushu.driver.sinusamp import SinusAmp
+
+
+class TestVirtualClock(TestCase):
+
+    def test_sleep(self):
+        """Sleeping advances the time without waiting."""
+        clock = VirtualClock(100)
+        t = time.time()
+        clock.sleep(3600)
+        clock.sleep(-1)
+        clock.advance(0.5)
+        self.assertEqual(clock.time(), 3700.5)
+        self.assertEqual(clock.monotonic(), 3700.5)
+        self.assertLess(time.time() - t, 0.1)
+
+
+class TestInjection(TestCase):
+
+    def test_drivers(self):
+        """The simulated drivers are paced by the injected clock."""
+        clock = VirtualClock()
+        sinus = SinusAmp()
+        sinus.configure(f=1, fs=100, channels=2)
+        random = RandomAmp()
+        random.configure(fs=100, channels=2)
+        for amp in sinus, random:
+            amp.clock = clock
+            amp.start()
+            t_start = clock.time()
+            samples = 0
+            while clock.time() - t_start < 1000:
+                samples += len(amp.get_data()[0])
+            self.assertAlmostEqual(samples, 100000, delta=1)
+
+    def test_replay_speed(self):
+        """Replaying ten times faster takes a tenth of the time."""
+        clock = VirtualClock()
+        amp = ReplayAmp()
+        amp.clock = clock
+        amp.configure(data=np.zeros((100000, 1)), marker=[], channels=['ch'], fs=100,
+                      speed=10, blocksize_samples=10)
+        amp.start()
+        samples = 0
+        while samples < 100000:
+            samples += len(amp.get_data()[0])
+        self.assertAlmostEqual(clock.time(), 100)
+        self.assertAlmostEqual(amp.get_stats()['achieved_speed'], 10)
+
+    def test_decorator(self):
+        """A thousand simulated seconds through the decorator."""
+        clock = VirtualClock(1e9)
+        amp = AmpDecorator(SinusAmp, clock=clock)
+        self.assertIs(amp.amp.clock, clock)
+        amp.configure(f=1, fs=100, channels=2)
+        amp.start()
+        onsets = []
+        try:
+            while clock.time() < 1e9 + 1000:
+                amp.get_data()
+                onsets.append(amp.block_onset)
+        finally:
+            amp.stop()
+        stats = amp.get_stats()
+        self.assertEqual(stats['received_samples'], 100000)
+        self.assertEqual(stats['lost_samples'], 0)
+        self.assertAlmostEqual(stats['effective_fs'], 100, places=6)
+        # the onset of every block is the time of its first sample
+        np.testing.assert_allclose(np.diff(onsets), 0.01, atol=1e-6)
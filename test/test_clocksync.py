@@ -0,0 +1,47 @@
+from __future__ import division
+
+from unittest import TestCase
+
+import numpy as np
+
+from libmushu.clocksync import ClockRegression
+
+
+class TestClockRegression(TestCase):
+
+    def test_nominal_slope_without_observations(self):
+        """Without enough observations the nominal fs is used."""
+        clock = ClockRegression(fs=100)
+        with self.assertRaises(ValueError):
+            clock.time_of(0)
+        clock.update(10, 1000.)
+        self.assertAlmostEqual(clock.slope, .01)
+        self.assertAlmostEqual(clock.time_of(0), 999.9)
+
+    def test_fit_with_jitter(self):
+        """The regression removes the jitter of the arrival times."""
+        fs = 1000
+        drift = 50e-6
+        rng = np.random.RandomState(42)
+        clock = ClockRegression(fs=fs, forgetting=1)
+        n = np.arange(1, 10001) * 10
+        t = 1e9 + n * (1 + drift) / fs + rng.uniform(0, 2e-3, len(n))
+        for i, j in zip(n, t):
+            clock.update(i, j)
+        self.assertAlmostEqual(clock.drift, drift, delta=2e-6)
+        self.assertAlmostEqual(clock.jitter, 2e-3 / np.sqrt(12), delta=1e-4)
+        # the line goes through the center of the jitter
+        self.assertAlmostEqual(clock.time_of(n[-1]), 1e9 + n[-1] * (1 + drift) / fs + 1e-3, delta=1e-4)
+        mapping = clock.to_dict()
+        self.assertAlmostEqual(mapping['Offset'] + n[-1] * mapping['Slope'], clock.time_of(n[-1]))
+
+    def test_sample_of_is_inverse_of_time_of(self):
+        """sample_of converts host time into sample time."""
+        clock = ClockRegression(fs=100)
+        for i in range(1, 100):
+            # the amp is 1% slower than nominal
+            clock.update(10 * i, 5000 + i * .101)
+        self.assertAlmostEqual(clock.effective_fs, 100 / 1.01)
+        for n in 0, 10, 123.4, 1000:
+            self.assertAlmostEqual(clock.sample_of(clock.time_of(n)), n)
+        self.assertAlmostEqual(clock.sample_of(5000 + 50 * .101), 500)
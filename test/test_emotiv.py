@@ -0,0 +1,128 @@
+from __future__ import division
+
+from collections import deque
+import errno
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import numpy as np
+import usb.core
+
+from libmushu.driver.emotiv import Epoc, parse_packets, LIBUSB_ERROR_TIMEOUT
+
+
+SERIAL = 'SN201211150000GM'
+
+
+def make_packet(first, data, quality, gyro):
+    """Encode the fields of a decrypted packet."""
+    fields = ([(first, 8)] + [(d, 14) for d in data[:7]] + [(quality, 14), (0, 14)] +
+              [(d, 14) for d in data[7:]] + [(g, 8) for g in gyro] + [(0, 8)])
+    raw = 0
+    for value, bits in fields:
+        raw = (raw << bits) | value
+    return [(raw >> (8 * i)) & 0xff for i in range(31, -1, -1)]
+
+
+class TestParsePackets(TestCase):
+
+    def test_fields(self):
+        """Channels, counter and gyroscope are decoded."""
+        data = list(range(1000, 15000, 1000))
+        packets = np.array([make_packet(5, data, 0, [0b10000001, 120]),
+                            make_packet(6, data[::-1], 0, [100, 0b11111111])],
+                           dtype=np.uint8)
+        parsed, battery, quality = parse_packets(packets, 0, [0] * 14)
+        self.assertEqual(parsed.shape, (2, 32))
+        self.assertEqual(list(parsed[:, 0]), [5, 6])
+        self.assertEqual(list(parsed[0, 2:16]), data)
+        self.assertEqual(list(parsed[1, 2:16]), data[::-1])
+        self.assertEqual(list(parsed[0, 16:18]), [99, 20])
+        self.assertEqual(list(parsed[1, 16:18]), [0, -27])
+
+    def test_battery_and_quality(self):
+        """Battery and quality are carried forward between packets."""
+        data = [0] * 14
+        packets = np.array([make_packet(0, data, 10, [100, 100]),
+                            make_packet(0b10000000 | 42, data, 99, [100, 100]),
+                            make_packet(66, data, 20, [100, 100]),
+                            make_packet(20, data, 99, [100, 100])],
+                           dtype=np.uint8)
+        parsed, battery, quality = parse_packets(packets, 7, list(range(14)))
+        self.assertEqual(list(parsed[:, 0]), [0, 128, 66, 20])
+        self.assertEqual(list(parsed[:, 1]), [7, 42, 42, 42])
+        self.assertEqual(list(parsed[:, 18]), [10, 10, 10, 10])
+        self.assertEqual(list(parsed[:, 20]), [2, 2, 20, 20])
+        self.assertEqual(battery, 42)
+        self.assertEqual(quality, [10, 1, 20] + list(range(3, 14)))
+        # the state is used for the next packets
+        parsed, battery, quality = parse_packets(packets[3:], battery, quality)
+        self.assertEqual(list(parsed[0, 18:32]), quality)
+        self.assertEqual(parsed[0, 1], 42)
+
+
+class FakeDevice(object):
+    """Replays encrypted packets like the Emotiv USB device."""
+
+    iSerialNumber = 3
+
+    def __init__(self, packets):
+        self.packets = deque(packets)
+        self.reads = 0
+
+    def is_kernel_driver_active(self, interface):
+        return False
+
+    def read(self, endpoint, size, timeout=None):
+        self.reads += 1
+        if not self.packets:
+            raise usb.core.USBError('Operation timed out', LIBUSB_ERROR_TIMEOUT,
+                                    errno.ETIMEDOUT)
+        packet = self.packets.popleft()
+        if isinstance(packet, Exception):
+            raise packet
+        return packet
+
+
+class TestEpoc(TestCase):
+
+    def make_amp(self, n_packets):
+        self.dev = FakeDevice([])
+        with mock.patch('usb.core.find', return_value=self.dev), \
+                mock.patch('usb.util.get_string', return_value=SERIAL), \
+                mock.patch('usb.util.claim_interface'):
+            amp = Epoc()
+        data = list(range(1000, 15000, 1000))
+        decrypted = np.array([make_packet(i % 128, data, 0, [100, 100])
+                              for i in range(n_packets)], dtype=np.uint8)
+        # the cipher is in ECB mode, so we can use it for encrypting too
+        self.dev.packets.extend(bytearray(amp.cipher.encrypt(p.tostring()))
+                                for p in decrypted)
+        return amp
+
+    def test_batched_read(self):
+        """All available packets are returned at once."""
+        amp = self.make_amp(100)
+        data, marker = amp.get_data()
+        self.assertEqual(data.shape, (100, 32))
+        self.assertEqual(list(data[:, 0]), list(range(100)))
+        self.assertEqual(list(data[-1, 2:16]), list(range(1000, 15000, 1000)))
+        data, marker = amp.get_data()
+        self.assertEqual(data.shape, (0, 32))
+
+    def test_max_packets(self):
+        """No more than max_packets are returned per call."""
+        amp = self.make_amp(100)
+        amp.configure(max_packets=30)
+        sizes = [len(amp.get_data()[0]) for i in range(4)]
+        self.assertEqual(sizes, [30, 30, 30, 10])
+
+    def test_error(self):
+        """USB errors other than timeouts are raised."""
+        amp = self.make_amp(10)
+        self.dev.packets.append(usb.core.USBError('No such device', -4, errno.ENODEV))
+        with self.assertRaises(usb.core.USBError):
+            amp.get_data()
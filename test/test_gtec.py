@@ -0,0 +1,235 @@
+from __future__ import division
+
+import array
+import time
+from collections import deque
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import numpy as np
+
+from libmushu.driver import gtec
+
+
+class FakeHandle(object):
+    """Stand-in for the legacy pyusb device handle of a g.USBamp."""
+
+    def __init__(self, serial='UB-2009.10.01', log=None):
+        self.reads = deque()
+        self.control = []
+        self.released = False
+        self.serial = serial
+        # control messages of all handles
+        self.log = log if log is not None else []
+
+    def setConfiguration(self, config):
+        pass
+
+    def claimInterface(self, interface):
+        pass
+
+    def setAltInterface(self, interface):
+        pass
+
+    def releaseInterface(self):
+        self.released = True
+
+    def controlMsg(self, requestType, request, buffer, value=0, index=0, timeout=100):
+        if request == 0xd2:
+            info = '--------\r\n V3.0\r\n SN:%s\r\n' % self.serial
+            return tuple(bytearray(info.encode('ascii')))
+        self.control.append((request, value, buffer))
+        self.log.append((self.serial, request))
+
+    def bulkRead(self, endpoint, size, timeout=100):
+        if not self.reads:
+            raise gtec.usb.USBError('timeout')
+        return self.reads.popleft()
+
+
+def fake_busses(*handles):
+    devices = []
+    for handle in handles:
+        interface = mock.Mock(alternateSetting=0)
+        config = mock.Mock(interfaces=[[interface]])
+        device = mock.Mock(idVendor=gtec.ID_VENDOR_GTEC,
+                           idProduct=gtec.ID_PRODUCT_GUSB_AMP,
+                           configurations=[config])
+        device.open.return_value = handle
+        devices.append(device)
+    return [mock.Mock(devices=devices)]
+
+
+class TestGUSBamp(TestCase):
+
+    def setUp(self):
+        self.handle = FakeHandle()
+        with mock.patch('usb.busses', return_value=fake_busses(self.handle)):
+            self.amp = gtec.GUSBamp()
+        self.amp.start()
+
+    def test_partial_frames(self):
+        """Frames split across bulk reads are not lost."""
+        frames = np.arange(17 * 50, dtype='<f4').reshape(-1, 17)
+        raw = frames.tostring()
+        rng = np.random.RandomState(1)
+        cuts = sorted(rng.randint(0, len(raw), 20))
+        for start, end in zip([0] + cuts, cuts + [len(raw)]):
+            self.handle.reads.append(array.array('B', raw[start:end]))
+        data = np.concatenate([self.amp.get_data()[0] for i in range(21)])
+        np.testing.assert_allclose(data, frames / 8.15, rtol=1e-6)
+
+    def test_legacy_tuple(self):
+        """Bulk reads returning a tuple of ints are supported."""
+        frames = np.arange(17 * 2, dtype='<f4').reshape(-1, 17)
+        self.handle.reads.append(tuple(bytearray(frames.tostring())))
+        data, marker = self.amp.get_data()
+        np.testing.assert_allclose(data, frames / 8.15, rtol=1e-6)
+
+    def test_reader_thread(self):
+        """The reader thread buffers bulk reads between get_data calls."""
+        self.amp.stop()
+        self.amp.configure(transfer_size=68, transfer_timeout=10, reader=True)
+        frames = np.arange(17 * 20, dtype='<f4').reshape(-1, 17)
+        for frame in frames:
+            self.handle.reads.append(array.array('B', frame.tostring()))
+        self.amp.start()
+        while self.handle.reads:
+            time.sleep(.01)
+        data = [self.amp.get_data()[0]]
+        t_end = time.time() + 1
+        while sum(len(d) for d in data) < 20 and time.time() < t_end:
+            data.append(self.amp.get_data()[0])
+        self.amp.stop()
+        data = np.concatenate(data)
+        np.testing.assert_allclose(data, frames / 8.15, rtol=1e-6)
+
+    def test_reader_overflow(self):
+        """Frames after a full reader queue are still decoded correctly."""
+        self.amp.stop()
+        self.amp.configure(transfer_timeout=10, reader=True, queue_size=2)
+        frames = np.arange(17 * 50, dtype='<f4').reshape(-1, 17)
+        raw = frames.tostring()
+        # reads which do not end at a frame boundary
+        cuts = list(range(0, len(raw), 150)) + [len(raw)]
+        for start, end in zip(cuts[:-1], cuts[1:]):
+            self.handle.reads.append(array.array('B', raw[start:end]))
+        self.amp.start()
+        while self.handle.reads:
+            time.sleep(.01)
+        time.sleep(.05)
+        data = self.amp.get_data()[0] * 8.15
+        self.amp.stop()
+        self.assertGreater(self.amp.overflows, 0)
+        self.assertLess(len(data), 50)
+        # only complete frames are dropped, the remaining ones are the
+        # last frames and intact
+        np.testing.assert_allclose(data, frames[-len(data):], rtol=1e-6)
+
+
+class TestDaisyChain(TestCase):
+
+    def setUp(self):
+        log = []
+        self.handles = [FakeHandle('UB-1', log), FakeHandle('UB-2', log)]
+        self.log = log
+        with mock.patch('usb.busses', return_value=fake_busses(*self.handles)):
+            self.amp = gtec.GUSBamp()
+        self.amp.configure(transfer_timeout=10, devices=['UB-2', 'UB-1'], counter=16)
+
+    def get_frames(self, n):
+        data = []
+        t_end = time.time() + 1
+        while sum(len(d) for d in data) < n and time.time() < t_end:
+            data.append(self.amp.get_data()[0])
+        return np.concatenate(data)
+
+    def frames(self, start, n, offset):
+        """Frames with the sample counter in the last channel."""
+        frames = np.zeros((n, 17), dtype='<f4')
+        frames[:, 0] = np.arange(start, start + n) + offset
+        frames[:, 16] = np.arange(start, start + n)
+        return frames
+
+    def test_master_and_slaves(self):
+        """The first device is the master, the others are slaves."""
+        slave, master = self.handles
+        self.assertIn((0xcd, 0, 0), master.control)
+        self.assertNotIn((0xcd, 1, 0), master.control)
+        self.assertIn((0xcd, 1, 0), slave.control)
+        self.assertEqual(self.amp.get_channels(), [str(i) for i in range(34)])
+        self.assertEqual(self.amp.get_sampling_frequency(), 128)
+
+    def test_start_order(self):
+        """The slaves are started before the master."""
+        del self.log[:]
+        self.amp.start()
+        self.amp.stop()
+        starts = [serial for serial, request in self.log if request == 0xf7]
+        self.assertEqual(starts, ['UB-1', 'UB-2'])
+
+    def test_merge(self):
+        """The frames of all devices are merged sample aligned."""
+        slave, master = self.handles
+        # the devices deliver different numbers of frames per read
+        for start in range(0, 30, 3):
+            master.reads.append(array.array('B', self.frames(start, 3, 1000).tostring()))
+        for start in range(0, 30, 5):
+            slave.reads.append(array.array('B', self.frames(start, 5, 2000).tostring()))
+        self.amp.start()
+        data = self.get_frames(30)
+        self.amp.stop()
+        self.assertEqual(data.shape, (30, 34))
+        np.testing.assert_allclose(data[:, 0] * 8.15, np.arange(30) + 1000, rtol=1e-6)
+        np.testing.assert_allclose(data[:, 17] * 8.15, np.arange(30) + 2000, rtol=1e-6)
+        self.assertEqual(self.amp.misaligned, 0)
+
+    def test_misaligned(self):
+        """Frames with different sample counters are detected."""
+        slave, master = self.handles
+        master.reads.append(array.array('B', self.frames(0, 10, 0).tostring()))
+        slave.reads.append(array.array('B', self.frames(2, 10, 0).tostring()))
+        self.amp.start()
+        self.get_frames(10)
+        self.amp.stop()
+        self.assertEqual(self.amp.misaligned, 10)
+
+    def test_unknown_device(self):
+        with self.assertRaises(gtec.AmpError):
+            self.amp.configure(devices=['UB-3'])
+
+    def test_dropped_frames(self):
+        """Frames dropped on one device are dropped on all devices."""
+        slave, master = self.amp.devices
+        master.buffer(self.frames(0, 10, 0))
+        slave.buffer(self.frames(0, 3, 0))
+        slave.buffer(self.frames(6, 2, 0), dropped=3)
+        data = self.amp._merge()
+        np.testing.assert_array_equal(data[:, 16], [0, 1, 2, 6, 7])
+        np.testing.assert_array_equal(data[:, 33], [0, 1, 2, 6, 7])
+        slave.buffer(self.frames(8, 4, 0))
+        master.buffer(self.frames(10, 2, 0))
+        data = self.amp._merge()
+        np.testing.assert_array_equal(data[:, 33], [8, 9, 10, 11])
+        self.assertEqual(self.amp.misaligned, 0)
+
+    def test_max_pending(self):
+        """The frames not merged yet are bounded and stay aligned."""
+        slave, master = self.amp.devices
+        master.max_pending = slave.max_pending = 10
+        master.buffer(self.frames(0, 30, 0))
+        self.assertEqual(len(self.amp._merge()), 0)
+        self.assertEqual(len(master.pending), 10)
+        slave.buffer(self.frames(0, 30, 0))
+        data = self.amp._merge()
+        np.testing.assert_array_equal(data[:, 16], np.arange(20, 30))
+        self.assertEqual(self.amp.misaligned, 0)
+
+    def test_release_unused(self):
+        """Devices which are not selected are released."""
+        self.amp.configure(devices=['UB-1'])
+        self.assertEqual([h.released for h in self.handles], [False, True])
+        self.assertEqual(len(self.amp._opened), 1)
@@ -0,0 +1,94 @@
+from __future__ import division
+
+import subprocess
+import sys
+import threading
+import time
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import libmushu
+
+
+class FakeDriver(object):
+
+    def __init__(self, available, delay=None):
+        self.available = available
+        self.delay = delay
+        self.calls = 0
+
+    def is_available(self):
+        self.calls += 1
+        if self.delay is not None:
+            self.delay.wait()
+        return self.available
+
+
+class TestGetAvailableAmps(TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.drivers = {'fast': FakeDriver(True),
+                        'absent': FakeDriver(False),
+                        'slow': FakeDriver(True, self.release)}
+        modules = dict((name, mock.Mock(Amp=driver)) for name, driver in self.drivers.items())
+        patches = [mock.patch.dict(libmushu.supported_amps,
+                                   dict((name, [name, 'Amp']) for name in self.drivers),
+                                   clear=True),
+                   mock.patch.dict(libmushu._availability, clear=True),
+                   mock.patch('libmushu._entry_points', {}),
+                   mock.patch('libmushu.import_module',
+                              lambda name: modules[name.split('.')[-1]])]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(self.release.set)
+
+    def test_timeout(self):
+        """Slow amplifiers do not block the others."""
+        reported = []
+        t = time.time()
+        amps = libmushu.get_available_amps(timeout=.2,
+                                           callback=lambda *args: reported.append(args))
+        self.assertLess(time.time() - t, 1)
+        self.assertEqual(amps, ['fast'])
+        self.assertEqual(sorted(reported), [('absent', False), ('fast', True)])
+        # the late result is cached
+        self.release.set()
+        while 'slow' not in libmushu._availability:
+            time.sleep(.01)
+        self.assertEqual(sorted(libmushu.get_available_amps(timeout=.2)), ['fast', 'slow'])
+        self.assertEqual(self.drivers['slow'].calls, 1)
+
+    def test_cache(self):
+        self.release.set()
+        libmushu.get_available_amps()
+        libmushu.get_available_amps()
+        self.assertEqual(self.drivers['fast'].calls, 1)
+        libmushu.get_available_amps(max_age=0)
+        self.assertEqual(self.drivers['fast'].calls, 2)
+
+
+class TestRegistry(TestCase):
+
+    def test_lazy_import(self):
+        """Importing libmushu imports neither a driver nor the marker server."""
+        code = ('import sys, libmushu; '
+                'print(" ".join(m for m in sys.modules if m.split(".")[0] in '
+                '("multiprocessing", "asyncore", "pkg_resources", "usb") '
+                'or m.startswith("libmushu.driver") or m == "libmushu.markerserver"))')
+        out = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(out.split(), [])
+
+    def test_entry_point(self):
+        """Drivers of other packages are loaded from their entry points."""
+        entry_point = mock.Mock()
+        entry_point.load.return_value = FakeDriver
+        with mock.patch('libmushu._entry_points', {'fakeamp': entry_point}):
+            self.assertIs(libmushu.get_driver('fakeamp'), FakeDriver)
+            self.assertIn('fakeamp', libmushu._get_amp_names())
+            with self.assertRaises(ValueError):
+                libmushu.get_driver('unknown')
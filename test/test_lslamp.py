@@ -0,0 +1,54 @@
+from __future__ import division
+
+import time
+from unittest import TestCase, skipIf
+
+import numpy as np
+
+try:
+    import pylsl
+except ImportError:
+    pylsl = None
+
+
+@skipIf(pylsl is None, 'pylsl is not installed')
+class TestLSLAmp(TestCase):
+
+    def setUp(self):
+        from libmushu.driver.labstreaminglayer import LSLAmp
+        info = pylsl.StreamInfo('test', 'EEG', 4, 100, 'float32', 'test_lslamp')
+        self.outlet = pylsl.StreamOutlet(info)
+        info = pylsl.StreamInfo('test_markers', 'Markers', 1, 0, 'string', 'test_lslamp_markers')
+        self.marker_outlet = pylsl.StreamOutlet(info)
+        self.amp = LSLAmp()
+        self.amp.configure(max_samples=16, time_correction_interval=.1)
+        self.amp.start()
+        # give the inlets time to connect
+        time.sleep(.5)
+
+    def tearDown(self):
+        self.amp.stop()
+
+    def test_loopback(self):
+        """Samples and markers pushed to local outlets are received."""
+        data = np.arange(40, dtype=np.float32).reshape(10, 4)
+        t0 = pylsl.local_clock()
+        self.marker_outlet.push_sample(['S1'], t0 + .05)
+        self.outlet.push_chunk(data.tolist(), t0)
+        received, markers = [], []
+        while sum(len(d) for d in received) < 10:
+            d, m = self.amp.get_data()
+            received.append(d)
+            markers.extend(m)
+        received = np.concatenate(received)
+        self.assertEqual(received.dtype, np.float32)
+        np.testing.assert_array_equal(received, data)
+        self.assertEqual([m for t, m in markers], ['S1'])
+
+    def test_buffer_reuse(self):
+        """The returned samples are not overwritten by the next pull."""
+        self.outlet.push_chunk([[1] * 4] * 10)
+        first, _ = self.amp.get_data()
+        self.outlet.push_chunk([[2] * 4] * 10)
+        self.amp.get_data()
+        self.assertTrue((first == 1).all())
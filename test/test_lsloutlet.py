@@ -0,0 +1,73 @@
+from __future__ import division
+
+import time
+from unittest import TestCase, skipIf
+
+import numpy as np
+
+from libmushu.amplifier import Amplifier
+
+try:
+    import pylsl
+except ImportError:
+    pylsl = None
+else:
+    from libmushu.lsloutlet import LSLOutlet
+
+
+class DummyAmp(Amplifier):
+
+    def get_channels(self):
+        return ['Ch_0', 'Ch_1']
+
+    def get_sampling_frequency(self):
+        return 100
+
+
+@skipIf(pylsl is None, 'pylsl is not installed')
+class TestLSLOutlet(TestCase):
+
+    def setUp(self):
+        self.outlet = LSLOutlet(name='test', source_id='test_lsloutlet')
+        self.outlet.open(DummyAmp())
+        info, = pylsl.resolve_byprop('source_id', 'test_lsloutlet', timeout=5)
+        self.inlet = pylsl.StreamInlet(info)
+        info, = pylsl.resolve_byprop('source_id', 'test_lsloutlet-Markers', timeout=5)
+        self.marker_inlet = pylsl.StreamInlet(info)
+        self.inlet.open_stream()
+        self.marker_inlet.open_stream()
+        # give the inlets time to connect
+        time.sleep(.5)
+
+    def tearDown(self):
+        self.outlet.close()
+
+    def test_meta_data(self):
+        info = self.inlet.info()
+        self.assertEqual(info.channel_count(), 2)
+        self.assertEqual(info.nominal_srate(), 100)
+        channel = info.desc().child('channels').child('channel')
+        self.assertEqual(channel.child_value('label'), 'Ch_0')
+
+    def test_loopback(self):
+        """Blocks and markers arrive with consistent time stamps."""
+        data = np.arange(20, dtype=np.float32).reshape(-1, 2)
+        t0 = time.time()
+        self.outlet.write(data, [[50., 'foo']], t0)
+        # read-only blocks are published as well
+        data.flags.writeable = False
+        self.outlet.write(data, [], t0 + .1)
+        samples, timestamps = self.inlet.pull_chunk(timeout=5, max_samples=20)
+        while len(samples) < 20:
+            s, t = self.inlet.pull_chunk(timeout=5, max_samples=20)
+            samples += s
+            timestamps += t
+        np.testing.assert_array_equal(samples, np.concatenate([data, data]))
+        np.testing.assert_allclose(np.diff(timestamps), .01, atol=1e-4)
+        marker, ts = self.marker_inlet.pull_sample(timeout=5)
+        self.assertEqual(marker, ['foo'])
+        self.assertAlmostEqual(ts - timestamps[0], .05, places=4)
+
+    def test_dtype(self):
+        with self.assertRaises(ValueError):
+            LSLOutlet(dtype=np.complex64)
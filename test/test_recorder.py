@@ -0,0 +1,106 @@
+from __future__ import division
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import numpy as np
+
+from libmushu import recorder
+from libmushu.amplifier import Amplifier
+
+
+class BusyAmp(Amplifier):
+    """An amplifier whose device cannot be opened."""
+
+    presets = [['default', {'fs': 100}]]
+
+    def __init__(self):
+        raise IOError('Device busy')
+
+
+class TestRecorder(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_config(self):
+        presets = [['slow', {'fs': 10, 'channels': 2}], ['fast', {'fs': 1000, 'channels': 2}]]
+        self.assertIsNone(recorder.get_config(presets, None, []))
+        self.assertEqual(recorder.get_config(presets, 'fast', ['channels=4', 'name=x']),
+                         {'fs': 1000, 'channels': 4, 'name': 'x'})
+        self.assertEqual(recorder.get_config(presets, '0', []), presets[0][1])
+        for preset, params in ('medium', []), ('2', []), (None, ['fs']):
+            with self.assertRaises(ValueError):
+                recorder.get_config(presets, preset, params)
+
+    def test_list(self):
+        """The presets are listed without opening the devices."""
+        with mock.patch('libmushu.get_available_amps', return_value=['busyamp']), \
+                mock.patch('libmushu.get_driver', return_value=BusyAmp), \
+                mock.patch('sys.stdout', new_callable=StringIO) as stdout:
+            status = recorder.main(['--list'])
+        self.assertEqual(status, 0)
+        self.assertEqual(stdout.getvalue().splitlines(), ['busyamp', '  0: default'])
+
+    def test_unknown_parameter(self):
+        """An unknown configuration parameter is a usage error."""
+        with mock.patch('sys.stderr', new_callable=StringIO):
+            status = recorder.main(['randomamp', '-c', 'color=1'])
+        self.assertEqual(status, 2)
+
+    def test_record(self):
+        """A recording for a given duration is written to disk."""
+        filename = os.path.join(self.tmpdir, 'rec')
+        status = recorder.main(['benchamp', '-c', 'fs=1000', '-c', 'channels=4',
+                                '-c', 'marker_rate=10', '-d', '.5', '-s', '0',
+                                '-o', filename])
+        self.assertEqual(status, 0)
+        data = np.fromfile(filename + '.eeg', dtype=np.float32).reshape(-1, 4)
+        self.assertGreaterEqual(len(data), 500)
+        with open(filename + '.marker') as fh:
+            self.assertGreaterEqual(len(fh.readlines()), 5)
+
+    def test_existing_output(self):
+        """Existing output files are reported without a traceback."""
+        filename = os.path.join(self.tmpdir, 'rec')
+        open(filename + '.eeg', 'w').close()
+        with mock.patch('sys.stderr', new_callable=StringIO) as stderr:
+            status = recorder.main(['randomamp', '-d', '.1', '-o', filename])
+        self.assertEqual(status, 1)
+        self.assertIn('already exists', stderr.getvalue())
+
+    def test_headless(self):
+        """The recorder imports no GUI or plotting modules."""
+        code = ('import sys; from libmushu import recorder; '
+                'recorder.main(["randomamp", "-d", ".2", "-s", "0"]); '
+                'print(" ".join(m for m in sys.modules if m.split(".")[0] in '
+                '("Tkinter", "tkinter", "ttk", "matplotlib")))')
+        out = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(out.splitlines()[-1].split(), [])
+
+    def test_signal(self):
+        """SIGTERM stops the recording cleanly."""
+        process = subprocess.Popen([sys.executable, '-m', 'libmushu.recorder', 'randomamp'],
+                                   stdout=subprocess.PIPE)
+        # wait for the first statistics
+        process.stdout.readline()
+        process.send_signal(signal.SIGTERM)
+        out = process.communicate()[0]
+        self.assertEqual(process.returncode, 0)
+        self.assertTrue(out.splitlines()[-1].startswith(b'Recorded'))
@@ -1,8 +1,17 @@
 from __future__ import division
 
+import json
+import os
+import shutil
+import tempfile
+import time
 from unittest import TestCase
 
+import numpy as np
+
 import libmushu
+from libmushu.clock import VirtualClock
+from libmushu.driver.replayamp import ReplayAmp
 
 
 class TestReplayAmp(TestCase):
@@ -32,3 +41,94 @@ class TestReplayAmp(TestCase):
             self.amp.configure(data=None, marker=[], channels=None, fs=1000, blocksize_ms=10)
         except ValueError:
             self.fail()
+
+    def test_markers(self):
+        """Every marker is returned once, relative to its block."""
+        amp = ReplayAmp()
+        data = np.arange(100).reshape(-1, 1)
+        marker = [[55, 'c'], [0, 'a'], [9.9, 'b'], [99.5, 'd'], [55, 'e']]
+        amp.configure(data=data, marker=marker, channels=['ch'], fs=1000,
+                      realtime=False, blocksize_samples=10)
+        amp.start()
+        blocks = [amp.get_data() for i in range(11)]
+        self.assertEqual(np.concatenate([d for d, m in blocks]).tolist(), data.tolist())
+        markers = [[(ts, s) for ts, s in m] for d, m in blocks]
+        self.assertEqual(markers[0], [(0, 'a'), (9.9, 'b')])
+        self.assertEqual(markers[5], [(5, 'c'), (5, 'e')])
+        self.assertEqual(markers[9], [(9.5, 'd')])
+        self.assertEqual(sum(len(m) for m in markers), 5)
+
+    def test_recording(self):
+        """Recordings are replayed from disk."""
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'recording')
+        data = np.arange(300, dtype=np.float32).reshape(-1, 3)
+        with open(path + '.eeg', 'wb') as fh:
+            fh.write(data.tostring())
+        with open(path + '.marker', 'w') as fh:
+            fh.write('0.000000 start\n55.000000 S 1\n99.500000 end\n')
+        with open(path + '.meta', 'w') as fh:
+            json.dump({'Channels': ['a', 'b', 'c'], 'Sampling Frequency': 1000}, fh)
+        try:
+            amp = ReplayAmp()
+            amp.configure(path=path, realtime=False, blocksize_samples=10)
+            self.assertEqual(amp.get_channels(), ['a', 'b', 'c'])
+            self.assertEqual(amp.get_sampling_frequency(), 1000)
+            self.assertIsInstance(amp.data, np.memmap)
+            amp.start()
+            blocks = [amp.get_data() for i in range(11)]
+            amp.stop()
+        finally:
+            shutil.rmtree(tmpdir)
+        np.testing.assert_array_equal(np.concatenate([d for d, m in blocks]), data)
+        markers = [m for d, m in blocks]
+        self.assertEqual(markers[0], [(0, 'start')])
+        self.assertEqual(markers[5], [(5, 'S 1')])
+        self.assertEqual(markers[9], [(9.5, 'end')])
+        self.assertEqual(sum(len(m) for m in markers), 3)
+
+    def test_speed(self):
+        """The replay is paced at the given speed without drifting."""
+        amp = ReplayAmp()
+        amp.clock = clock = VirtualClock()
+        data = np.zeros((10000, 1))
+        amp.configure(data=data, marker=[], channels=['ch'], fs=1000,
+                      realtime=True, speed=20, blocksize_samples=10)
+        amp.start()
+        samples = 0
+        while samples < 4000:
+            samples += len(amp.get_data()[0])
+        self.assertEqual(samples, 4000)
+        self.assertAlmostEqual(clock.monotonic(), 0.2)
+        stats = amp.get_stats()
+        self.assertEqual(stats['requested_rate'], 20000)
+        self.assertAlmostEqual(stats['achieved_speed'], 20)
+        # a late call returns everything that is due
+        clock.advance(0.05)
+        self.assertEqual(len(amp.get_data()[0]), 1000)
+        self.assertAlmostEqual(amp.get_stats()['achieved_speed'], 20)
+
+    def test_unthrottled(self):
+        """Without pacing every call returns the next block."""
+        amp = ReplayAmp()
+        data = np.zeros((10000, 1))
+        amp.configure(data=data, marker=[], channels=['ch'], fs=1000,
+                      realtime=False, blocksize_samples=100)
+        amp.start()
+        t = time.time()
+        sizes = [len(amp.get_data()[0]) for i in range(100)]
+        self.assertEqual(sizes, [100] * 100)
+        self.assertLess(time.time() - t, 1)
+        self.assertIsNone(amp.get_stats()['requested_rate'])
+
+    def test_end_of_data(self):
+        """Stats are available before the start, the position stops at the end."""
+        amp = ReplayAmp()
+        data = np.zeros((250, 1))
+        amp.configure(data=data, marker=[], channels=['ch'], fs=1000,
+                      realtime=False, blocksize_samples=100)
+        self.assertEqual(amp.get_stats()['samples'], 0)
+        amp.start()
+        sizes = [len(amp.get_data()[0]) for i in range(5)]
+        self.assertEqual(sizes, [100, 100, 50, 0, 0])
+        self.assertEqual(amp.get_stats()['samples'], 250)
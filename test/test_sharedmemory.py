@@ -0,0 +1,65 @@
+from __future__ import division
+
+from unittest import TestCase
+
+import numpy as np
+
+from libmushu.amplifier import Amplifier
+from libmushu.sharedmemory import SharedMemoryPublisher, get_available_rings
+from libmushu.driver.sharedmemoryamp import SharedMemoryAmp
+
+
+class DummyAmp(Amplifier):
+
+    def get_channels(self):
+        return ['Ch_0', 'Ch_1']
+
+    def get_sampling_frequency(self):
+        return 100
+
+
+class TestSharedMemory(TestCase):
+
+    def setUp(self):
+        self.publisher = SharedMemoryPublisher('test-%d' % id(self), seconds=1)
+        self.publisher.open(DummyAmp())
+        self.amp = SharedMemoryAmp()
+        self.amp.configure(name='test-%d' % id(self), timeout=0)
+        self.amp.start()
+
+    def tearDown(self):
+        self.publisher.close()
+
+    def test_meta_data(self):
+        """Channels and fs are read from the ring buffer."""
+        self.assertEqual(self.amp.get_channels(), ['Ch_0', 'Ch_1'])
+        self.assertEqual(self.amp.get_sampling_frequency(), 100)
+        self.assertIn('test-%d' % id(self), get_available_rings())
+
+    def test_data_and_markers(self):
+        """Data and markers written by the publisher can be read."""
+        data = np.arange(20).reshape(-1, 2)
+        self.publisher.write(data[:6], [[10., 'foo']], 0)
+        self.publisher.write(data[6:], [[-5., 'bar']], 0)
+        received, marker = self.amp.get_data()
+        np.testing.assert_array_equal(received, data)
+        self.assertEqual(marker, [[10., 'foo'], [55., 'bar']])
+        received, marker = self.amp.get_data()
+        self.assertEqual(len(received), 0)
+
+    def test_wrap_around(self):
+        """The ring buffer wraps around."""
+        data = np.arange(2 * 250).reshape(-1, 2)
+        for i in range(0, 250, 30):
+            self.publisher.write(data[i:i+30], [], 0)
+            received, _ = self.amp.get_data()
+            np.testing.assert_array_equal(received, data[i:i+30])
+        self.assertEqual(self.amp.lost_samples, 0)
+
+    def test_slow_reader(self):
+        """Overwritten samples are skipped."""
+        data = np.arange(2 * 250).reshape(-1, 2)
+        self.publisher.write(data, [], 0)
+        received, _ = self.amp.get_data()
+        np.testing.assert_array_equal(received, data[-100:])
+        self.assertEqual(self.amp.lost_samples, 150)
@@ -0,0 +1,36 @@
+from __future__ import division
+
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from libmushu.driver.sinusamp import SinusAmp
+
+
+class TestSinusAmp(TestCase):
+
+    def setUp(self):
+        self.amp = SinusAmp()
+
+    def test_phase_continuous(self):
+        """The blocks form one continuous sine wave."""
+        self.amp.configure(f=[1, 5], fs=200, channels=2, amplitude=[1, 2], phase=[0, np.pi / 2])
+        self.amp.start()
+        data = []
+        while sum(len(d) for d in data) < 40:
+            data.append(self.amp.get_data()[0])
+        data = np.concatenate(data)
+        t = np.arange(len(data)) / 200
+        np.testing.assert_allclose(data[:, 0], np.sin(2 * np.pi * t))
+        np.testing.assert_allclose(data[:, 1], 2 * np.cos(2 * np.pi * 5 * t), atol=1e-12)
+
+    def test_sampling_frequency(self):
+        """Exactly fs samples are produced per second."""
+        self.amp.configure(f=1, fs=1000, channels=1)
+        self.amp.start()
+        t = time.time()
+        samples = 0
+        while time.time() - t < 0.2:
+            samples += len(self.amp.get_data()[0])
+        self.assertAlmostEqual(samples, 200, delta=10)
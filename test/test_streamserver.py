@@ -0,0 +1,136 @@
+from __future__ import division
+
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from libmushu.amplifier import Amplifier
+from libmushu.streamserver import StreamServer
+from libmushu.driver.netamp import NetAmp
+
+
+class DummyAmp(Amplifier):
+
+    def get_channels(self):
+        return ['Ch_0', 'Ch_1']
+
+    def get_sampling_frequency(self):
+        return 100
+
+
+class TestTCPStreamServer(TestCase):
+    """The tests of the stream server over TCP.
+
+    Subclasses run the same tests over other transports by overriding
+    :meth:`make_server` and :meth:`connect`.
+
+    """
+
+    def make_server(self):
+        return StreamServer(host='localhost', port=0)
+
+    def connect(self, **kwargs):
+        self.amp.configure(host='localhost', port=self.server.port, **kwargs)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = self.make_server()
+        self.server.open(DummyAmp())
+        self.amp = NetAmp()
+        self.connect()
+        self.amp.start()
+        # wait until the server registered the client
+        while not self.server.get_stats():
+            time.sleep(.01)
+
+    def tearDown(self):
+        self.amp.stop()
+        self.server.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_meta_data(self):
+        """Channels and fs are sent to the client."""
+        self.assertEqual(self.amp.get_channels(), ['Ch_0', 'Ch_1'])
+        self.assertEqual(self.amp.get_sampling_frequency(), 100)
+
+    def test_data_and_markers(self):
+        """Blocks arrive unchanged and in order."""
+        data = np.arange(40, dtype=np.float32).reshape(-1, 2)
+        self.server.write(data[:5], [[10., 'foo']], 0)
+        self.server.write(data[5:], [], 0)
+        self.server.write(data[:0], [[1., 'bar']], 0)
+        received, marker = self.amp.get_data()
+        np.testing.assert_array_equal(received, data[:5])
+        self.assertEqual(marker, [[10., 'foo']])
+        received, marker = self.amp.get_data()
+        np.testing.assert_array_equal(received, data[5:])
+        self.assertEqual(marker, [])
+        received, marker = self.amp.get_data()
+        self.assertEqual(received.shape, (0, 2))
+        self.assertEqual(marker, [[1., 'bar']])
+
+
+    def test_data_is_copied(self):
+        """Changing a block after writing it does not change the sent data."""
+        data = np.zeros((5, 2), dtype=np.float32)
+        self.server.write(data, [], 0)
+        data[:] = 1
+        received, marker = self.amp.get_data()
+        self.assertTrue((received == 0).all())
+
+    def test_dropped_blocks(self):
+        """Blocks the server dropped are detected by the client."""
+        self.amp.stop()
+        self.connect(counter=True)
+        while len(self.server.get_stats()) < 2:
+            time.sleep(.01)
+        self.assertEqual(self.amp.get_channels(), ['Ch_0', 'Ch_1', 'Counter'])
+        self.assertEqual(self.amp.get_counter(), (2, 2**24))
+        data = np.arange(30, dtype=np.float32).reshape(-1, 2)
+        self.server.write(data[:5], [], 0)
+        # a block that never reaches the client
+        with self.server.lock:
+            subscribers, self.server.subscribers = self.server.subscribers, []
+        self.server.write(data[5:10], [], 0)
+        with self.server.lock:
+            self.server.subscribers = subscribers
+        self.server.write(data[10:], [], 0)
+        first, _ = self.amp.get_data()
+        second, _ = self.amp.get_data()
+        np.testing.assert_array_equal(first[:, 2], np.arange(5))
+        np.testing.assert_array_equal(second[:, 2], np.arange(10, 15))
+        self.assertEqual(self.amp.lost_samples, 5)
+
+    def test_restart(self):
+        """The client reconnects when it is started again."""
+        self.amp.stop()
+        self.amp.start()
+        while len(self.server.get_stats()) < 2:
+            time.sleep(.01)
+        self.server.write(np.ones((5, 2)), [], 0)
+        received, marker = self.amp.get_data()
+        self.assertEqual(received.shape, (5, 2))
+
+    def test_stalled_client(self):
+        """A client which does not read does not block closing the server."""
+        data = np.zeros((10000, 2), dtype=np.float32)
+        # fill the socket buffers until the send blocks
+        for i in range(200):
+            self.server.write(data, [], 0)
+        time.sleep(.2)
+        t = time.time()
+        self.server.close()
+        self.assertLess(time.time() - t, 2)
+
+
+class TestUnixStreamServer(TestTCPStreamServer):
+
+    def make_server(self):
+        return StreamServer(path=os.path.join(self.tmpdir, 'socket'))
+
+    def connect(self, **kwargs):
+        self.amp.configure(path=self.server.path, **kwargs)
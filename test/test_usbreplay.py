@@ -0,0 +1,123 @@
+from __future__ import division
+
+import binascii
+import os
+from unittest import TestCase
+
+import numpy as np
+
+from libmushu.usbreplay import ReplayError, ReplayHandle, parse, read_dump, replay
+from libmushu.driver import gtec
+
+
+DUMPS = os.path.join(os.path.dirname(__file__), os.pardir, 'usb-dumps')
+INIT = os.path.join(DUMPS, 'open-app-connect-disconnect-clean.mon')
+DATA = os.path.join(DUMPS, 'from-calibration-to-normal-start-stop-clean.mon')
+
+
+def capture_lines(type_, endpoint, payloads):
+    """Create usbmon lines for completed in transfers."""
+    lines = []
+    for i, payload in enumerate(payloads):
+        words = binascii.hexlify(payload).decode('ascii')
+        words = ' '.join(words[j:j+8] for j in range(0, len(words), 8))
+        lines.append('f0000000 %d S %s:1:005:%d -115:1 %d <' % (2 * i, type_, endpoint, len(payload)))
+        lines.append('f0000000 %d C %s:1:005:%d 0:1 %d = %s' % (2 * i + 1, type_, endpoint, len(payload), words))
+    return lines
+
+
+class TestParse(TestCase):
+
+    def test_control(self):
+        """Setup packets and data of control transfers are parsed."""
+        urb, = parse(['f6e2c340 1415324380 S Co:1:010:0 s 40 cb 0000 0000 0007 7 = 03510002 00ff07'])
+        self.assertEqual((urb.event, urb.type, urb.bus, urb.device, urb.endpoint),
+                         ('S', 'Co', 1, 10, 0))
+        self.assertEqual(urb.setup, (0x40, 0xcb, 0, 0, 7))
+        self.assertEqual(urb.data, b'\x03\x51\x00\x02\x00\xff\x07')
+
+    def test_interrupt(self):
+        """Status, length and data of interrupt transfers are parsed."""
+        submit, complete = parse(['f36dbf40 1751792118 S Ii:2:003:6 -115:1 544 <',
+                                  'f36dbf40 1751845117 C Ii:2:003:6 0:1 476 = 6e62cac4 c5d8'])
+        self.assertEqual((submit.status, submit.length, submit.data), (-115, 544, None))
+        self.assertEqual((complete.status, complete.length), (0, 476))
+        self.assertEqual(complete.data, b'\x6e\x62\xca\xc4\xc5\xd8')
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            list(parse(['f36dbf40 1751792118 S']))
+
+    def test_select_device(self):
+        """Only the transfers of the amplifier are read."""
+        urbs = read_dump(os.path.join(DUMPS, 'from-normal-to-calibration-start-stop.mon'))
+        self.assertEqual(set((u.bus, u.device) for u in urbs), set([(1, 10)]))
+
+
+class TestReplayHandle(TestCase):
+
+    def setUp(self):
+        self.handle = ReplayHandle(read_dump(INIT) + read_dump(DATA),
+                                   id_vendor=gtec.ID_VENDOR_GTEC,
+                                   id_product=gtec.ID_PRODUCT_GUSB_AMP)
+
+    def test_gusbamp(self):
+        """The g.USBamp decodes the replayed frames."""
+        with replay(self.handle):
+            amp = gtec.GUSBamp()
+        amp.start()
+        data = [amp.get_data()[0] for i in range(41)]
+        amp.stop()
+        # 40 transfers of 544 bytes
+        self.assertEqual(sum(len(d) for d in data), 40 * 8)
+        first = np.frombuffer(binascii.unhexlify('4f9327c742c323c7'), dtype='<f4')
+        np.testing.assert_allclose(data[0][0, :2], first / 8.15, rtol=1e-6)
+        # the truncated rest of the payload is zero
+        self.assertTrue((data[0][1:] == 0).all())
+        self.assertEqual(len(data[-1]), 0)
+        self.assertEqual(self.handle.control[-1][0][:2], (0x40, 0xb8))
+
+    def test_loop(self):
+        self.handle.loop = True
+        for i in range(100):
+            self.assertEqual(len(self.handle.bulkRead(0x86, 2028)), 544)
+
+    def test_unknown_request(self):
+        """Requests the device never received are rejected."""
+        with self.assertRaises(ReplayError):
+            self.handle.controlMsg(gtec.CX_OUT, 0x42, buffer=0)
+
+    def test_strict(self):
+        """In strict mode the control messages are checked in order."""
+        handle = ReplayHandle(read_dump(DATA), strict=True)
+        handle.controlMsg(gtec.CX_OUT, 0xc0, value=0, buffer=0)
+        handle.controlMsg(gtec.CX_OUT, 0xc2, value=1, buffer=0)
+        with self.assertRaises(ReplayError):
+            handle.controlMsg(gtec.CX_OUT, 0xf7, value=0, buffer=0)
+
+    def test_control_in(self):
+        """Control in transfers return the captured response."""
+        response = self.handle.controlMsg(0x80, 0x06, buffer=18, value=0x0100)
+        self.assertEqual(bytearray(response)[:4], bytearray(b'\x12\x01\x00\x02'))
+
+    def test_device_descriptor(self):
+        """The USB ids are taken from the device descriptor."""
+        handle = ReplayHandle(read_dump(INIT))
+        self.assertEqual((handle.id_vendor, handle.id_product),
+                         (gtec.ID_VENDOR_GTEC, gtec.ID_PRODUCT_GUSB_AMP))
+
+    def test_epoc(self):
+        """The Epoc decrypts and decodes the replayed packets."""
+        from libmushu.driver.emotiv import Epoc, VENDOR_ID, PRODUCT_ID
+        handle = ReplayHandle([], id_vendor=VENDOR_ID, id_product=PRODUCT_ID,
+                              serial='SN201211150000GM')
+        with replay(handle):
+            amp = Epoc()
+        packets = np.zeros((10, 32), dtype=np.uint8)
+        packets[:, 0] = np.arange(10)
+        encrypted = [amp.cipher.encrypt(p.tostring()) for p in packets]
+        handle = ReplayHandle(list(parse(capture_lines('Ii', 2, encrypted))),
+                              id_vendor=VENDOR_ID, id_product=PRODUCT_ID)
+        amp.dev = handle
+        data, marker = amp.get_data()
+        self.assertEqual(list(data[:, 0]), list(range(10)))